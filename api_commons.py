@@ -34,11 +34,13 @@ ERROR_INVALID_WEBHOOK_URL = "INVALID_WEBHOOK_URL"
 ERROR_INVALID_WEBHOOK_HEADERS = "INVALID_WEBHOOK_HEADERS"
 ERROR_INVALID_CLIENT_META = "INVALID_CLIENT_META"
 ERROR_INVALID_OPERATION = "INVALID_OPERATION"
+ERROR_INVALID_PARAMETER = "INVALID_PARAMETER"
 
 # Task errors
 ERROR_TASK_NOT_FOUND = "TASK_NOT_FOUND"
 ERROR_TASK_DELETE_FAILED = "TASK_DELETE_FAILED"
 ERROR_TASK_IN_PROGRESS = "TASK_IN_PROGRESS"
+ERROR_QUEUE_FULL = "QUEUE_FULL"
 ERROR_FILE_NOT_FOUND = "FILE_NOT_FOUND"
 ERROR_INVALID_PATH = "INVALID_PATH"
 
@@ -52,6 +54,7 @@ ERROR_NETWORK_ERROR = "NETWORK_ERROR"
 ERROR_EXTRACTION_FAILED = "EXTRACTION_FAILED"
 ERROR_DOWNLOAD_FAILED = "DOWNLOAD_FAILED"
 ERROR_FORMAT_NOT_AVAILABLE = "FORMAT_NOT_AVAILABLE"
+ERROR_FILE_TOO_LARGE = "FILE_TOO_LARGE"
 
 # Processing errors (video-processor-api specific)
 ERROR_VIDEO_DOWNLOAD_FAILED = "VIDEO_DOWNLOAD_FAILED"
@@ -332,10 +335,12 @@ __all__ = [
     "ERROR_INVALID_WEBHOOK_HEADERS",
     "ERROR_INVALID_CLIENT_META",
     "ERROR_INVALID_OPERATION",
+    "ERROR_INVALID_PARAMETER",
     # Error codes - Tasks
     "ERROR_TASK_NOT_FOUND",
     "ERROR_TASK_DELETE_FAILED",
     "ERROR_TASK_IN_PROGRESS",
+    "ERROR_QUEUE_FULL",
     "ERROR_FILE_NOT_FOUND",
     "ERROR_INVALID_PATH",
     # Error codes - Download (YouTube)
@@ -347,6 +352,7 @@ __all__ = [
     "ERROR_NETWORK_ERROR",
     "ERROR_EXTRACTION_FAILED",
     "ERROR_DOWNLOAD_FAILED",
+    "ERROR_FILE_TOO_LARGE",
     # Error codes - Processing (Video)
     "ERROR_VIDEO_DOWNLOAD_FAILED",
     "ERROR_OPERATION_FAILED",
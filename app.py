@@ -1,17 +1,26 @@
 import os
+import copy
+import math
+import socket
+import hashlib
 import threading
 import json
 import logging
 import redis
 import uuid
 import time
+import mimetypes
+import unicodedata
+from contextlib import contextmanager
 from functools import wraps
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import Any
+from urllib.parse import quote
 
-import requests
 import yt_dlp
-from flask import Flask, Blueprint, request, jsonify, send_file
+from flask import Flask, Blueprint, Response, request, jsonify
+from werkzeug.datastructures import ContentRange
+from werkzeug.wsgi import wrap_file
 
 from api_commons import (
     ERROR_MISSING_AUTH_TOKEN,
@@ -21,14 +30,73 @@ from api_commons import (
     ERROR_INVALID_WEBHOOK_URL,
     ERROR_INVALID_WEBHOOK_HEADERS,
     ERROR_INVALID_CLIENT_META,
+    ERROR_INVALID_PARAMETER,
     ERROR_TASK_NOT_FOUND,
+    ERROR_QUEUE_FULL,
     ERROR_FILE_NOT_FOUND,
     ERROR_INVALID_PATH,
+    ERROR_FILE_TOO_LARGE,
+    ERROR_FORMAT_NOT_AVAILABLE,
+    ERROR_DOWNLOAD_FAILED,
+    ERROR_FFMPEG_ERROR,
     ERROR_UNKNOWN,
     create_simple_error,
     create_task_error,
     map_youtube_error_type_to_code,
 )
+from result_store import (
+    claim_leader,
+    dedup_key,
+    find_blob,
+    finish_leader,
+    join_leader,
+    link_blob,
+    store_blob,
+    video_id_from_url,
+)
+from info_cache import get_info, invalidate, put_info
+from media_stream import MediaStream, StreamError, stream_plan
+from partial_downloads import DOWNLOAD_MARKER, discard_partials, is_partial
+from task_sync import publish_task_event
+from task_index import index_task, list_task_ids, normalize_tag, unindex_task
+from webhook_delivery import WebhookDispatcher, enqueue_webhook, webhook_stats
+from transfer_limits import (
+    BANDWIDTH_PRIORITY_WEIGHTS,
+    DOWNLOAD_CONNECTION_BUDGET,
+    acquire_connections,
+    bandwidth_usage,
+    connections_in_use,
+    release_bandwidth,
+    release_connections,
+    update_bandwidth_share,
+)
+from task_queue import (
+    QUEUE_POLICY,
+    REDIS_ACTIVE_TASKS_KEY,
+    TASK_HEARTBEAT_INTERVAL_SECONDS,
+    claim_task,
+    enqueue_task,
+    finished_per_second,
+    holds_lease,
+    queue_length,
+    queue_position,
+    queue_positions,
+    queue_wait_stats,
+    record_finished,
+    record_queue_wait,
+    release_task,
+    renew_lease,
+    set_worker_capacity,
+    total_capacity,
+    touch_worker,
+)
+from concurrency import (
+    ADAPTIVE_CONCURRENCY,
+    DOWNLOAD_SLOTS_MAX,
+    DOWNLOAD_SLOTS_MIN,
+    AimdController,
+    SlotPool,
+)
 
 # ---------------------------------------------------------------------------
 # Logging
@@ -44,12 +112,48 @@ log = logging.getLogger(__name__)
 # Constants (fixed for public version)
 # ---------------------------------------------------------------------------
 TASK_TTL_MINUTES = 1440                # 24 h — not configurable
-MAX_CONCURRENT_TASKS = 2              # fixed limit
+# Initial download slots of the embedded consumer; with ADAPTIVE_CONCURRENCY
+# the controller moves them between DOWNLOAD_SLOTS_MIN and DOWNLOAD_SLOTS_MAX
+MAX_CONCURRENT_TASKS = int(os.getenv("MAX_CONCURRENT_TASKS", "2"))
+# Admission control: submissions beyond this many pending tasks get 429 + Retry-After
+MAX_QUEUED_TASKS = int(os.getenv("MAX_QUEUED_TASKS", "50"))
+MAX_BATCH_ITEMS = int(os.getenv("MAX_BATCH_ITEMS", "1000"))  # per /download_videos request
+MAX_STATUS_QUERY_IDS = int(os.getenv("MAX_STATUS_QUERY_IDS", "5000"))  # per POST /task_status request
+TASK_LIST_DEFAULT_LIMIT = 50
+TASK_LIST_MAX_LIMIT = 500
+THROUGHPUT_WINDOW_SECONDS = 900       # rolling window for finished tasks/second
+DEFAULT_TASK_SECONDS = 120            # assumed task duration until the window has data
+RETRY_AFTER_MAX_SECONDS = 600
+# embedded: this process runs the queue consumer (default, single-process setups)
+# external: downloads run in download_worker.py; this process only serves HTTP
+# worker:   set by download_worker.py for its pool processes
+DOWNLOAD_WORKER_MODE = os.getenv("DOWNLOAD_WORKER_MODE", "embedded").lower()
 MAX_DOWNLOAD_VIDEO_SIZE_MB = int(os.getenv("MAX_DOWNLOAD_VIDEO_SIZE_MB", "2048"))
 API_KEY = os.getenv("API_KEY", "")
 TASKS_DIR = os.getenv("TASKS_DIR", "/app/tasks")  # must match orchestrator
+# yt-dlp cache (player JS, signature/nsig solutions) shared by all processes
+# and kept across restarts on the tasks volume; must match orchestrator
+YTDLP_CACHE_DIR = os.getenv("YTDLP_CACHE_DIR", os.path.join(TASKS_DIR, ".cache", "yt-dlp"))
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 SERVER_BASE_URL = os.getenv("SERVER_BASE_URL", "http://localhost:5000")
+# File delivery offload to a fronting proxy: "" (serve directly), "x-accel" (nginx), "x-sendfile"
+FILE_OFFLOAD_MODE = os.getenv("FILE_OFFLOAD_MODE", "").lower()
+X_ACCEL_PREFIX = os.getenv("X_ACCEL_PREFIX", "/protected-tasks").rstrip("/")
+FILE_CHUNK_SIZE = 256 * 1024
+# Progressive /download of a running task ends when no bytes arrive for this long
+PROGRESSIVE_IDLE_TIMEOUT_SECONDS = int(os.getenv("PROGRESSIVE_IDLE_TIMEOUT_SECONDS", "120"))
+PROGRESSIVE_POLL_SECONDS = 0.5
+PROGRESS_UPDATE_INTERVAL_SECONDS = float(os.getenv("PROGRESS_UPDATE_INTERVAL_SECONDS", "1"))
+LONG_POLL_TIMEOUT_SECONDS = 30
+LONG_POLL_MAX_SECONDS = 120
+SSE_KEEPALIVE_SECONDS = 15
+SSE_MAX_DURATION_SECONDS = int(os.getenv("SSE_MAX_DURATION_SECONDS", "1800"))  # client reconnects after
+# Parallel fragment fetches per DASH/HLS download (capped by DOWNLOAD_CONNECTION_BUDGET)
+CONCURRENT_FRAGMENT_DOWNLOADS = int(os.getenv("CONCURRENT_FRAGMENT_DOWNLOADS", "4"))
+MAX_CONCURRENT_FRAGMENTS = int(os.getenv("MAX_CONCURRENT_FRAGMENTS", "16"))  # per-request ceiling
+# Ranged requests of this size for single-file formats; 0 keeps yt-dlp's per-format default
+HTTP_CHUNK_SIZE_MB = int(os.getenv("HTTP_CHUNK_SIZE_MB", "0"))
+MAX_HTTP_CHUNK_SIZE_MB = 256
 
 SUPPORTED_PLATFORMS: dict[str, str] = {
     "youtube.com": "YouTube",
@@ -61,6 +165,7 @@ SUPPORTED_PLATFORMS: dict[str, str] = {
 }
 
 os.makedirs(TASKS_DIR, exist_ok=True)
+os.makedirs(YTDLP_CACHE_DIR, exist_ok=True)
 
 # ---------------------------------------------------------------------------
 # Redis client
@@ -72,8 +177,13 @@ redis_client: redis.Redis = redis.from_url(REDIS_URL, decode_responses=True)
 # ---------------------------------------------------------------------------
 active_task_count = 0
 active_task_count_lock = threading.Lock()
+# Task ids this process holds a lease for (renewed by the heartbeat loop)
+leased_tasks: set[str] = set()
+# Leased tasks whose lease renewal failed: their downloads abort at the next hook
+lost_leases: set[str] = set()
 
-WORKER_ID = f"worker-{os.getpid()}"
+# Hostname keeps ids unique when several containers share one Redis
+WORKER_ID = f"worker-{socket.gethostname()}-{os.getpid()}"
 
 # ---------------------------------------------------------------------------
 # Flask app & Blueprint
@@ -92,9 +202,9 @@ def require_api_key(f):
         if API_KEY:
             token = request.headers.get("Authorization", "")
             if not token:
-                return jsonify(create_simple_error(ERROR_MISSING_AUTH_TOKEN)), 401
+                return jsonify(create_simple_error("Missing Authorization header", ERROR_MISSING_AUTH_TOKEN)), 401
             if token.replace("Bearer ", "") != API_KEY:
-                return jsonify(create_simple_error(ERROR_INVALID_API_KEY)), 403
+                return jsonify(create_simple_error("Invalid API key", ERROR_INVALID_API_KEY)), 403
         return f(*args, **kwargs)
     return decorated
 
@@ -116,14 +226,19 @@ def _meta_path(task_id: str) -> str:
     return os.path.join(_task_dir(task_id), "metadata.json")
 
 
-def _save_task(task: dict) -> None:
-    task_id = task["task_id"]
-    os.makedirs(_task_dir(task_id), exist_ok=True)
-    path = _meta_path(task_id)
+def _write_task_file(task: dict) -> None:
+    os.makedirs(_task_dir(task["task_id"]), exist_ok=True)
+    path = _meta_path(task["task_id"])
     tmp = path + ".tmp"
     with open(tmp, "w") as f:
         json.dump(task, f, ensure_ascii=False, indent=2)
     os.replace(tmp, path)
+
+
+def _save_task(task: dict) -> None:
+    task_id = task["task_id"]
+    task["version"] = task.get("version", 0) + 1
+    _write_task_file(task)
     # Sync to Redis (non-critical)
     try:
         redis_client.setex(
@@ -133,9 +248,11 @@ def _save_task(task: dict) -> None:
         )
     except Exception:
         pass
+    index_task(redis_client, task)
+    publish_task_event(redis_client, task_id, "status", {"status": task["status"], "version": task["version"]})
 
 
-def _load_task(task_id: str) -> dict | None:
+def _read_task_file(task_id: str) -> dict | None:
     path = _meta_path(task_id)
     if os.path.exists(path):
         try:
@@ -143,6 +260,26 @@ def _load_task(task_id: str) -> dict | None:
                 return json.load(f)
         except Exception:
             pass
+    return None
+
+
+def _load_task(task_id: str, prefer_cache: bool = False) -> dict | None:
+    """
+    Load a task from disk (source of truth) with Redis as fallback.
+
+    Read-only callers (status endpoints) pass prefer_cache=True to try Redis
+    first; _save_task keeps it in sync, so this skips a disk read per poll.
+    """
+    if prefer_cache:
+        try:
+            raw = redis_client.get(f"task:{task_id}")
+            if raw:
+                return json.loads(raw)
+        except Exception:
+            pass
+    task = _read_task_file(task_id)
+    if task is not None or prefer_cache:
+        return task
     # Fallback: Redis
     try:
         raw = redis_client.get(f"task:{task_id}")
@@ -163,36 +300,9 @@ def _update_task(task_id: str, updates: dict) -> dict | None:
 
 
 def _send_webhook(task: dict) -> None:
-    webhook_url = task.get("webhook_url")
-    if not webhook_url:
-        return
-    headers = {"Content-Type": "application/json"}
-    if task.get("webhook_headers"):
-        headers.update(task["webhook_headers"])
-    payload = {
-        "task_id": task["task_id"],
-        "status": task["status"],
-        "client_meta": task.get("client_meta"),
-    }
-    if task["status"] == "completed":
-        payload["result"] = task.get("result")
-    elif task["status"] == "failed":
-        payload["error"] = task.get("error")
-
-    def _try_send():
-        for attempt in range(1, 4):
-            try:
-                resp = requests.post(webhook_url, json=payload, headers=headers, timeout=10)
-                if resp.status_code < 400:
-                    log.info(f"[{task['task_id'][:8]}] Webhook delivered (attempt {attempt})")
-                    return
-                log.warning(f"[{task['task_id'][:8]}] Webhook HTTP {resp.status_code} (attempt {attempt})")
-            except Exception as exc:
-                log.warning(f"[{task['task_id'][:8]}] Webhook error (attempt {attempt}): {exc}")
-            time.sleep(2 ** attempt)
-        log.error(f"[{task['task_id'][:8]}] Webhook failed after 3 attempts")
-
-    threading.Thread(target=_try_send, daemon=True).start()
+    # Delivered by the webhook dispatcher (orchestrator, or this process in
+    # embedded mode), see webhook_delivery.py
+    enqueue_webhook(redis_client, task, tasks_dir=TASKS_DIR)
 
 
 # ---------------------------------------------------------------------------
@@ -218,122 +328,726 @@ def _wait_for_redis(timeout: int = 30) -> None:
 def _heartbeat_loop() -> None:
     while True:
         try:
-            redis_client.setex(f"heartbeat:{WORKER_ID}", 120, int(time.time()))
+            touch_worker(redis_client, WORKER_ID)
         except Exception:
             pass
-        time.sleep(30)
-
+        with active_task_count_lock:
+            held = list(leased_tasks)
+        for task_id in held:
+            if renew_lease(redis_client, task_id, WORKER_ID) is False:
+                log.warning(f"[{task_id[:8]}] Lease lost — aborting, the task is re-run by another worker")
+                with active_task_count_lock:
+                    lost_leases.add(task_id)
+        time.sleep(TASK_HEARTBEAT_INTERVAL_SECONDS)
 
-threading.Thread(target=_heartbeat_loop, daemon=True, name="heartbeat").start()
 
 
 # ---------------------------------------------------------------------------
 # Queue consumer
 # ---------------------------------------------------------------------------
+QUEUE_BLOCK_TIMEOUT_SECONDS = 5       # max BLPOP wait before re-checking stop flag
+
 _queue_stop = threading.Event()
+# One permit per download slot; released by _background_download when it finishes
+_slot_pool = SlotPool(MAX_CONCURRENT_TASKS)
+_concurrency: AimdController | None = None
 
 
 def _queue_loader_loop() -> None:
+    global active_task_count
     log.info("Queue consumer started")
     while not _queue_stop.is_set():
+        # Block until a slot frees up instead of polling the counter
+        if not _slot_pool.acquire(timeout=QUEUE_BLOCK_TIMEOUT_SECONDS):
+            continue
+        dispatched = False
         try:
-            global active_task_count
-            with active_task_count_lock:
-                slots = MAX_CONCURRENT_TASKS - active_task_count
-            if slots <= 0:
-                time.sleep(0.5)
+            # Block on Redis until a task arrives (no idle round-trips);
+            # the task moves atomically into our processing list under a lease
+            task_id = claim_task(redis_client, WORKER_ID, QUEUE_BLOCK_TIMEOUT_SECONDS)
+            if not task_id:
                 continue
-
-            item = redis_client.lpop("queue:queued")
-            if not item:
-                time.sleep(0.5)
+            if _queue_stop.is_set():
+                # Shutdown began while we were blocked — hand the task straight back
+                release_task(redis_client, task_id, WORKER_ID)
+                enqueue_task(redis_client, task_id, front=True)
                 continue
 
-            task_id = item.strip()
             task = _load_task(task_id)
             if task is None:
                 log.warning(f"Queued task {task_id[:8]} not found, skipping")
+                release_task(redis_client, task_id, WORKER_ID)
                 continue
             if task.get("status") != "queued":
                 log.debug(f"Task {task_id[:8]} already {task.get('status')}, skipping")
+                release_task(redis_client, task_id, WORKER_ID)
                 continue
 
-            _update_task(task_id, {"status": "processing", "started_at": datetime.utcnow().isoformat()})
             with active_task_count_lock:
                 active_task_count += 1
+                leased_tasks.add(task_id)
+            started = datetime.utcnow()
+            _update_task(task_id, {"status": "processing", "started_at": started.isoformat()})
+            if not task.get("retry_count") and task.get("created_at"):
+                try:
+                    waited = (started - datetime.fromisoformat(task["created_at"])).total_seconds()
+                    record_queue_wait(redis_client, task.get("queue_policy") or "fifo", waited)
+                except ValueError:
+                    pass
             threading.Thread(
                 target=_background_download,
                 args=(task_id,),
                 daemon=True,
                 name=f"dl-{task_id[:8]}",
             ).start()
+            dispatched = True
         except Exception as exc:
             log.error(f"Queue loop error: {exc}", exc_info=True)
             time.sleep(1)
+        finally:
+            if not dispatched:
+                _slot_pool.release()
+
+
+def _publish_capacity(slots: int) -> None:
+    set_worker_capacity(redis_client, WORKER_ID, slots)
+
+
+def start_download_consumer(slots: int = MAX_CONCURRENT_TASKS) -> None:
+    """
+    Start the heartbeat and queue consumer threads with `slots` concurrent
+    downloads (the starting point when ADAPTIVE_CONCURRENCY is on).
+    """
+    global _concurrency
+    _slot_pool.resize(slots)
+    _publish_capacity(slots)
+    threading.Thread(target=_heartbeat_loop, daemon=True, name="heartbeat").start()
+    threading.Thread(target=_queue_loader_loop, daemon=True, name="queue-consumer").start()
+    if ADAPTIVE_CONCURRENCY:
+        _concurrency = AimdController(
+            _slot_pool, TASKS_DIR,
+            backlog=lambda: queue_length(redis_client),
+            on_resize=_publish_capacity,
+            floor=min(DOWNLOAD_SLOTS_MIN, slots),
+            ceiling=max(DOWNLOAD_SLOTS_MAX, slots),
+        )
+        threading.Thread(target=_concurrency.run, args=(_queue_stop,), daemon=True, name="concurrency").start()
 
 
-threading.Thread(target=_queue_loader_loop, daemon=True, name="queue-consumer").start()
+def stop_download_consumer(timeout: float) -> None:
+    """
+    Stop taking new tasks and wait up to `timeout` seconds for running downloads.
+
+    Downloads still running after that are handed back to the head of the
+    queue so another worker picks them up without waiting for lease expiry.
+    """
+    _queue_stop.set()
+    set_worker_capacity(redis_client, WORKER_ID, None)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        with active_task_count_lock:
+            if not leased_tasks:
+                return
+        time.sleep(0.5)
+
+    with active_task_count_lock:
+        remaining = list(leased_tasks)
+        leased_tasks.clear()
+        # Still-running downloads must not write results for handed-back tasks
+        lost_leases.update(remaining)
+    for task_id in remaining:
+        try:
+            _update_task(task_id, {"status": "queued", "started_at": None})
+            release_task(redis_client, task_id, WORKER_ID)
+            enqueue_task(redis_client, task_id, front=True)
+            log.info(f"[{task_id[:8]}] Handed back to queue on shutdown")
+        except Exception as exc:
+            log.error(f"[{task_id[:8]}] Hand-back failed, lease expiry will recover it: {exc}")
 
 
 # ---------------------------------------------------------------------------
 # Download worker
 # ---------------------------------------------------------------------------
 
-def _build_ydl_opts(task_id: str, format_str: str | None, max_mb: float) -> dict:
-    task_dir = _task_dir(task_id)
-    os.makedirs(task_dir, exist_ok=True)
+def _base_ydl_opts() -> dict:
     opts: dict[str, Any] = {
-        "outtmpl": os.path.join(task_dir, "%(title)s.%(ext)s"),
         "noplaylist": True,
         "quiet": True,
         "no_warnings": True,
         "noprogress": True,
+        # Entries are written to a temp file and renamed, so concurrent
+        # writers from several processes never leave a torn file
+        "cachedir": YTDLP_CACHE_DIR,
     }
-    if format_str:
-        opts["format"] = format_str
-    else:
-        opts["format"] = f"bestvideo[filesize<={max_mb}M]+bestaudio/best[filesize<={max_mb}M]/best"
-
     try:
         from yt_dlp_plugins.extractor.getpot_bgutil import GetPotBgUtilIE  # noqa: F401
         opts["extractor_args"] = {"youtube": {"pot_provider": "bgutil"}}
-        log.debug(f"[{task_id[:8]}] bgutil enabled")
     except ImportError:
         pass
+    return opts
+
+
+def _format_selector(format_str: str | None) -> str:
+    if format_str:
+        return format_str
+    # The size limit is enforced by the pre-flight probe: a [filesize<=] filter would
+    # silently skip formats YouTube lists without an exact filesize
+    return "bestvideo+bestaudio/best"
+
 
+def _build_ydl_opts(task_id: str, format_str: str | None, max_mb: float,
+                    chunk_size_mb: int | None = None) -> dict:
+    task_dir = _task_dir(task_id)
+    os.makedirs(task_dir, exist_ok=True)
+    opts = _base_ydl_opts()
+    opts["outtmpl"] = os.path.join(task_dir, "%(title)s.%(ext)s")
+    opts["format"] = _format_selector(format_str)
+    chunk_size_mb = chunk_size_mb or HTTP_CHUNK_SIZE_MB
+    if chunk_size_mb:
+        opts["http_chunk_size"] = chunk_size_mb * 1024 * 1024
+    # Resume .part files / fragment state kept by crash recovery
+    opts["continuedl"] = True
+    # Safety net for formats the probe could not size (aborts on Content-Length)
+    opts["max_filesize"] = int(max_mb * 1024 * 1024)
+    if "extractor_args" in opts:
+        log.debug(f"[{task_id[:8]}] bgutil enabled")
     return opts
 
 
+# ---------------------------------------------------------------------------
+# Pre-flight probe: size estimate before any media bytes are downloaded
+# ---------------------------------------------------------------------------
+# Height caps tried, in order, when the default format is over the size limit
+SIZE_DOWNGRADE_HEIGHTS = (1080, 720, 480, 360, 240, 144)
+
+
+class FileTooLargeError(Exception):
+    """The selected formats are estimated to exceed the task's size limit."""
+
+
+class LeaseLostError(Exception):
+    """This worker no longer holds the task's lease; another worker runs it."""
+
+
+def _raise_if_lease_lost(task_id: str, fence: bool = False) -> None:
+    """
+    Abort a download whose lease was lost (checked from yt-dlp hooks).
+
+    With fence, Redis is asked as well: used right before a task's final
+    metadata write, webhook and dedup resolution.
+    """
+    with active_task_count_lock:
+        lost = task_id in lost_leases
+    if lost or (fence and not holds_lease(redis_client, task_id, WORKER_ID)):
+        raise LeaseLostError(f"Lease on task {task_id} lost")
+
+
+def _lease_was_lost(task_id: str) -> bool:
+    """True if a failure should not be recorded because another worker owns the task now."""
+    try:
+        _raise_if_lease_lost(task_id, fence=True)
+    except LeaseLostError:
+        log.warning(f"[{task_id[:8]}] Download abandoned: lease lost, results left to the new owner")
+        return True
+    return False
+
+
+def _estimate_format_size(fmt: dict, duration) -> tuple[int | None, bool]:
+    """
+    Expected download size of a selected format (sum of its parts when merged).
+
+    Uses filesize, then filesize_approx, then bitrate x duration.
+
+    Returns:
+        tuple: (bytes or None if unknown, True if every part had an exact filesize)
+    """
+    total = 0
+    exact = True
+    for part in fmt.get("requested_formats") or [fmt]:
+        if part.get("filesize"):
+            total += part["filesize"]
+            continue
+        exact = False
+        if part.get("filesize_approx"):
+            total += part["filesize_approx"]
+            continue
+        # tbr/vbr/abr are in KBit/s
+        bitrate = part.get("tbr") or ((part.get("vbr") or 0) + (part.get("abr") or 0))
+        if not bitrate or not duration:
+            return None, False
+        total += int(bitrate * 1000 / 8 * duration)
+    return total, exact
+
+
+def _probe_selection(ydl, info: dict, format_spec: str) -> dict:
+    """
+    Resolve format_spec against extracted info without downloading.
+
+    Returns:
+        dict: Processed info of the selected format (merged formats carry
+        requested_formats)
+    """
+    ydl.format_selector = ydl.build_format_selector(format_spec)
+    return ydl.process_ie_result(copy.deepcopy(info), download=False)
+
+
+def _preflight_probe(task_id: str, ydl, info: dict, format_str: str | None, max_mb: float) -> dict:
+    """
+    Pick the formats to download and check them against the size limit.
+
+    A user-supplied format is rejected when over the limit; the default format
+    is downgraded through SIZE_DOWNGRADE_HEIGHTS first. A format whose size
+    cannot be estimated is let through (max_filesize still applies).
+
+    Raises:
+        FileTooLargeError: No acceptable format fits into max_mb
+
+    Returns:
+        dict: {"format_id", "protocol", "estimated_size_bytes", "size_estimate_exact",
+        "downgraded_to_height"}
+    """
+    limit = int(max_mb * 1024 * 1024)
+    duration = info.get("duration")
+    candidates = [(_format_selector(format_str), None)]
+    if not format_str:
+        candidates += [
+            (f"bestvideo[height<={h}]+bestaudio/best[height<={h}]", h)
+            for h in SIZE_DOWNGRADE_HEIGHTS
+        ]
+
+    smallest = None
+    for spec, height in candidates:
+        try:
+            selected = _probe_selection(ydl, info, spec)
+        except (yt_dlp.utils.DownloadError, yt_dlp.utils.ExtractorError):
+            if height is None:
+                raise  # requested format is not available at all
+            continue
+        size, exact = _estimate_format_size(selected, duration)
+        if size is not None and size > limit:
+            if smallest is None or size < smallest:
+                smallest = size
+            continue
+        if height is not None:
+            log.info(f"[{task_id[:8]}] Downgraded to <= {height}p to fit {max_mb} MB")
+        return {
+            "format_id": selected.get("format_id"),
+            "protocol": selected.get("protocol"),
+            "estimated_size_bytes": size,
+            "size_estimate_exact": exact,
+            "downgraded_to_height": height,
+        }
+
+    raise FileTooLargeError(
+        f"Estimated size {smallest / 1024 / 1024:.0f} MB exceeds the limit of {max_mb} MB"
+    )
+
+
+# ---------------------------------------------------------------------------
+# Download progress
+# ---------------------------------------------------------------------------
+REDIS_PROGRESS_PREFIX = "progress:"
+PROGRESS_TTL_SECONDS = 3600
+_PROGRESS_INT_FIELDS = ("downloaded_bytes", "total_bytes", "fragment_index", "fragment_count")
+_PROGRESS_FLOAT_FIELDS = ("speed", "eta", "updated_at")
+
+
+class _ProgressReporter:
+    """
+    Collects yt-dlp progress/postprocessor hook events for one task and writes
+    them to the progress:<task_id> hash at most once per
+    PROGRESS_UPDATE_INTERVAL_SECONDS (phase changes are written immediately).
+
+    Phases: extract → probe → download_video / download_audio / download → merge / postprocess
+    """
+
+    def __init__(self, task_id: str):
+        self.task_id = task_id
+        self.key = f"{REDIS_PROGRESS_PREFIX}{task_id}"
+        self.phase: str | None = None
+        self._last_write = 0.0
+
+    def set_phase(self, phase: str) -> None:
+        if phase != self.phase:
+            self.phase = phase
+            self._write({}, force=True)
+
+    def download_hook(self, d: dict) -> None:
+        info = d.get("info_dict") or {}
+        vcodec, acodec = info.get("vcodec"), info.get("acodec")
+        if vcodec == "none":
+            phase = "download_audio"
+        elif acodec == "none":
+            phase = "download_video"
+        else:
+            phase = "download"
+        force = phase != self.phase or d.get("status") == "finished"
+        self.phase = phase
+        self._write({
+            "downloaded_bytes": d.get("downloaded_bytes"),
+            "total_bytes": d.get("total_bytes") or d.get("total_bytes_estimate"),
+            "speed": d.get("speed"),
+            "eta": d.get("eta"),
+            "fragment_index": d.get("fragment_index"),
+            "fragment_count": d.get("fragment_count"),
+        }, force=force)
+
+    def postprocessor_hook(self, d: dict) -> None:
+        if d.get("status") == "started":
+            self.set_phase("merge" if d.get("postprocessor") == "Merger" else "postprocess")
+
+    def _write(self, fields: dict, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self._last_write < PROGRESS_UPDATE_INTERVAL_SECONDS:
+            return
+        self._last_write = now
+        mapping = {k: v for k, v in fields.items() if v is not None}
+        mapping.update({"phase": self.phase or "", "worker_id": WORKER_ID, "updated_at": time.time()})
+        try:
+            pipe = redis_client.pipeline()
+            pipe.hset(self.key, mapping=mapping)
+            pipe.expire(self.key, PROGRESS_TTL_SECONDS)
+            pipe.execute()
+        except Exception:
+            pass
+        publish_task_event(redis_client, self.task_id, "progress", mapping)
+
+
+BANDWIDTH_REBALANCE_SECONDS = 2
+
+
+class _BandwidthGovernor:
+    """
+    Keeps one download's yt-dlp rate limit at its share of the node bandwidth
+    (see transfer_limits.update_bandwidth_share).
+
+    yt-dlp reads params["ratelimit"] for every block and copies params for
+    every fragment, so a changed rate applies within one block/fragment. With
+    parallel fragments each connection gets rate / connections.
+    """
+
+    def __init__(self, task_id: str, priority: str):
+        self.task_id = task_id
+        self.weight = BANDWIDTH_PRIORITY_WEIGHTS.get(priority, BANDWIDTH_PRIORITY_WEIGHTS["normal"])
+        self.ydl = None
+        self.connections = 1
+        self.rate: int | None = None
+        self._last_update = 0.0
+
+    def attach(self, ydl, connections: int) -> None:
+        self.ydl = ydl
+        self.connections = max(1, connections)
+        self._rebalance(None)
+
+    def download_hook(self, d: dict) -> None:
+        if self.ydl is None or d.get("status") != "downloading":
+            return
+        if time.monotonic() - self._last_update >= BANDWIDTH_REBALANCE_SECONDS:
+            self._rebalance(d.get("speed"))
+
+    def _rebalance(self, speed) -> None:
+        self._last_update = time.monotonic()
+        rate = update_bandwidth_share(redis_client, self.task_id, self.weight, speed, self.rate)
+        self.rate = rate
+        self.ydl.params["ratelimit"] = max(1, rate // self.connections) if rate else None
+
+
+def _load_progress(task_id: str) -> dict | None:
+    try:
+        raw = redis_client.hgetall(f"{REDIS_PROGRESS_PREFIX}{task_id}")
+    except Exception:
+        return None
+    return _parse_progress(raw)
+
+
+def _parse_progress(raw: dict) -> dict | None:
+    if not raw:
+        return None
+    progress: dict[str, Any] = {}
+    for k, v in raw.items():
+        try:
+            if k in _PROGRESS_INT_FIELDS:
+                v = int(float(v))
+            elif k in _PROGRESS_FLOAT_FIELDS:
+                v = round(float(v), 2)
+        except ValueError:
+            continue
+        progress[k] = v
+    return progress
+
+
+# Warm extractor instances, reused across tasks in this process. The YouTube
+# extractor keeps downloaded player JS and solved signatures in memory, so a
+# reused instance skips that work on the next extraction.
+_warm_ydls: list = []
+_warm_ydls_lock = threading.Lock()
+
+
+@contextmanager
+def _extractor_ydl():
+    with _warm_ydls_lock:
+        ydl = _warm_ydls.pop() if _warm_ydls else None
+    if ydl is None:
+        ydl = yt_dlp.YoutubeDL(_base_ydl_opts())
+    try:
+        yield ydl
+    finally:
+        with _warm_ydls_lock:
+            _warm_ydls.append(ydl)
+
+
+def _client_profile() -> str:
+    """Identity of the extractor configuration, part of the info cache key."""
+    raw = json.dumps({
+        "yt_dlp": yt_dlp.version.__version__,
+        "extractor_args": _base_ydl_opts().get("extractor_args"),
+    }, sort_keys=True)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+
+INFO_CACHE_PROFILE = _client_profile()
+
+
+def _extract_info(url: str, task_id: str = "") -> tuple[dict, bool]:
+    """
+    Unprocessed info dict for a URL, from the info cache when possible.
+
+    Returns:
+        tuple: (info dict the caller may mutate, True if it came from the cache)
+    """
+    video_id = video_id_from_url(url)
+    if video_id:
+        info = get_info(redis_client, video_id, INFO_CACHE_PROFILE)
+        if info is not None:
+            log.info(f"[{task_id[:8]}] Info cache hit: {video_id}")
+            return info, True
+    with _extractor_ydl() as extractor:
+        info = extractor.extract_info(url, download=False, process=False)
+    if info is None:
+        raise RuntimeError("yt-dlp returned no info")
+    if video_id:
+        put_info(redis_client, video_id, INFO_CACHE_PROFILE, info)
+    return info, False
+
+
+def _queue_size_estimate(task: dict):
+    """
+    Estimated download size for shortest-job-first ordering.
+
+    Only uses a cached extraction (no network on the request path); the
+    selection runs on a warm extractor instance.
+
+    Returns:
+        int | None: Bytes, or None if the video was not extracted recently
+    """
+    video_id = video_id_from_url(task["url"])
+    info = get_info(redis_client, video_id, INFO_CACHE_PROFILE) if video_id else None
+    if info is None:
+        return None
+    try:
+        with _extractor_ydl() as ydl:
+            probe = _preflight_probe(task["task_id"], ydl, info, task["format"], task["max_size_mb"])
+        return probe["estimated_size_bytes"]
+    except Exception:
+        # Too large / unavailable formats fail later with a proper error
+        return None
+
+
+# ---------------------------------------------------------------------------
+# Download deduplication (see result_store.py)
+# ---------------------------------------------------------------------------
+# Result fields that describe the video itself and can be shared between tasks
+_SHARED_RESULT_FIELDS = ("title", "duration", "thumbnail", "uploader", "platform")
+
+
+def _complete_from_file(task: dict, src_path: str, shared: dict) -> dict:
+    """Complete a task with a reference to an already downloaded file."""
+    task_id = task["task_id"]
+    filepath = link_blob(src_path, _task_dir(task_id))
+    filename = os.path.basename(filepath)
+    result = {k: shared.get(k) for k in _SHARED_RESULT_FIELDS}
+    result.update({
+        "filename": filename,
+        "download_url": f"{SERVER_BASE_URL}/download/{task_id}/{filename}",
+        "file_size_bytes": os.path.getsize(filepath),
+    })
+    task.update({
+        "status": "completed",
+        "completed_at": datetime.utcnow().isoformat(),
+        "result": result,
+        "deduplicated": True,
+    })
+    _save_task(task)
+    log.info(f"[{task_id[:8]}] Served from result store: {filename}")
+    _send_webhook(task)
+    return task
+
+
+def _dedup_submit(task: dict) -> bool:
+    """
+    Try to satisfy a new task without downloading it again.
+
+    Returns True if the task was completed from the result store or attached
+    to an identical in-flight download; such tasks must not be enqueued.
+    """
+    key = task.get("dedup_key")
+    if not key:
+        return False
+    task_id = task["task_id"]
+    try:
+        for _ in range(3):
+            found = find_blob(TASKS_DIR, key)
+            if found is not None:
+                _complete_from_file(task, *found)
+                return True
+            leader_id = claim_leader(redis_client, key, task_id)
+            if leader_id is None:
+                return False  # we download it; identical submissions join us
+            task["dedup_of"] = leader_id
+            _save_task(task)
+            if join_leader(redis_client, key, leader_id, task_id):
+                log.info(f"[{task_id[:8]}] Joined in-flight download {leader_id[:8]}")
+                return True
+            task.pop("dedup_of", None)
+    except Exception as exc:
+        log.warning(f"[{task_id[:8]}] Dedup lookup failed, downloading normally: {exc}")
+    return False
+
+
+def _finish_dedup_leader(task: dict, src_path: str | None = None, shared: dict | None = None) -> None:
+    """Publish a finished download and resolve the tasks that waited for it."""
+    key = task.get("dedup_key")
+    if not key:
+        return
+    if src_path is not None:
+        store_blob(TASKS_DIR, key, src_path, shared)
+    for follower_id in finish_leader(redis_client, key, task["task_id"]):
+        follower = _load_task(follower_id)
+        if follower is None or follower.get("status") != "queued":
+            continue
+        try:
+            if src_path is not None:
+                _complete_from_file(follower, src_path, shared)
+            else:
+                follower.update({
+                    "status": "failed",
+                    "failed_at": datetime.utcnow().isoformat(),
+                    "error": task.get("error"),
+                })
+                _save_task(follower)
+                _send_webhook(follower)
+        except Exception as exc:
+            log.error(f"[{follower_id[:8]}] Failed to resolve deduplicated task: {exc}")
+
+
+def _abandon_dedup_leaders(tasks: list, exc: Exception) -> None:
+    """
+    Give up dedup leadership of tasks that could not be saved or enqueued.
+
+    Otherwise the leader key would point at a task that never runs, and
+    identical submissions would wait on it until the key expired.
+    """
+    for task in tasks:
+        if not task.get("dedup_key") or task.get("dedup_of"):
+            continue
+        task["error"] = f"Failed to enqueue task: {exc}"
+        try:
+            _finish_dedup_leader(task)
+        except Exception as release_exc:
+            log.error(f"[{task['task_id'][:8]}] Failed to release dedup leadership: {release_exc}")
+
+
 def _background_download(task_id: str) -> None:
     global active_task_count
+    info_cached = False
+    lease_lost = False
     try:
         task = _load_task(task_id)
         if task is None:
             log.error(f"[{task_id[:8]}] Task missing at download start")
             return
 
+        found = find_blob(TASKS_DIR, task["dedup_key"]) if task.get("dedup_key") else None
+        if found is not None:
+            # Downloaded meanwhile (or before a restart) — just reference it
+            task = _complete_from_file(task, *found)
+            _finish_dedup_leader(task, *found)
+            return
+
         url = task["url"]
         format_str = task.get("format")
         max_mb = task.get("max_size_mb", MAX_DOWNLOAD_VIDEO_SIZE_MB)
-        opts = _build_ydl_opts(task_id, format_str, max_mb)
+        opts = _build_ydl_opts(task_id, format_str, max_mb, task.get("http_chunk_size_mb"))
 
         log.info(f"[{task_id[:8]}] Downloading: {url}")
 
+        progress = _ProgressReporter(task_id)
+        governor = _BandwidthGovernor(task_id, task.get("priority") or "normal")
+        opts["progress_hooks"] = [progress.download_hook, governor.download_hook]
+        if _concurrency is not None:
+            opts["progress_hooks"].append(_concurrency.download_hook)
+        opts["postprocessor_hooks"] = [progress.postprocessor_hook]
+        opts["progress_hooks"].append(lambda _d: _raise_if_lease_lost(task_id))
+        opts["postprocessor_hooks"].append(lambda _d: _raise_if_lease_lost(task_id))
+
+        # Extract with a warm instance (or reuse a cached extraction),
+        # download with a per-task one
+        progress.set_phase("extract")
+        info, info_cached = _extract_info(url, task_id)
+
         with yt_dlp.YoutubeDL(opts) as ydl:
-            info = ydl.extract_info(url, download=True)
+            # Probe: decide what to fetch before any media bytes move
+            progress.set_phase("probe")
+            probe = _preflight_probe(task_id, ydl, info, format_str, max_mb)
+            previous = task.get(DOWNLOAD_MARKER)
+            if previous and previous != probe["format_id"]:
+                # Partials kept by recovery belong to the previous selection (see partial_downloads.py)
+                removed = discard_partials(_task_dir(task_id))
+                if removed:
+                    log.info(f"[{task_id[:8]}] Format changed from {previous}, partials discarded")
+            if task.get("progressive") and probe["protocol"] in ("http", "https"):
+                # Single file written front to back: /download can follow it.
+                # No fixup pass, so the file is never rewritten under a reader
+                selected = _probe_selection(ydl, info, probe["format_id"])
+                probe["progressive_file"] = os.path.basename(ydl.prepare_filename(selected))
+                ydl.params["fixup"] = "never"
+            # Recorded before yt-dlp writes anything: recovery only resumes files under this marker
+            probe[DOWNLOAD_MARKER] = probe["format_id"]
+            _update_task(task_id, probe)
+            estimate = probe["estimated_size_bytes"]
+            size_txt = f"~{estimate / 1024 / 1024:.1f} MB" if estimate is not None else "size unknown"
+            log.info(f"[{task_id[:8]}] Probe: format {probe['format_id']}, {size_txt}")
+
+            # Plain http(s) formats use one connection; DASH/HLS fragments can
+            # be fetched in parallel within the node's connection budget
+            protocols = (probe["protocol"] or "https").split("+")
+            wanted = 1
+            if any(p not in ("http", "https") for p in protocols):
+                wanted = task.get("concurrent_fragments") or CONCURRENT_FRAGMENT_DOWNLOADS
+            granted = acquire_connections(redis_client, task_id, wanted)
+            ydl.params["concurrent_fragment_downloads"] = granted
+            if granted < wanted:
+                log.info(f"[{task_id[:8]}] Connection budget: {granted}/{wanted} fragment connections")
+            governor.attach(ydl, granted)
+            ydl.format_selector = ydl.build_format_selector(probe["format_id"])
+            info = ydl.process_ie_result(info, download=True)
 
         if info is None:
             raise RuntimeError("yt-dlp returned no info")
 
         task_dir = _task_dir(task_id)
-        downloaded = [f for f in os.listdir(task_dir) if f != "metadata.json"]
-        if not downloaded:
-            raise RuntimeError("No file downloaded")
-
-        filename = downloaded[0]
-        filepath = os.path.join(task_dir, filename)
+        requested = info.get("requested_downloads") or [{}]
+        filepath = requested[0].get("filepath")
+        if not filepath or not os.path.isfile(filepath):
+            downloaded = [f for f in os.listdir(task_dir) if f != "metadata.json" and not is_partial(f)]
+            if not downloaded:
+                raise RuntimeError("No file downloaded")
+            filepath = os.path.join(task_dir, downloaded[0])
+
+        filename = os.path.basename(filepath)
         file_size = os.path.getsize(filepath)
 
+        _raise_if_lease_lost(task_id, fence=True)
         download_url = f"{SERVER_BASE_URL}/download/{task_id}/{filename}"
         result = {
             "filename": filename,
@@ -352,80 +1066,150 @@ def _background_download(task_id: str) -> None:
         })
         log.info(f"[{task_id[:8]}] Done: {filename} ({file_size} bytes)")
         _send_webhook(task)
-
-    except yt_dlp.utils.DownloadError as exc:
+        _finish_dedup_leader(task, filepath, {k: result.get(k) for k in _SHARED_RESULT_FIELDS})
+
+    except LeaseLostError:
+        lease_lost = True
+        log.warning(f"[{task_id[:8]}] Download abandoned: lease lost, results left to the new owner")
+    except (yt_dlp.utils.DownloadError, yt_dlp.utils.ExtractorError) as exc:
+        if _lease_was_lost(task_id):
+            lease_lost = True
+            return
         error_str = str(exc)
         error_code = map_youtube_error_type_to_code(error_str)
         log.error(f"[{task_id[:8]}] DownloadError: {error_str[:300]}")
+        if _concurrency is not None and ("HTTP Error 429" in error_str or "Too Many Requests" in error_str):
+            _concurrency.record_rate_limited()
+        if info_cached:
+            # Stream URLs may have been revoked early; a retry extracts afresh
+            invalidate(redis_client, video_id_from_url(task["url"]), INFO_CACHE_PROFILE)
+        task = _update_task(task_id, {
+            "status": "failed",
+            "failed_at": datetime.utcnow().isoformat(),
+            "error": create_task_error(task_id, error_str[:500], error_code, operation="download_video"),
+        })
+        _send_webhook(task)
+        _finish_dedup_leader(task)
+    except FileTooLargeError as exc:
+        if _lease_was_lost(task_id):
+            lease_lost = True
+            return
+        log.warning(f"[{task_id[:8]}] Rejected before download: {exc}")
         task = _update_task(task_id, {
             "status": "failed",
             "failed_at": datetime.utcnow().isoformat(),
-            "error": create_task_error(error_code, error_str[:500]),
+            "error": create_task_error(
+                task_id, str(exc), ERROR_FILE_TOO_LARGE, operation="download_video",
+                user_action="Request a smaller format or raise max_size_mb",
+                error_type="file_too_large",
+            ),
         })
         _send_webhook(task)
+        _finish_dedup_leader(task)
     except Exception as exc:
+        if _lease_was_lost(task_id):
+            lease_lost = True
+            return
         log.error(f"[{task_id[:8]}] Error: {exc}", exc_info=True)
         task = _update_task(task_id, {
             "status": "failed",
             "failed_at": datetime.utcnow().isoformat(),
-            "error": create_task_error(ERROR_UNKNOWN, str(exc)[:500]),
+            "error": create_task_error(task_id, str(exc)[:500], ERROR_UNKNOWN, operation="download_video"),
         })
         _send_webhook(task)
+        _finish_dedup_leader(task)
     finally:
         with active_task_count_lock:
             active_task_count = max(0, active_task_count - 1)
+            leased_tasks.discard(task_id)
+            lost_leases.discard(task_id)
+        if not lease_lost:
+            # Keyed by task id: after a lease loss they belong to the new run
+            release_connections(redis_client, task_id)
+            release_bandwidth(redis_client, task_id)
+            record_finished(redis_client, task_id, THROUGHPUT_WINDOW_SECONDS)
+        release_task(redis_client, task_id, WORKER_ID)
+        _slot_pool.release()
 
 
 # ---------------------------------------------------------------------------
-# Cleanup expired tasks
+# Admission control & wait estimates
 # ---------------------------------------------------------------------------
 
-def _cleanup_loop() -> None:
-    while True:
-        time.sleep(3600)
-        try:
-            cutoff = datetime.utcnow() - timedelta(minutes=TASK_TTL_MINUTES)
-            for task_id in os.listdir(TASKS_DIR):
-                task_dir = os.path.join(TASKS_DIR, task_id)
-                if not os.path.isdir(task_dir):
-                    continue
-                path = os.path.join(task_dir, "metadata.json")
-                if not os.path.exists(path):
-                    continue
-                try:
-                    with open(path) as f:
-                        task = json.load(f)
-                    created = datetime.fromisoformat(task.get("created_at", ""))
-                    if created < cutoff:
-                        import shutil
-                        shutil.rmtree(task_dir, ignore_errors=True)
-                        try:
-                            redis_client.delete(f"task:{task_id}")
-                        except Exception:
-                            pass
-                        log.info(f"[cleanup] Removed expired task {task_id[:8]}")
-                except Exception as exc:
-                    log.warning(f"[cleanup] {task_id[:8]}: {exc}")
-        except Exception as exc:
-            log.error(f"[cleanup] Loop error: {exc}", exc_info=True)
+def _current_capacity() -> int | None:
+    """Download slots across all consumers right now."""
+    if DOWNLOAD_WORKER_MODE == "embedded":
+        return _slot_pool.limit
+    return total_capacity(redis_client)
+
+
+def _tasks_per_second() -> float:
+    """Rolling throughput; assumes DEFAULT_TASK_SECONDS per slot until measured."""
+    rate, finished = finished_per_second(redis_client, THROUGHPUT_WINDOW_SECONDS)
+    if finished >= 3:
+        return rate
+    return max(_current_capacity() or 1, 1) / DEFAULT_TASK_SECONDS
 
 
-threading.Thread(target=_cleanup_loop, daemon=True, name="cleanup").start()
+def _wait_estimates(positions: list) -> list:
+    """Expected waits of tasks at the given queue positions (1-based)."""
+    try:
+        running = redis_client.hlen(REDIS_ACTIVE_TASKS_KEY)
+    except Exception:
+        running = 0
+    free_slots = max(0, (_current_capacity() or 0) - running)
+    rate = _tasks_per_second()
+    now = datetime.utcnow()
+    estimates = []
+    for position in positions:
+        wait = max(0, position - free_slots) / rate
+        estimates.append({
+            "queue_position": position,
+            "estimated_wait_seconds": int(math.ceil(wait)),
+            "estimated_start_at": (now + timedelta(seconds=wait)).isoformat(),
+        })
+    return estimates
+
+
+def _wait_estimate(position: int) -> dict:
+    """Expected wait of the task at queue position `position` (1-based)."""
+    return _wait_estimates([position])[0]
+
+
+def _queue_full_error(queued: int, needed: int = 1) -> dict:
+    """QUEUE_FULL error body with the time until `needed` more tasks fit."""
+    excess = queued + needed - MAX_QUEUED_TASKS
+    retry_after = int(min(RETRY_AFTER_MAX_SECONDS, max(1, math.ceil(excess / _tasks_per_second()))))
+    body = create_simple_error(
+        f"Queue is full ({queued} tasks waiting), retry later", ERROR_QUEUE_FULL
+    )
+    body["retry_after_seconds"] = retry_after
+    return body
+
+
+def _queue_full_response(queued: int, needed: int = 1):
+    body = _queue_full_error(queued, needed)
+    return jsonify(body), 429, {"Retry-After": str(body["retry_after_seconds"])}
 
 
 # ---------------------------------------------------------------------------
 # Endpoints
 # ---------------------------------------------------------------------------
 
-def _download_video_handler():
-    data = request.get_json(silent=True) or {}
+def _new_task(data: dict) -> tuple[dict | None, dict | None]:
+    """
+    Validate a download request and build its task (not saved yet).
+
+    Returns:
+        tuple: (task, None) or (None, error body for a 400 response)
+    """
     url = data.get("url", "").strip()
     if not url:
-        return jsonify(create_simple_error(ERROR_MISSING_REQUIRED_FIELD, field="url")), 400
+        return None, create_simple_error("Missing required field: url", ERROR_MISSING_REQUIRED_FIELD)
 
     platform = _platform_for_url(url)
     if platform is None:
-        return jsonify(create_simple_error(ERROR_INVALID_URL, detail="Only YouTube URLs are supported")), 400
+        return None, create_simple_error("Only YouTube URLs are supported", ERROR_INVALID_URL)
 
     webhook_url = data.get("webhook_url", "").strip() or None
     if webhook_url:
@@ -433,17 +1217,52 @@ def _download_video_handler():
             from urllib.parse import urlparse
             parsed = urlparse(webhook_url)
             if parsed.scheme not in ("http", "https") or not parsed.netloc:
-                return jsonify(create_simple_error(ERROR_INVALID_WEBHOOK_URL)), 400
+                return None, create_simple_error("webhook_url must be an http(s) URL", ERROR_INVALID_WEBHOOK_URL)
         except Exception:
-            return jsonify(create_simple_error(ERROR_INVALID_WEBHOOK_URL)), 400
+            return None, create_simple_error("webhook_url must be an http(s) URL", ERROR_INVALID_WEBHOOK_URL)
 
     webhook_headers = data.get("webhook_headers") or None
     if webhook_headers is not None and not isinstance(webhook_headers, dict):
-        return jsonify(create_simple_error(ERROR_INVALID_WEBHOOK_HEADERS)), 400
+        return None, create_simple_error("webhook_headers must be an object", ERROR_INVALID_WEBHOOK_HEADERS)
+
+    webhook_batch = data.get("webhook_batch", False)
+    if not isinstance(webhook_batch, bool):
+        return None, create_simple_error("webhook_batch must be a boolean", ERROR_INVALID_PARAMETER)
 
     client_meta = data.get("client_meta") or None
     if client_meta is not None and not isinstance(client_meta, dict):
-        return jsonify(create_simple_error(ERROR_INVALID_CLIENT_META)), 400
+        return None, create_simple_error("client_meta must be an object", ERROR_INVALID_CLIENT_META)
+
+    concurrent_fragments = data.get("concurrent_fragments")
+    if concurrent_fragments is not None and (
+        not isinstance(concurrent_fragments, int) or isinstance(concurrent_fragments, bool)
+        or not 1 <= concurrent_fragments <= MAX_CONCURRENT_FRAGMENTS
+    ):
+        return None, create_simple_error(
+            f"concurrent_fragments must be an integer between 1 and {MAX_CONCURRENT_FRAGMENTS}",
+            ERROR_INVALID_PARAMETER,
+        )
+
+    http_chunk_size_mb = data.get("http_chunk_size_mb")
+    if http_chunk_size_mb is not None and (
+        not isinstance(http_chunk_size_mb, int) or isinstance(http_chunk_size_mb, bool)
+        or not 1 <= http_chunk_size_mb <= MAX_HTTP_CHUNK_SIZE_MB
+    ):
+        return None, create_simple_error(
+            f"http_chunk_size_mb must be an integer between 1 and {MAX_HTTP_CHUNK_SIZE_MB}",
+            ERROR_INVALID_PARAMETER,
+        )
+
+    progressive = data.get("progressive", False)
+    if not isinstance(progressive, bool):
+        return None, create_simple_error("progressive must be a boolean", ERROR_INVALID_PARAMETER)
+
+    priority = data.get("priority") or "normal"
+    if priority not in BANDWIDTH_PRIORITY_WEIGHTS:
+        return None, create_simple_error(
+            f"priority must be one of: {', '.join(BANDWIDTH_PRIORITY_WEIGHTS)}",
+            ERROR_INVALID_PARAMETER,
+        )
 
     task_id = str(uuid.uuid4())
     now = datetime.utcnow().isoformat()
@@ -457,18 +1276,59 @@ def _download_video_handler():
         "max_size_mb": data.get("max_size_mb", MAX_DOWNLOAD_VIDEO_SIZE_MB),
         "webhook_url": webhook_url,
         "webhook_headers": webhook_headers,
+        "webhook_batch": bool(webhook_url) and webhook_batch,
         "client_meta": client_meta,
+        "concurrent_fragments": concurrent_fragments,
+        "http_chunk_size_mb": http_chunk_size_mb,
+        "priority": priority,
+        "progressive": progressive,
+        "queue_policy": QUEUE_POLICY,
     }
-    _save_task(task)
-    redis_client.rpush("queue:queued", task_id)
-    log.info(f"[{task_id[:8]}] Queued: {url}")
+    video_id = video_id_from_url(url)
+    if video_id:
+        selector = _format_selector(task["format"])
+        task["dedup_key"] = dedup_key(video_id, selector, task["max_size_mb"])
+    return task, None
 
-    return jsonify({
+
+
+def _download_video_handler():
+    data = request.get_json(silent=True) or {}
+    task, error = _new_task(data)
+    if error is not None:
+        return jsonify(error), 400
+    task_id = task["task_id"]
+
+    # Over budget: shed load, unless the result already exists and costs nothing
+    queued = queue_length(redis_client)
+    if queued >= MAX_QUEUED_TASKS and not (
+        task.get("dedup_key") and find_blob(TASKS_DIR, task["dedup_key"])
+    ):
+        log.warning(f"[{task_id[:8]}] Rejected: queue full ({queued}/{MAX_QUEUED_TASKS})")
+        return _queue_full_response(queued)
+
+    position = None
+    if not _dedup_submit(task):
+        if QUEUE_POLICY == "sjf":
+            task["estimated_size_bytes"] = _queue_size_estimate(task)
+        try:
+            _save_task(task)
+            enqueue_task(redis_client, task_id, task=task)
+        except Exception as exc:
+            _abandon_dedup_leaders([task], exc)
+            raise
+        position = queue_position(redis_client, task_id)
+        log.info(f"[{task_id[:8]}] Queued: {task['url']}")
+
+    resp: dict[str, Any] = {
         "task_id": task_id,
-        "status": "queued",
-        "created_at": now,
-        "platform": platform,
-    }), 202
+        "status": task["status"],
+        "created_at": task["created_at"],
+        "platform": task["platform"],
+    }
+    if position is not None:
+        resp.update(_wait_estimate(position))
+    return jsonify(resp), 202
 
 
 @app.route("/download_video", methods=["POST"])
@@ -478,15 +1338,129 @@ def download_video():
     return _download_video_handler()
 
 
+def _enqueue_batch(tasks: list) -> None:
+    """
+    Save and enqueue new tasks with one Redis round trip.
+
+    Metadata files are written first (disk is the source of truth), then the
+    Redis copies and queue entries go out in a single pipeline. No status
+    events are published: nobody can be subscribed to a task id that has
+    not been returned yet.
+    """
+    for task in tasks:
+        task["version"] = task.get("version", 0) + 1
+        _write_task_file(task)
+    pipe = redis_client.pipeline(transaction=False)
+    for task in tasks:
+        pipe.setex(f"task:{task['task_id']}", TASK_TTL_MINUTES * 60, json.dumps(task))
+        index_task(pipe, task)
+        enqueue_task(pipe, task["task_id"], task=task)
+    pipe.execute()
+
+
+def _download_videos_handler():
+    data = request.get_json(silent=True) or {}
+    items = data.get("items")
+    if not isinstance(items, list) or not items:
+        return jsonify(create_simple_error(
+            "items must be a non-empty array", ERROR_MISSING_REQUIRED_FIELD
+        )), 400
+    if len(items) > MAX_BATCH_ITEMS:
+        return jsonify(create_simple_error(
+            f"At most {MAX_BATCH_ITEMS} items per request",
+            ERROR_INVALID_PARAMETER,
+        )), 400
+
+    # One webhook for the whole batch; everything else may be set per item,
+    # with top-level values as defaults
+    shared = {k: v for k, v in data.items() if k != "items"}
+    tasks = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            return jsonify(create_simple_error(
+                f"items[{index}] must be an object", ERROR_INVALID_PARAMETER
+            )), 400
+        merged = {**shared, **item}
+        merged["webhook_url"] = shared.get("webhook_url") or ""
+        merged["webhook_headers"] = shared.get("webhook_headers")
+        merged["webhook_batch"] = shared.get("webhook_batch", False)
+        task, error = _new_task(merged)
+        if error is not None:
+            error["error"] = f"items[{index}]: {error['error']}"
+            return jsonify(error), 400
+        tasks.append(task)
+
+    # Items are admitted in order while the queue has room; the rest are
+    # rejected one by one, unless their result already exists and costs nothing
+    queued = queue_length(redis_client)
+    room = MAX_QUEUED_TASKS - queued
+    to_enqueue, rejected = [], set()
+    for task in tasks:
+        if len(to_enqueue) >= room and not (
+            task.get("dedup_key") and find_blob(TASKS_DIR, task["dedup_key"])
+        ):
+            rejected.add(task["task_id"])
+            continue
+        if not _dedup_submit(task):
+            if QUEUE_POLICY == "sjf":
+                task["estimated_size_bytes"] = _queue_size_estimate(task)
+            to_enqueue.append(task)
+    if len(rejected) == len(tasks):
+        log.warning(f"Batch of {len(tasks)} rejected: queue full ({queued}/{MAX_QUEUED_TASKS})")
+        return _queue_full_response(queued, len(tasks))
+
+    if to_enqueue:
+        try:
+            _enqueue_batch(to_enqueue)
+        except Exception as exc:
+            _abandon_dedup_leaders(to_enqueue, exc)
+            raise
+    positions = queue_positions(redis_client, [t["task_id"] for t in to_enqueue])
+    estimates = dict(zip(positions, _wait_estimates(list(positions.values()))))
+    log.info(
+        f"Batch: {len(to_enqueue)} queued, {len(tasks) - len(to_enqueue) - len(rejected)} deduplicated, "
+        f"{len(rejected)} rejected (queue full)"
+    )
+
+    full_error = _queue_full_error(queued + len(to_enqueue), len(rejected)) if rejected else None
+    results = []
+    for task in tasks:
+        if task["task_id"] in rejected:
+            results.append({"url": task["url"], **full_error})
+            continue
+        entry: dict[str, Any] = {
+            "task_id": task["task_id"],
+            "status": task["status"],
+            "url": task["url"],
+        }
+        entry.update(estimates.get(task["task_id"], {}))
+        results.append(entry)
+    return jsonify({"count": len(results), "tasks": results}), 202
+
+
+@app.route("/download_videos", methods=["POST"])
+@api_v1.route("/download_videos", methods=["POST"])
+@require_api_key
+def download_videos():
+    return _download_videos_handler()
+
+
 # ---------------------------------------------------------------------------
 
-def _task_status_handler(task_id: str):
-    task = _load_task(task_id)
-    if task is None:
-        return jsonify(create_simple_error(ERROR_TASK_NOT_FOUND)), 404
+_UNSET = object()
+
+
+def _task_status_payload(task: dict, wait=_UNSET, progress=_UNSET) -> dict:
+    """
+    Status response of one task.
+
+    wait (queue position and estimate) and progress are looked up in Redis
+    unless the caller already fetched them (bulk status).
+    """
     resp: dict[str, Any] = {
-        "task_id": task_id,
+        "task_id": task["task_id"],
         "status": task["status"],
+        "version": task.get("version", 0),
         "created_at": task.get("created_at"),
         "platform": task.get("platform"),
         "url": task.get("url"),
@@ -497,9 +1471,30 @@ def _task_status_handler(task_id: str):
     elif task["status"] == "failed":
         resp["error"] = task.get("error")
         resp["failed_at"] = task.get("failed_at")
+    elif task["status"] == "queued":
+        if wait is _UNSET:
+            position = queue_position(redis_client, task["task_id"])
+            wait = _wait_estimate(position) if position is not None else None
+        if wait:
+            resp.update(wait)
     elif task["status"] == "processing":
         resp["started_at"] = task.get("started_at")
-    return jsonify(resp), 200
+        if "estimated_size_bytes" in task:
+            resp["estimated_size_bytes"] = task["estimated_size_bytes"]
+        if task.get("progressive_file"):
+            resp["progressive_url"] = f"{SERVER_BASE_URL}/download/{task['task_id']}/{task['progressive_file']}"
+        if progress is _UNSET:
+            progress = _load_progress(task["task_id"])
+        if progress:
+            resp["progress"] = progress
+    return resp
+
+
+def _task_status_handler(task_id: str):
+    task = _load_task(task_id, prefer_cache=True)
+    if task is None:
+        return jsonify(create_simple_error("Task not found", ERROR_TASK_NOT_FOUND)), 404
+    return jsonify(_task_status_payload(task)), 200
 
 
 @app.route("/task_status/<task_id>", methods=["GET"])
@@ -509,6 +1504,236 @@ def task_status(task_id: str):
     return _task_status_handler(task_id)
 
 
+def _task_statuses(task_ids: list, fields: list | None = None) -> tuple[list, list]:
+    """
+    Status payloads of many tasks with a fixed number of Redis round trips.
+
+    Args:
+        task_ids: Task ids (no duplicates); output keeps their order
+        fields: Keep only these payload fields (task_id is always kept)
+
+    Returns:
+        tuple: (payloads, ids of tasks that do not exist)
+    """
+    # One MGET for the task records; metadata.json only for Redis misses
+    try:
+        raws = redis_client.mget([f"task:{tid}" for tid in task_ids])
+    except Exception:
+        raws = [None] * len(task_ids)
+    tasks = {}
+    for tid, raw in zip(task_ids, raws):
+        task = None
+        if raw:
+            try:
+                task = json.loads(raw)
+            except ValueError:
+                pass
+        if task is None:
+            task = _read_task_file(tid)
+        if task is not None:
+            tasks[tid] = task
+
+    # Queue positions (one script call) and progress (one pipeline), only for fields asked for
+    want = set(fields) if fields is not None else None
+    queued = [tid for tid, t in tasks.items() if t.get("status") == "queued"]
+    processing = [tid for tid, t in tasks.items() if t.get("status") == "processing"]
+    if want is not None:
+        if not want & {"queue_position", "estimated_wait_seconds", "estimated_start_at"}:
+            queued = []
+        if "progress" not in want:
+            processing = []
+    waits, progress = {}, {}
+    positions = queue_positions(redis_client, queued)
+    if positions:
+        waits = dict(zip(positions, _wait_estimates(list(positions.values()))))
+    if processing:
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            for tid in processing:
+                pipe.hgetall(f"{REDIS_PROGRESS_PREFIX}{tid}")
+            results = pipe.execute()
+        except Exception:
+            results = [None] * len(processing)
+        progress = {tid: _parse_progress(raw) for tid, raw in zip(processing, results)}
+
+    statuses = []
+    for tid, task in tasks.items():
+        payload = _task_status_payload(task, wait=waits.get(tid), progress=progress.get(tid))
+        if want is not None:
+            payload = {k: v for k, v in payload.items() if k in want or k == "task_id"}
+        statuses.append(payload)
+    return statuses, [tid for tid in task_ids if tid not in tasks]
+
+
+def _bulk_task_status_handler():
+    data = request.get_json(silent=True) or {}
+    task_ids = data.get("task_ids")
+    if not isinstance(task_ids, list) or not task_ids \
+            or not all(isinstance(t, str) and t for t in task_ids):
+        return jsonify(create_simple_error(
+            "task_ids must be a non-empty array of task ids", ERROR_MISSING_REQUIRED_FIELD
+        )), 400
+    if len(task_ids) > MAX_STATUS_QUERY_IDS:
+        return jsonify(create_simple_error(
+            f"At most {MAX_STATUS_QUERY_IDS} task ids per request", ERROR_INVALID_PARAMETER
+        )), 400
+    fields = data.get("fields")
+    if fields is not None and (
+        not isinstance(fields, list) or not all(isinstance(f, str) for f in fields)
+    ):
+        return jsonify(create_simple_error("fields must be an array of strings", ERROR_INVALID_PARAMETER)), 400
+    statuses, not_found = _task_statuses(list(dict.fromkeys(task_ids)), fields)
+    return jsonify({"tasks": statuses, "not_found": not_found}), 200
+
+
+@app.route("/task_status", methods=["POST"])
+@api_v1.route("/task_status", methods=["POST"])
+@require_api_key
+def bulk_task_status():
+    return _bulk_task_status_handler()
+
+
+def _parse_time_param(value: str | None) -> float | None:
+    """Unix time from a query parameter given as unix seconds or ISO 8601 (UTC if naive)."""
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def _list_tasks_handler():
+    args = request.args
+    try:
+        since = _parse_time_param(args.get("created_from"))
+        until = _parse_time_param(args.get("created_to"))
+    except ValueError:
+        return jsonify(create_simple_error(
+            "created_from / created_to must be unix seconds or ISO 8601", ERROR_INVALID_PARAMETER
+        )), 400
+    limit = args.get("limit", default=TASK_LIST_DEFAULT_LIMIT, type=int)
+    if limit is None or not 1 <= limit <= TASK_LIST_MAX_LIMIT:
+        return jsonify(create_simple_error(
+            f"limit must be an integer between 1 and {TASK_LIST_MAX_LIMIT}", ERROR_INVALID_PARAMETER
+        )), 400
+    tag = args.get("tag")
+    if tag is not None and normalize_tag(tag) is None:
+        return jsonify(create_simple_error("Invalid tag", ERROR_INVALID_PARAMETER)), 400
+    fields = [f for f in args.get("fields", "").split(",") if f] or None
+
+    try:
+        page, next_cursor = list_task_ids(
+            redis_client, status=args.get("status") or None, tag=normalize_tag(tag) if tag else None,
+            since=since, until=until, cursor=args.get("cursor"), limit=limit,
+        )
+    except ValueError:
+        return jsonify(create_simple_error("Invalid cursor", ERROR_INVALID_PARAMETER)), 400
+
+    statuses, missing = _task_statuses([tid for tid, _ in page], fields)
+    for tid in missing:
+        # Deleted outside the orchestrator's cleanup
+        unindex_task(redis_client, tid)
+    return jsonify({"tasks": statuses, "next_cursor": next_cursor}), 200
+
+
+@app.route("/tasks", methods=["GET"])
+@api_v1.route("/tasks", methods=["GET"])
+@require_api_key
+def list_tasks():
+    return _list_tasks_handler()
+
+
+# ---------------------------------------------------------------------------
+# Streaming status (fed by task_events:<task_id> pub/sub, see task_sync.publish_task_event)
+# ---------------------------------------------------------------------------
+TERMINAL_STATUSES = ("completed", "failed")
+
+
+def _subscribe_task_events(task_id: str):
+    pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(f"task_events:{task_id}")
+    return pubsub
+
+
+def _next_task_event(pubsub, timeout: float) -> dict | None:
+    message = pubsub.get_message(timeout=timeout)
+    if not message or message.get("type") != "message":
+        return None
+    try:
+        return json.loads(message["data"])
+    except Exception:
+        return None
+
+
+@app.route("/task_status/<task_id>/wait", methods=["GET"])
+@api_v1.route("/task_status/<task_id>/wait", methods=["GET"])
+@require_api_key
+def task_status_wait(task_id: str):
+    """Long-poll: return as soon as the task version exceeds `since`, or on timeout."""
+    since = request.args.get("since", default=-1, type=int)
+    timeout = min(request.args.get("timeout", default=LONG_POLL_TIMEOUT_SECONDS, type=float), LONG_POLL_MAX_SECONDS)
+
+    # Subscribe before reading so a change between read and wait is not missed
+    pubsub = _subscribe_task_events(task_id)
+    try:
+        task = _load_task(task_id, prefer_cache=True)
+        if task is None:
+            return jsonify(create_simple_error("Task not found", ERROR_TASK_NOT_FOUND)), 404
+        deadline = time.monotonic() + max(0.0, timeout)
+        while task.get("version", 0) <= since and task["status"] not in TERMINAL_STATUSES:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            event = _next_task_event(pubsub, remaining)
+            if event and event.get("event") == "status":
+                task = _load_task(task_id, prefer_cache=True) or task
+    finally:
+        pubsub.close()
+    return jsonify(_task_status_payload(task)), 200
+
+
+@app.route("/task_events/<task_id>", methods=["GET"])
+@api_v1.route("/task_events/<task_id>", methods=["GET"])
+@require_api_key
+def task_events(task_id: str):
+    """Server-Sent Events stream of status and progress changes until the task finishes."""
+    pubsub = _subscribe_task_events(task_id)
+    task = _load_task(task_id, prefer_cache=True)
+    if task is None:
+        pubsub.close()
+        return jsonify(create_simple_error("Task not found", ERROR_TASK_NOT_FOUND)), 404
+
+    def _sse(event: str, data: dict, event_id: int | None = None) -> str:
+        head = f"id: {event_id}\n" if event_id is not None else ""
+        return f"{head}event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    def _stream(task: dict):
+        try:
+            yield "retry: 3000\n\n"
+            yield _sse("status", _task_status_payload(task), task.get("version", 0))
+            deadline = time.monotonic() + SSE_MAX_DURATION_SECONDS
+            while task["status"] not in TERMINAL_STATUSES and time.monotonic() < deadline:
+                event = _next_task_event(pubsub, SSE_KEEPALIVE_SECONDS)
+                if event is None:
+                    yield ": keepalive\n\n"
+                elif event.get("event") == "progress":
+                    event.pop("event", None)
+                    yield _sse("progress", event)
+                else:
+                    task = _load_task(task_id, prefer_cache=True) or task
+                    yield _sse("status", _task_status_payload(task), task.get("version", 0))
+        finally:
+            pubsub.close()
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(_stream(task), mimetype="text/event-stream", headers=headers)
+
+
 # ---------------------------------------------------------------------------
 
 @app.route("/download/<path:inner_path>", methods=["GET"])
@@ -517,14 +1742,338 @@ def task_status(task_id: str):
 def serve_file(inner_path: str):
     parts = inner_path.split("/", 1)
     if len(parts) != 2:
-        return jsonify(create_simple_error(ERROR_INVALID_PATH)), 400
+        return jsonify(create_simple_error("Invalid path", ERROR_INVALID_PATH)), 400
     task_id, filename = parts
     if ".." in task_id or ".." in filename:
-        return jsonify(create_simple_error(ERROR_INVALID_PATH)), 400
+        return jsonify(create_simple_error("Invalid path", ERROR_INVALID_PATH)), 400
+    if task_id.startswith("."):
+        return jsonify(create_simple_error("Invalid path", ERROR_INVALID_PATH)), 400
     filepath = os.path.join(TASKS_DIR, task_id, filename)
     if not os.path.isfile(filepath):
-        return jsonify(create_simple_error(ERROR_FILE_NOT_FOUND)), 404
-    return send_file(filepath, as_attachment=True)
+        task = _load_task(task_id, prefer_cache=True)
+        if task is not None and task.get("progressive_file") == filename and task["status"] == "processing":
+            return _progressive_response(task, filepath)
+        return jsonify(create_simple_error("File not found", ERROR_FILE_NOT_FOUND)), 404
+    return _file_response(filepath, task_id, filename)
+
+
+def _iter_file_range(f, length: int):
+    try:
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(FILE_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+def _if_range_matches(etag: str, last_modified: datetime) -> bool:
+    if_range = request.if_range
+    if if_range.etag is not None:
+        return if_range.etag == etag
+    if if_range.date is not None:
+        return last_modified <= if_range.date
+    return True
+
+
+def _follow_growing_file(task_id: str, filepath: str, length: int | None, pubsub):
+    """
+    Yield a file that is still being downloaded, as its bytes land.
+
+    yt-dlp writes <file>.part and renames it when done; the open descriptor
+    survives the rename, so the file is read to EOF once the task completed.
+    Status and progress events wake the loop; without new bytes for
+    PROGRESSIVE_IDLE_TIMEOUT_SECONDS, or when the task failed, the response
+    ends short (a client that got Content-Length sees the truncation).
+    """
+    f = None
+    sent = 0
+    finishing = False
+    idle_deadline = time.monotonic() + PROGRESSIVE_IDLE_TIMEOUT_SECONDS
+    try:
+        while length is None or sent < length:
+            if f is None:
+                for path in (f"{filepath}.part", filepath):
+                    try:
+                        f = open(path, "rb")
+                        break
+                    except FileNotFoundError:
+                        continue
+            chunk = f.read(FILE_CHUNK_SIZE) if f is not None else b""
+            if chunk:
+                if length is not None:
+                    chunk = chunk[:length - sent]
+                sent += len(chunk)
+                idle_deadline = time.monotonic() + PROGRESSIVE_IDLE_TIMEOUT_SECONDS
+                yield chunk
+                continue
+            if finishing:
+                return
+            task = _load_task(task_id, prefer_cache=True)
+            if task is None or task["status"] == "failed":
+                log.warning(f"[{task_id[:8]}] Progressive download ended after {sent} bytes: task failed")
+                return
+            if task["status"] == "completed":
+                if f is None:
+                    if not os.path.isfile(filepath):
+                        return
+                    f = open(filepath, "rb")
+                # Drain what was written between the last read and completion
+                finishing = True
+                continue
+            if time.monotonic() >= idle_deadline:
+                log.warning(f"[{task_id[:8]}] Progressive download stalled after {sent} bytes")
+                return
+            _next_task_event(pubsub, PROGRESSIVE_POLL_SECONDS)
+    finally:
+        if f is not None:
+            f.close()
+        pubsub.close()
+
+
+def _progressive_response(task: dict, filepath: str) -> Response:
+    """
+    Serve a progressive task's file while it downloads.
+
+    Content-Length is set when the probe knew the exact size, otherwise the
+    response is chunked. Ranges are not supported until the task completed.
+    """
+    task_id = task["task_id"]
+    filename = os.path.basename(filepath)
+    length = task.get("estimated_size_bytes") if task.get("size_estimate_exact") else None
+    pubsub = _subscribe_task_events(task_id)
+    resp = Response(
+        _follow_growing_file(task_id, filepath, length, pubsub),
+        mimetype=mimetypes.guess_type(filename)[0] or "application/octet-stream",
+        direct_passthrough=True,
+    )
+    if length is not None:
+        resp.content_length = length
+    resp.headers["Cache-Control"] = "no-store"
+    resp.headers["X-Accel-Buffering"] = "no"
+    _set_content_disposition(resp, "attachment", filename)
+    log.info(f"[{task_id[:8]}] Serving {filename} progressively ({length or 'unknown'} bytes)")
+    return resp
+
+
+def _set_content_disposition(resp: Response, disposition: str, filename: str) -> None:
+    try:
+        filename.encode("ascii")
+        names = {"filename": filename}
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize("NFKD", filename).encode("ascii", "ignore").decode("ascii")
+        names = {"filename": simple, "filename*": f"UTF-8''{quote(filename, safe='!#$&+-.^_`|~')}"}
+    resp.headers.set("Content-Disposition", disposition, **names)
+
+
+def _file_response(filepath: str, task_id: str, filename: str) -> Response:
+    """
+    Serve a task file with conditional GET, byte ranges and zero-copy output.
+
+    Under gunicorn the body is a wsgi.file_wrapper, which gunicorn sends with
+    sendfile() starting at the current file offset for Content-Length bytes,
+    so both full and single-range responses skip user-space copies. With
+    FILE_OFFLOAD_MODE set, only headers are returned and the proxy streams
+    the file (and handles ranges) itself.
+    """
+    st = os.stat(filepath)
+    size = st.st_size
+    etag = f"{st.st_ino:x}-{size:x}-{st.st_mtime_ns:x}"
+    last_modified = datetime.fromtimestamp(int(st.st_mtime), tz=timezone.utc)
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+    resp = Response(mimetype=mimetype, direct_passthrough=True)
+    resp.set_etag(etag)
+    resp.last_modified = last_modified
+    resp.accept_ranges = "bytes"
+    _set_content_disposition(resp, "attachment", filename)
+
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains(etag)
+    else:
+        not_modified = request.if_modified_since is not None and last_modified <= request.if_modified_since
+    if not_modified:
+        resp.status_code = 304
+        return resp
+
+    if FILE_OFFLOAD_MODE == "x-accel":
+        resp.headers["X-Accel-Redirect"] = f"{X_ACCEL_PREFIX}/{quote(task_id)}/{quote(filename)}"
+        return resp
+    if FILE_OFFLOAD_MODE == "x-sendfile":
+        resp.headers["X-Sendfile"] = os.path.abspath(filepath)
+        return resp
+
+    start, end = 0, size
+    if request.range is not None and _if_range_matches(etag, last_modified):
+        byte_range = request.range.range_for_length(size)
+        if byte_range is not None:
+            start, end = byte_range
+            resp.status_code = 206
+            resp.content_range = ContentRange("bytes", start, end, size)
+        elif len(request.range.ranges) == 1:
+            resp.status_code = 416
+            resp.content_range = ContentRange("bytes", None, None, size)
+            return resp
+        # Multi-range requests get the full file (allowed by RFC 9110)
+
+    length = end - start
+    resp.content_length = length
+    if request.method == "HEAD":
+        return resp
+    f = open(filepath, "rb")
+    f.seek(start)
+    if resp.status_code == 200 or request.environ.get("SERVER_SOFTWARE", "").startswith("gunicorn"):
+        # gunicorn stops at Content-Length, so the wrapper is safe for ranges too
+        resp.response = wrap_file(request.environ, f, FILE_CHUNK_SIZE)
+    else:
+        resp.response = _iter_file_range(f, length)
+    return resp
+
+
+# ---------------------------------------------------------------------------
+# Pass-through streaming (see media_stream.py)
+# ---------------------------------------------------------------------------
+# Each stream holds a request thread and an ffmpeg process for its whole duration
+MAX_CONCURRENT_STREAMS = int(os.getenv("MAX_CONCURRENT_STREAMS", "4"))  # per API process
+STREAM_RETRY_AFTER_SECONDS = 30
+_stream_slots = threading.BoundedSemaphore(MAX_CONCURRENT_STREAMS)
+
+
+def _finish_saved_stream(task: dict, stream: MediaStream, info: dict) -> None:
+    """Record the outcome of a stream that was teed to the task directory."""
+    task_id = task["task_id"]
+    if not stream.completed:
+        error = create_task_error(
+            task_id, f"Stream interrupted after {stream.bytes_sent} bytes", ERROR_DOWNLOAD_FAILED,
+            operation="stream_video", error_type="stream_interrupted",
+        )
+        # The client already has (part of) the stream; the recovery loop must not refetch it
+        error["recoverable"] = False
+        task = _update_task(task_id, {
+            "status": "failed",
+            "failed_at": datetime.utcnow().isoformat(),
+            "error": error,
+        })
+        log.warning(f"[{task_id[:8]}] Stream interrupted after {stream.bytes_sent} bytes")
+        _send_webhook(task)
+        return
+    filepath = stream.tee_path
+    filename = os.path.basename(filepath)
+    shared = {
+        "title": info.get("title"),
+        "duration": info.get("duration"),
+        "thumbnail": info.get("thumbnail"),
+        "uploader": info.get("uploader"),
+        "platform": "YouTube",
+    }
+    result = dict(shared)
+    result.update({
+        "filename": filename,
+        "download_url": f"{SERVER_BASE_URL}/download/{task_id}/{filename}",
+        "file_size_bytes": os.path.getsize(filepath),
+    })
+    task = _update_task(task_id, {
+        "status": "completed",
+        "completed_at": datetime.utcnow().isoformat(),
+        "result": result,
+    })
+    log.info(f"[{task_id[:8]}] Stream saved: {filename} ({result['file_size_bytes']} bytes)")
+    _send_webhook(task)
+    if task.get("dedup_key"):
+        store_blob(TASKS_DIR, task["dedup_key"], filepath, shared)
+
+
+def _stream_video_handler():
+    data = request.get_json(silent=True) or {}
+    save = data.get("save", False)
+    if not isinstance(save, bool):
+        return jsonify(create_simple_error("save must be a boolean", ERROR_INVALID_PARAMETER)), 400
+    task, error = _new_task(data)
+    if error is not None:
+        return jsonify(error), 400
+    task_id = task["task_id"]
+
+    if not _stream_slots.acquire(blocking=False):
+        log.warning(f"[{task_id[:8]}] Stream rejected: {MAX_CONCURRENT_STREAMS} streams running")
+        resp = jsonify(create_simple_error("Too many concurrent streams", ERROR_QUEUE_FULL))
+        resp.headers["Retry-After"] = str(STREAM_RETRY_AFTER_SECONDS)
+        return resp, 429
+
+    stream = None
+    try:
+        try:
+            info, _ = _extract_info(task["url"], task_id)
+            with _extractor_ydl() as ydl:
+                probe = _preflight_probe(task_id, ydl, info, task["format"], task["max_size_mb"])
+                selected = _probe_selection(ydl, info, probe["format_id"])
+        except FileTooLargeError as exc:
+            return jsonify(create_simple_error(str(exc), ERROR_FILE_TOO_LARGE)), 400
+        except (yt_dlp.utils.DownloadError, yt_dlp.utils.ExtractorError) as exc:
+            error_str = str(exc)
+            log.error(f"[{task_id[:8]}] Stream extraction failed: {error_str[:300]}")
+            return jsonify(create_simple_error(error_str[:500], map_youtube_error_type_to_code(error_str))), 502
+
+        plan = stream_plan(selected)
+        if plan is None:
+            return jsonify(create_simple_error(
+                f"Format {probe['format_id']} ({probe['protocol']}) cannot be streamed; "
+                "use /download_video or choose another format",
+                ERROR_FORMAT_NOT_AVAILABLE,
+            )), 400
+
+        filename = f"{yt_dlp.utils.sanitize_filename(info.get('title') or task_id)}.{plan['ext']}"
+        tee_path = None
+        if save:
+            os.makedirs(_task_dir(task_id), exist_ok=True)
+            tee_path = os.path.join(_task_dir(task_id), filename)
+            task.update({"status": "processing", "started_at": datetime.utcnow().isoformat(), "streamed": True})
+            task.update(probe)
+            _save_task(task)
+
+        stream = MediaStream(plan, tee_path, task_id)
+        try:
+            stream.start()
+        except StreamError as exc:
+            log.error(f"[{task_id[:8]}] Stream failed to start: {exc}")
+            if save:
+                task = _update_task(task_id, {
+                    "status": "failed",
+                    "failed_at": datetime.utcnow().isoformat(),
+                    "error": create_task_error(task_id, str(exc), ERROR_FFMPEG_ERROR, operation="stream_video"),
+                })
+                _send_webhook(task)
+            stream = None
+            return jsonify(create_simple_error(str(exc), ERROR_FFMPEG_ERROR)), 502
+    finally:
+        if stream is None:
+            _stream_slots.release()
+
+    log.info(f"[{task_id[:8]}] Streaming format {probe['format_id']} as {plan['ffmpeg_format']}: {task['url']}")
+
+    def _body():
+        try:
+            yield from stream
+        finally:
+            _stream_slots.release()
+            log.info(f"[{task_id[:8]}] Stream closed after {stream.bytes_sent} bytes")
+            if save:
+                _finish_saved_stream(task, stream, info)
+
+    headers = {"X-Accel-Buffering": "no", "Cache-Control": "no-store", "X-Task-Id": task_id}
+    resp = Response(_body(), mimetype=plan["mimetype"], headers=headers, direct_passthrough=True)
+    _set_content_disposition(resp, "inline", filename)
+    return resp
+
+
+@app.route("/stream_video", methods=["POST"])
+@api_v1.route("/stream_video", methods=["POST"])
+@require_api_key
+def stream_video():
+    """Synchronous download: the video is remuxed straight into the response body."""
+    return _stream_video_handler()
 
 
 # ---------------------------------------------------------------------------
@@ -538,21 +2087,34 @@ def health():
     except Exception:
         redis_ok = False
 
-    with active_task_count_lock:
-        running = active_task_count
-
-    queued = 0
+    # Leases cover every consumer (embedded or download_worker processes)
     try:
-        queued = redis_client.llen("queue:queued")
+        running = redis_client.hlen(REDIS_ACTIVE_TASKS_KEY)
     except Exception:
-        pass
+        with active_task_count_lock:
+            running = active_task_count
+
+    capacity = _current_capacity()
+    queued = queue_length(redis_client)
 
     return jsonify({
         "status": "ok" if redis_ok else "degraded",
         "redis": "ok" if redis_ok else "unavailable",
         "active_tasks": running,
         "queued_tasks": queued,
-        "max_concurrent_tasks": MAX_CONCURRENT_TASKS,
+        "max_queued_tasks": MAX_QUEUED_TASKS,
+        "tasks_per_minute": round(finished_per_second(redis_client, THROUGHPUT_WINDOW_SECONDS)[0] * 60, 2),
+        "queue_policy": QUEUE_POLICY,
+        "queue_wait": queue_wait_stats(redis_client),
+        "max_concurrent_tasks": capacity,
+        "adaptive_concurrency": ADAPTIVE_CONCURRENCY,
+        "connections": {
+            "in_use": connections_in_use(redis_client),
+            "budget": DOWNLOAD_CONNECTION_BUDGET,
+        },
+        "bandwidth": bandwidth_usage(redis_client),
+        "webhooks": webhook_stats(redis_client),
+        "worker_mode": DOWNLOAD_WORKER_MODE,
         "worker_id": WORKER_ID,
         "timestamp": datetime.utcnow().isoformat() + "Z",
     }), 200
@@ -581,11 +2143,20 @@ app.register_blueprint(api_v1)
 # ---------------------------------------------------------------------------
 
 def _startup() -> None:
+    if DOWNLOAD_WORKER_MODE == "worker":
+        # Pool processes share the banner printed by download_worker.py
+        _wait_for_redis()
+        return
     log.info("=" * 60)
     log.info("  YouTube Downloader API  (public build)")
     log.info("=" * 60)
     log.info(f"  Worker ID      : {WORKER_ID}")
-    log.info(f"  Max concurrent : {MAX_CONCURRENT_TASKS}")
+    log.info(f"  Worker mode    : {DOWNLOAD_WORKER_MODE}")
+    if DOWNLOAD_WORKER_MODE == "embedded":
+        if ADAPTIVE_CONCURRENCY:
+            log.info(f"  Max concurrent : {MAX_CONCURRENT_TASKS} (adaptive {DOWNLOAD_SLOTS_MIN}..{DOWNLOAD_SLOTS_MAX})")
+        else:
+            log.info(f"  Max concurrent : {MAX_CONCURRENT_TASKS}")
     log.info(f"  Task TTL       : {TASK_TTL_MINUTES} min (24h)")
     log.info(f"  Tasks dir      : {TASKS_DIR}")
     log.info(f"  Redis          : {REDIS_URL}")
@@ -596,6 +2167,13 @@ def _startup() -> None:
 
 _startup()
 
+if DOWNLOAD_WORKER_MODE == "embedded":
+    start_download_consumer(MAX_CONCURRENT_TASKS)
+    # Without a separate orchestrator nothing else would deliver webhooks;
+    # running next to one is safe (deliveries are claimed under a lease)
+    _webhook_dispatcher = WebhookDispatcher(redis_client, TASKS_DIR)
+    _webhook_dispatcher.start()
+
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=int(os.getenv("PORT", "5000")), debug=False)
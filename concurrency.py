@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Concurrency Module
+
+Adaptive number of download slots per download process (AIMD).
+
+Architecture:
+- SlotPool: counting semaphore whose size can change while downloads run;
+  shrinking never interrupts a running download, it only delays the next one
+- AimdController: every CONCURRENCY_ADJUST_INTERVAL_SECONDS looks at the last
+  window and resizes the pool between DOWNLOAD_SLOTS_MIN and DOWNLOAD_SLOTS_MAX:
+    free disk < MIN_FREE_DISK_MB                 -> floor
+    HTTP 429 from YouTube, or CPU of child
+    processes (ffmpeg merges, JS solver) above
+    CONCURRENCY_CPU_HIGH of all cores            -> halve (multiplicative decrease)
+    last increase lowered total throughput       -> one slot back
+    all slots busy and tasks waiting             -> one slot more (additive increase)
+- Signals are local to the process; with several download processes each one
+  adapts its own slots and publishes them to workers:capacity
+"""
+
+import os
+import math
+import time
+import shutil
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+ADAPTIVE_CONCURRENCY = os.getenv('ADAPTIVE_CONCURRENCY', '1').lower() not in ('0', 'false', 'no')
+DOWNLOAD_SLOTS_MIN = int(os.getenv('DOWNLOAD_SLOTS_MIN', '1'))
+DOWNLOAD_SLOTS_MAX = int(os.getenv('DOWNLOAD_SLOTS_MAX', '8'))
+CONCURRENCY_ADJUST_INTERVAL_SECONDS = int(os.getenv('CONCURRENCY_ADJUST_INTERVAL_SECONDS', '30'))
+CONCURRENCY_CPU_HIGH = float(os.getenv('CONCURRENCY_CPU_HIGH', '0.75'))
+MIN_FREE_DISK_MB = int(os.getenv('MIN_FREE_DISK_MB', '2048'))
+# An increase is undone when total throughput falls below this fraction of
+# the window before it
+_THROUGHPUT_DROP_RATIO = 0.8
+
+
+class SlotPool:
+    """Download slots; the limit can be changed at any time."""
+
+    def __init__(self, limit: int):
+        self._cond = threading.Condition()
+        self.limit = max(1, limit)
+        self.in_use = 0
+
+    def acquire(self, timeout: float) -> bool:
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.in_use < self.limit, timeout):
+                return False
+            self.in_use += 1
+            return True
+
+    def release(self) -> None:
+        with self._cond:
+            self.in_use = max(0, self.in_use - 1)
+            self._cond.notify()
+
+    def resize(self, limit: int) -> None:
+        with self._cond:
+            self.limit = max(1, limit)
+            self._cond.notify_all()
+
+
+class AimdController:
+    """
+    Resizes a SlotPool from throughput, child CPU, free disk and 429 signals.
+
+    Args:
+        pool: Slots to resize
+        disk_path: Filesystem whose free space is checked (the tasks volume)
+        backlog: Callable returning the number of tasks waiting in the queue
+        on_resize: Called with the new limit after every change
+    """
+
+    def __init__(self, pool: SlotPool, disk_path: str, backlog, on_resize=None,
+                 floor: int = DOWNLOAD_SLOTS_MIN, ceiling: int = DOWNLOAD_SLOTS_MAX):
+        self.pool = pool
+        self.disk_path = disk_path
+        self.backlog = backlog
+        self.on_resize = on_resize
+        self.floor = max(1, floor)
+        self.ceiling = max(self.floor, ceiling)
+        self.last_reason = "initial"
+        self.last_throughput = 0.0
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._rate_limited = 0
+        self._busy_seen = False
+        self._file_progress: dict[str, int] = {}
+        self._prev_throughput: float | None = None
+        self._increased = False
+        self._window_start = time.monotonic()
+        self._cpu_start = self._children_cpu()
+
+    # -- signal collection --------------------------------------------------
+
+    def download_hook(self, d: dict) -> None:
+        """yt-dlp progress hook: counts downloaded bytes across all tasks."""
+        name = d.get("tmpfilename") or d.get("filename") or ""
+        done = d.get("downloaded_bytes") or 0
+        with self._lock:
+            self._bytes += max(0, done - self._file_progress.get(name, 0))
+            if d.get("status") == "downloading":
+                self._file_progress[name] = done
+            else:
+                self._file_progress.pop(name, None)
+            if self.pool.in_use >= self.pool.limit:
+                self._busy_seen = True
+
+    def record_rate_limited(self) -> None:
+        """A download failed with HTTP 429 (Too Many Requests)."""
+        with self._lock:
+            self._rate_limited += 1
+
+    @staticmethod
+    def _children_cpu() -> float:
+        t = os.times()
+        return t.children_user + t.children_system
+
+    # -- control loop -------------------------------------------------------
+
+    def run(self, stop_event: threading.Event) -> None:
+        while not stop_event.wait(CONCURRENCY_ADJUST_INTERVAL_SECONDS):
+            try:
+                self.step()
+            except Exception as e:
+                logger.warning(f"Concurrency controller error: {e}")
+
+    def step(self) -> int:
+        """Evaluate the last window and resize the pool; returns the new limit."""
+        now = time.monotonic()
+        cpu_now = self._children_cpu()
+        elapsed = max(now - self._window_start, 1e-3)
+        with self._lock:
+            window_bytes, self._bytes = self._bytes, 0
+            rate_limited, self._rate_limited = self._rate_limited, 0
+            busy, self._busy_seen = self._busy_seen or self.pool.in_use >= self.pool.limit, False
+        cpu_share = (cpu_now - self._cpu_start) / (elapsed * (os.cpu_count() or 1))
+        self._window_start, self._cpu_start = now, cpu_now
+        throughput = window_bytes / elapsed
+        self.last_throughput = throughput
+
+        limit = self.pool.limit
+        new_limit, reason = limit, None
+        try:
+            free_mb = shutil.disk_usage(self.disk_path).free / 1024 / 1024
+        except OSError:
+            free_mb = None
+
+        if free_mb is not None and free_mb < MIN_FREE_DISK_MB:
+            new_limit, reason = self.floor, f"free disk {free_mb:.0f} MB"
+        elif rate_limited:
+            new_limit, reason = math.ceil(limit / 2), f"{rate_limited}x HTTP 429"
+        elif cpu_share > CONCURRENCY_CPU_HIGH:
+            new_limit, reason = math.ceil(limit / 2), f"child CPU {cpu_share:.0%}"
+        elif self._increased and self._prev_throughput \
+                and throughput < self._prev_throughput * _THROUGHPUT_DROP_RATIO:
+            new_limit, reason = limit - 1, "throughput fell after increase"
+        elif busy and self.backlog() > 0:
+            new_limit, reason = limit + 1, "all slots busy with backlog"
+
+        new_limit = min(self.ceiling, max(self.floor, new_limit))
+        self._increased = new_limit > limit
+        self._prev_throughput = throughput
+        if new_limit != limit:
+            self.pool.resize(new_limit)
+            self.last_reason = reason
+            logger.info(
+                f"Download slots {limit} -> {new_limit} ({reason}; "
+                f"{throughput / 1024 / 1024:.1f} MB/s, child CPU {cpu_share:.0%})"
+            )
+            if self.on_resize:
+                self.on_resize(new_limit)
+        return new_limit
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Download Worker - standalone process pool that consumes the Redis task queue.
+
+Runs yt-dlp extraction, downloads and ffmpeg merges outside gunicorn, so HTTP
+workers only serve requests (start gunicorn with DOWNLOAD_WORKER_MODE=external).
+
+Each pool process imports app.py in "worker" mode, which loads the download
+engine without HTTP-side background threads, keeps its own warm YoutubeDL
+instances and starts with DOWNLOAD_WORKER_SLOTS downloads at a time:
+
+    initial download concurrency = DOWNLOAD_WORKER_PROCESSES x DOWNLOAD_WORKER_SLOTS
+
+With ADAPTIVE_CONCURRENCY each process then adapts its slots (concurrency.py)
+and publishes them to workers:capacity.
+
+Shutdown (SIGTERM/SIGINT): every process stops taking tasks, waits up to
+DOWNLOAD_WORKER_SHUTDOWN_TIMEOUT seconds for running downloads and hands the
+rest back to the head of the queue.
+"""
+
+import os
+import sys
+import signal
+import logging
+import multiprocessing
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="[%(asctime)s] [%(levelname)s] %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+log = logging.getLogger("download_worker")
+
+DOWNLOAD_WORKER_PROCESSES = int(os.getenv("DOWNLOAD_WORKER_PROCESSES", "2"))
+DOWNLOAD_WORKER_SLOTS = int(os.getenv("DOWNLOAD_WORKER_SLOTS", "1"))
+DOWNLOAD_WORKER_SHUTDOWN_TIMEOUT = int(os.getenv("DOWNLOAD_WORKER_SHUTDOWN_TIMEOUT", "30"))
+
+
+def _worker_main(index: int, stop_event) -> None:
+    # The parent coordinates shutdown through stop_event
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    os.environ["DOWNLOAD_WORKER_MODE"] = "worker"
+
+    import app as engine
+
+    engine.log.info(f"Download worker #{index} ready ({engine.WORKER_ID}, slots={DOWNLOAD_WORKER_SLOTS})")
+    engine.start_download_consumer(DOWNLOAD_WORKER_SLOTS)
+    stop_event.wait()
+    engine.stop_download_consumer(DOWNLOAD_WORKER_SHUTDOWN_TIMEOUT)
+    engine.log.info(f"Download worker #{index} stopped")
+
+
+def main() -> None:
+    ctx = multiprocessing.get_context("spawn")
+    stop_event = ctx.Event()
+    processes: dict[int, multiprocessing.Process] = {}
+
+    def _start(index: int) -> None:
+        proc = ctx.Process(
+            target=_worker_main,
+            args=(index, stop_event),
+            name=f"download-worker-{index}",
+        )
+        proc.start()
+        processes[index] = proc
+
+    def _shutdown(signum, frame) -> None:
+        log.info(f"Download workers: shutting down (signal {signum})")
+        stop_event.set()
+
+    signal.signal(signal.SIGTERM, _shutdown)
+    signal.signal(signal.SIGINT, _shutdown)
+
+    capacity = DOWNLOAD_WORKER_PROCESSES * DOWNLOAD_WORKER_SLOTS
+    log.info("=" * 60)
+    log.info("  YouTube Downloader API  (download workers)")
+    log.info("=" * 60)
+    log.info(f"  Processes      : {DOWNLOAD_WORKER_PROCESSES}")
+    log.info(f"  Slots/process  : {DOWNLOAD_WORKER_SLOTS}")
+    log.info(f"  Max concurrent : {capacity} (initial)")
+    log.info("=" * 60)
+
+    for index in range(DOWNLOAD_WORKER_PROCESSES):
+        _start(index)
+
+    while not stop_event.is_set():
+        for index, proc in list(processes.items()):
+            if not proc.is_alive() and not stop_event.is_set():
+                log.warning(f"Download worker #{index} exited (code {proc.exitcode}), restarting")
+                _start(index)
+        stop_event.wait(5)
+
+    for proc in processes.values():
+        proc.join(DOWNLOAD_WORKER_SHUTDOWN_TIMEOUT + 10)
+    for index, proc in processes.items():
+        if proc.is_alive():
+            log.warning(f"Download worker #{index} did not stop in time, terminating")
+            proc.terminate()
+    log.info("Download workers: stopped")
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Info Cache Module
+
+Cache of yt-dlp extraction results (unprocessed info dicts) so a video that
+was extracted recently is not extracted again: no webpage/player JS fetch,
+no signature solving and no PO token negotiation.
+
+Architecture:
+- Key = video id + client profile (hash of yt-dlp version and extractor args,
+  so entries are never reused by a differently configured extractor)
+- info:<video_id>:<profile>  = trimmed info dict as JSON (shared by all workers)
+- Per-process LRU in front of Redis (INFO_CACHE_LOCAL_ENTRIES entries)
+- TTL = min(INFO_CACHE_TTL_SECONDS, stream URL expiry - INFO_CACHE_EXPIRY_MARGIN_SECONDS);
+  googlevideo URLs carry their expiry in the "expire" query parameter
+- Live / upcoming streams are never cached
+
+Entries are stored and returned as fresh JSON copies: callers may mutate
+the info dict (yt-dlp processing does) without affecting the cache.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from urllib.parse import urlparse, parse_qs
+
+import yt_dlp
+
+logger = logging.getLogger(__name__)
+
+REDIS_INFO_CACHE_PREFIX = "info:"
+INFO_CACHE_TTL_SECONDS = int(os.getenv('INFO_CACHE_TTL_SECONDS', '1800'))
+INFO_CACHE_LOCAL_ENTRIES = int(os.getenv('INFO_CACHE_LOCAL_ENTRIES', '256'))
+# Stop serving an entry this long before its stream URLs expire
+INFO_CACHE_EXPIRY_MARGIN_SECONDS = 900
+
+# Top-level fields the download path never reads; subtitles/captions alone
+# are often larger than the whole format list
+_DROPPED_FIELDS = ("automatic_captions", "subtitles", "heatmap", "comments")
+_UNCACHEABLE_LIVE_STATUSES = ("is_live", "is_upcoming", "post_live")
+
+# video key -> (expires_at, json)
+_local: OrderedDict = OrderedDict()
+_local_lock = threading.Lock()
+
+
+def cache_key(video_id: str, profile: str) -> str:
+    """Redis key of a cached info dict."""
+    return f"{REDIS_INFO_CACHE_PREFIX}{video_id}:{profile}"
+
+
+def trim_info(info: dict) -> dict:
+    """
+    Reduce an extracted info dict to what format selection and download need.
+
+    Private keys such as original_url and the __-prefixed extractor state
+    are kept: they are read again when the info is processed. Dropped are
+    callables (__post_extractor fetches comments, which are not used),
+    subtitles, captions, heatmap, comments and storyboard formats; other
+    values are made JSON-safe by yt_dlp sanitize_info.
+    """
+    trimmed = yt_dlp.YoutubeDL.sanitize_info({k: v for k, v in info.items() if not callable(v)})
+    for field in _DROPPED_FIELDS:
+        trimmed.pop(field, None)
+    trimmed["formats"] = [
+        fmt for fmt in trimmed.get("formats") or []
+        if fmt.get("protocol") != "mhtml"
+    ]
+    return trimmed
+
+
+def _stream_expiry(info: dict):
+    """Earliest "expire" timestamp of the format URLs, or None if unknown."""
+    expiries = []
+    for fmt in info.get("formats") or []:
+        try:
+            value = parse_qs(urlparse(fmt.get("url") or "").query).get("expire")
+            if value:
+                expiries.append(int(value[0]))
+        except (ValueError, TypeError):
+            continue
+    return min(expiries) if expiries else None
+
+
+def _entry_ttl(info: dict) -> int:
+    ttl = INFO_CACHE_TTL_SECONDS
+    expire = _stream_expiry(info)
+    if expire is not None:
+        ttl = min(ttl, int(expire - time.time() - INFO_CACHE_EXPIRY_MARGIN_SECONDS))
+    return ttl
+
+
+def _remember(key: str, expires_at: float, raw: str) -> None:
+    with _local_lock:
+        _local[key] = (expires_at, raw)
+        _local.move_to_end(key)
+        while len(_local) > INFO_CACHE_LOCAL_ENTRIES:
+            _local.popitem(last=False)
+
+
+def get_info(redis_conn, video_id: str, profile: str):
+    """
+    Look up a cached info dict (local LRU first, then Redis).
+
+    Returns:
+        dict | None: A private copy of the info dict, or None on a miss
+    """
+    if INFO_CACHE_TTL_SECONDS <= 0:
+        return None
+    key = cache_key(video_id, profile)
+    now = time.time()
+    with _local_lock:
+        entry = _local.get(key)
+        if entry is not None:
+            if entry[0] > now:
+                _local.move_to_end(key)
+                return json.loads(entry[1])
+            del _local[key]
+    try:
+        pipe = redis_conn.pipeline()
+        pipe.get(key)
+        pipe.ttl(key)
+        raw, ttl = pipe.execute()
+    except Exception as e:
+        logger.debug(f"Info cache: Redis lookup failed for {video_id}: {e}")
+        return None
+    if not raw:
+        return None
+    if ttl and ttl > 0:
+        _remember(key, now + ttl, raw)
+    return json.loads(raw)
+
+
+def put_info(redis_conn, video_id: str, profile: str, info: dict) -> bool:
+    """
+    Cache an extraction result.
+
+    Returns:
+        bool: True if the entry was cached (False for live streams or stream
+        URLs about to expire)
+    """
+    if INFO_CACHE_TTL_SECONDS <= 0:
+        return False
+    if info.get("_type", "video") != "video" or info.get("is_live") \
+            or info.get("live_status") in _UNCACHEABLE_LIVE_STATUSES:
+        return False
+    try:
+        trimmed = trim_info(info)
+        ttl = _entry_ttl(trimmed)
+        if ttl <= 0:
+            return False
+        raw = json.dumps(trimmed, separators=(",", ":"))
+    except Exception as e:
+        logger.warning(f"Info cache: cannot serialize {video_id}: {e}")
+        return False
+    key = cache_key(video_id, profile)
+    _remember(key, time.time() + ttl, raw)
+    try:
+        redis_conn.setex(key, ttl, raw)
+    except Exception as e:
+        logger.debug(f"Info cache: Redis store failed for {video_id}: {e}")
+    return True
+
+
+def invalidate(redis_conn, video_id: str, profile: str) -> None:
+    """Forget an entry, e.g. after its stream URLs were rejected by YouTube."""
+    key = cache_key(video_id, profile)
+    with _local_lock:
+        _local.pop(key, None)
+    try:
+        redis_conn.delete(key)
+    except Exception:
+        pass
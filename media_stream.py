@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Media Stream Module
+
+Pass-through streaming of a video straight from its source into an HTTP
+response, without waiting for (or requiring) a file in TASKS_DIR.
+
+Architecture:
+- The caller resolves the formats with yt-dlp (extraction + pre-flight probe,
+  as for queued downloads); this module only moves bytes
+- One ffmpeg process per stream reads the selected format URLs (one, or video
+  + audio) with the extractor's HTTP headers and remuxes them (-c copy, no
+  re-encoding) to stdout:
+  - mp4/m4a sources -> fragmented MP4 (empty moov, one fragment per keyframe),
+    playable while it arrives
+  - anything else (webm/opus) -> Matroska, which is streamable as is
+- The response body iterates over ffmpeg's stdout in STREAM_CHUNK_SIZE reads.
+  Backpressure is the pipe itself: when the client reads slowly the WSGI
+  server stops pulling, ffmpeg blocks on its write and stops reading from the
+  source; nothing is buffered beyond the pipe
+- A client disconnect closes the iterator, which kills ffmpeg
+- Optional tee: every chunk is also written to a .part file that is renamed
+  when the stream ended cleanly, so the result can be served again later
+
+Only http(s) and HLS sources can be read by ffmpeg directly; other protocols
+(e.g. segmented DASH) are rejected by stream_plan().
+"""
+
+import os
+import signal
+import logging
+import subprocess
+
+logger = logging.getLogger(__name__)
+
+STREAM_CHUNK_SIZE = 256 * 1024
+# Give up when a source read stalls this long (ffmpeg -rw_timeout)
+STREAM_READ_TIMEOUT_SECONDS = int(os.getenv('STREAM_READ_TIMEOUT_SECONDS', '30'))
+STREAMABLE_PROTOCOLS = ("http", "https", "m3u8", "m3u8_native")
+_MP4_EXTS = ("mp4", "m4a", "m4v", "mov")
+
+
+class StreamError(Exception):
+    """ffmpeg could not produce any output for the stream."""
+
+
+def stream_plan(selected: dict) -> dict | None:
+    """
+    Container and inputs for streaming a processed format selection.
+
+    Args:
+        selected: yt-dlp info of the selected format (requested_formats when merged)
+
+    Returns:
+        dict | None: {"inputs": [(url, headers)], "ffmpeg_format", "mimetype", "ext"},
+        or None if a part cannot be read by ffmpeg
+    """
+    parts = selected.get("requested_formats") or [selected]
+    inputs = []
+    for part in parts:
+        if part.get("protocol", "https") not in STREAMABLE_PROTOCOLS or not part.get("url"):
+            return None
+        inputs.append((part["url"], part.get("http_headers") or {}))
+    if all(part.get("ext") in _MP4_EXTS for part in parts):
+        return {"inputs": inputs, "ffmpeg_format": "mp4", "mimetype": "video/mp4", "ext": "mp4"}
+    return {"inputs": inputs, "ffmpeg_format": "matroska", "mimetype": "video/x-matroska", "ext": "mkv"}
+
+
+def ffmpeg_command(plan: dict) -> list:
+    """ffmpeg argv remuxing the plan's inputs to stdout."""
+    cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-nostdin"]
+    for url, headers in plan["inputs"]:
+        if headers:
+            cmd += ["-headers", "".join(f"{k}: {v}\r\n" for k, v in headers.items())]
+        cmd += ["-rw_timeout", str(STREAM_READ_TIMEOUT_SECONDS * 1_000_000), "-i", url]
+    if len(plan["inputs"]) == 1:
+        # "?" keeps audio-only / video-only selections working
+        cmd += ["-map", "0:v:0?", "-map", "0:a:0?"]
+    else:
+        # Merged selection: video part first, then audio part(s)
+        cmd += ["-map", "0:v:0"]
+        for i in range(1, len(plan["inputs"])):
+            cmd += ["-map", f"{i}:a:0"]
+    cmd += ["-c", "copy"]
+    if plan["ffmpeg_format"] == "mp4":
+        cmd += ["-movflags", "frag_keyframe+empty_moov+default_base_moof"]
+    cmd += ["-f", plan["ffmpeg_format"], "pipe:1"]
+    return cmd
+
+
+class MediaStream:
+    """
+    Running ffmpeg remux of one stream.
+
+    Args:
+        plan: Result of stream_plan()
+        tee_path: Also write the output here (via <tee_path>.part), or None
+        label: Prefix for log lines (task id)
+    """
+
+    def __init__(self, plan: dict, tee_path: str | None = None, label: str = ""):
+        self.plan = plan
+        self.tee_path = tee_path
+        self.label = label
+        self.bytes_sent = 0
+        self.completed = False
+        self._proc = None
+        self._tee = None
+        self._first = b""
+
+    def start(self) -> None:
+        """
+        Start ffmpeg and wait for its first output (container header).
+
+        Raises:
+            StreamError: ffmpeg exited without output (source unreachable,
+            unsupported codecs for the container, ...)
+        """
+        self._proc = subprocess.Popen(
+            ffmpeg_command(self.plan),
+            stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            bufsize=0,
+        )
+        self._first = self._proc.stdout.read(STREAM_CHUNK_SIZE)
+        if not self._first:
+            stderr = self._proc.stderr.read().decode("utf-8", "replace").strip()
+            self._proc.wait()
+            raise StreamError(stderr[-500:] or f"ffmpeg exited with code {self._proc.returncode}")
+        if self.tee_path:
+            self._tee = open(f"{self.tee_path}.part", "wb")
+
+    def __iter__(self):
+        try:
+            chunk = self._first
+            self._first = b""
+            while chunk:
+                if self._tee is not None:
+                    self._tee.write(chunk)
+                self.bytes_sent += len(chunk)
+                yield chunk
+                chunk = self._proc.stdout.read(STREAM_CHUNK_SIZE)
+            self.completed = self._proc.wait() == 0
+            if not self.completed:
+                stderr = self._proc.stderr.read().decode("utf-8", "replace").strip()
+                logger.error(f"[{self.label[:8]}] Stream ended with ffmpeg error: {stderr[-300:]}")
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        """Stop ffmpeg (client gone or stream finished) and settle the tee file."""
+        if self._proc is not None and self._proc.poll() is None:
+            self._proc.send_signal(signal.SIGKILL)
+            self._proc.wait()
+        if self._proc is not None:
+            for pipe in (self._proc.stdout, self._proc.stderr):
+                pipe.close()
+        if self._tee is not None:
+            self._tee.close()
+            self._tee = None
+            if self.completed:
+                os.replace(f"{self.tee_path}.part", self.tee_path)
+            else:
+                try:
+                    os.remove(f"{self.tee_path}.part")
+                except OSError:
+                    pass
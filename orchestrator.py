@@ -9,7 +9,7 @@ Startup sequence:
 2. Orchestrator starts
    a) Wait for Redis ready
    b) Recovery: scan /app/tasks, load metadata.json → populate Redis
-   c) Check MAX_CONCURRENT_TASKS configuration
+   c) Check download capacity (slots published by consumers)
    d) Start managing worker queue (FIFO distribution)
 3. Gunicorn (HTTP workers) start after orchestrator is ready
 """
@@ -21,9 +21,36 @@ import json
 import logging
 import threading
 import redis
-import requests
 from datetime import datetime, timedelta
 from task_sync import save_and_sync_metadata
+from task_index import (
+    REDIS_DUE_RETRY_KEY,
+    REDIS_INDEX_UPDATED_KEY,
+    due_task_ids,
+    index_task,
+    unindex_task,
+)
+from webhook_delivery import (
+    WEBHOOK_MAX_RETRY_ATTEMPTS,
+    WEBHOOK_RETRY_DELAY_SECONDS,
+    WEBHOOK_WORKERS,
+    WebhookDispatcher,
+    enqueue_webhook,
+    needs_redelivery,
+)
+from result_store import finish_leader, sweep_blobs
+from partial_downloads import RESUMED_FLAG, prune_for_resume
+from task_queue import (
+    REDIS_ACTIVE_TASKS_KEY,
+    enqueue_task,
+    expired_leases,
+    forget_task,
+    orphaned_processing_tasks,
+    queue_length,
+    reclaim_task,
+    reset_leases,
+    total_capacity,
+)
 
 # Force unbuffered stdout/stderr for immediate log visibility
 sys.stdout.reconfigure(line_buffering=True)
@@ -52,8 +79,13 @@ REDIS_DB = int(os.getenv('REDIS_DB', 0))
 
 # Task configuration — fixed limits for public version
 TASKS_DIR = os.getenv('TASKS_DIR', '/app/tasks')
-MAX_CONCURRENT_TASKS = 2          # Fixed: public version limit
-MAX_CONCURRENT_TASKS_LIMIT = 2    # Hard ceiling
+YTDLP_CACHE_DIR = os.getenv('YTDLP_CACHE_DIR', os.path.join(TASKS_DIR, '.cache', 'yt-dlp'))
+# Extracted once at startup so player JS and signature solutions are cached
+# before the first task; empty disables the prewarm
+YTDLP_PREWARM_URL = os.getenv('YTDLP_PREWARM_URL', 'https://www.youtube.com/watch?v=jNQXAC9IVRw')
+YTDLP_PREWARM_TIMEOUT_SECONDS = int(os.getenv('YTDLP_PREWARM_TIMEOUT_SECONDS', '90'))
+# Initial download slots; consumers adapt them and publish the current value
+MAX_CONCURRENT_TASKS = int(os.getenv('MAX_CONCURRENT_TASKS', '2'))
 TASK_TTL_MINUTES = 1440           # Fixed: 24 hours
 
 # Recovery & retry config
@@ -61,11 +93,11 @@ MAX_TASK_RETRIES = int(os.getenv('MAX_TASK_RETRIES', '3'))
 RETRY_DELAY_SECONDS = int(os.getenv('RETRY_DELAY_SECONDS', '60'))
 TASK_HEARTBEAT_INTERVAL_SECONDS = int(os.getenv('TASK_HEARTBEAT_INTERVAL_SECONDS', '30'))
 TASK_HEARTBEAT_TIMEOUT_SECONDS = int(os.getenv('TASK_HEARTBEAT_TIMEOUT_SECONDS', '90'))
-WEBHOOK_MAX_RETRY_ATTEMPTS = int(os.getenv('WEBHOOK_MAX_RETRY_ATTEMPTS', '5'))
-WEBHOOK_RETRY_DELAY_SECONDS = int(os.getenv('WEBHOOK_RETRY_DELAY_SECONDS', '60'))
-WEBHOOK_BACKGROUND_INTERVAL_SECONDS = int(os.getenv('WEBHOOK_BACKGROUND_INTERVAL_SECONDS', '900'))
 CLEANUP_INTERVAL_SECONDS = int(os.getenv('CLEANUP_INTERVAL_SECONDS', '3600'))
-MAX_QUEUED_TASKS = 50
+# Directory listing of TASKS_DIR (orphans, tasks missing from the index);
+# regular passes use the index only
+FULL_CLEANUP_INTERVAL_SECONDS = int(os.getenv('FULL_CLEANUP_INTERVAL_SECONDS', '86400'))
+MAX_QUEUED_TASKS = int(os.getenv('MAX_QUEUED_TASKS', '50'))  # enforced by app.py admission control
 MAX_CLIENT_META_BYTES = int(os.getenv('MAX_CLIENT_META_BYTES', str(16 * 1024)))
 MAX_CLIENT_META_DEPTH = int(os.getenv('MAX_CLIENT_META_DEPTH', '5'))
 MAX_CLIENT_META_KEYS = int(os.getenv('MAX_CLIENT_META_KEYS', '200'))
@@ -79,10 +111,10 @@ API_KEY_ENABLED = bool(API_KEY)
 
 # Download limits
 MAX_DOWNLOAD_VIDEO_SIZE_MB = int(os.getenv('MAX_DOWNLOAD_VIDEO_SIZE_MB', '2048'))
+# Failures that retrying cannot fix (e.g. rejected by the pre-flight size probe)
+NON_RECOVERABLE_ERROR_TYPES = ('file_too_large', 'size_limit_exceeded')
 
-# Redis keys
-REDIS_ACTIVE_TASKS_KEY = "tasks:active"
-REDIS_QUEUED_TASKS_KEY = "queue:queued"
+# Redis keys (queue and lease keys live in task_queue)
 REDIS_TASK_PREFIX = "task:"
 REDIS_RECOVERY_FLAG = "system:recovery_in_progress"
 
@@ -93,8 +125,8 @@ def cleanup_task_from_redis(redis_client, task_id: str):
         if not redis_client:
             return
         redis_client.delete(f"{REDIS_TASK_PREFIX}{task_id}")
-        redis_client.hdel(REDIS_ACTIVE_TASKS_KEY, task_id)
-        redis_client.lrem(REDIS_QUEUED_TASKS_KEY, 0, task_id)
+        forget_task(redis_client, task_id)
+        unindex_task(redis_client, task_id)
     except Exception:
         pass
 
@@ -146,6 +178,11 @@ class TaskOrchestrator:
                     return False
         return False
 
+    @staticmethod
+    def _error_type(error_info: dict):
+        # app.py stores it as "error_type" (api_commons), older metadata as "type"
+        return error_info.get('error_type') or error_info.get('type')
+
     def _is_error_recoverable(self, error_msg: str) -> bool:
         error_lower = str(error_msg).lower()
         recoverable_keywords = [
@@ -168,13 +205,34 @@ class TaskOrchestrator:
                 return False
         return True
 
+    def _prune_for_resume(self, task_id: str, metadata: dict, prior: dict, log_prefix: str = ""):
+        """
+        Keep the resumable partials of the previous attempt (see partial_downloads).
+
+        Called before a task is re-enqueued; marks metadata (written by the
+        caller) so that a resumed attempt that fails again starts clean.
+        """
+        kept, removed = prune_for_resume(os.path.join(TASKS_DIR, task_id), prior)
+        # A stream tee is never resumed; the retry is a regular download
+        metadata.pop('streamed', None)
+        if kept:
+            metadata[RESUMED_FLAG] = True
+            logger.info(f"{log_prefix}[{task_id[:8]}] ♻️ Resuming from partial download: {', '.join(kept)}")
+        else:
+            metadata.pop(RESUMED_FLAG, None)
+        if removed:
+            logger.info(f"{log_prefix}[{task_id[:8]}] cleaned: {', '.join(removed)}")
+
     def recovery_initialize_redis_from_disk(self):
         """Recovery: Scan /app/tasks and populate Redis from metadata.json files."""
         if not os.path.exists(TASKS_DIR):
             return (0, 0)
 
         try:
-            task_ids = [d for d in os.listdir(TASKS_DIR) if os.path.isdir(os.path.join(TASKS_DIR, d))]
+            task_ids = [
+                d for d in os.listdir(TASKS_DIR)
+                if not d.startswith('.') and os.path.isdir(os.path.join(TASKS_DIR, d))
+            ]
         except Exception as e:
             logger.error(f"Recovery: failed to scan tasks directory: {e}")
             return (0, 0)
@@ -214,6 +272,10 @@ class TaskOrchestrator:
                     ttl_seconds,
                     json.dumps(metadata)
                 )
+                # Rebuilds the listing index and the webhook outbox if Redis lost them
+                index_task(self.redis, metadata)
+                if needs_redelivery(metadata):
+                    enqueue_webhook(self.redis, metadata, tasks_dir=TASKS_DIR)
                 initialized += 1
 
                 is_recoverable_error = False
@@ -222,8 +284,9 @@ class TaskOrchestrator:
                     if retry_count < MAX_TASK_RETRIES:
                         error_info = metadata.get('error', {})
                         if isinstance(error_info, dict):
-                            if error_info.get('recoverable') != False:
-                                error_message = error_info.get('message', '')
+                            if (error_info.get('recoverable') != False
+                                    and self._error_type(error_info) not in NON_RECOVERABLE_ERROR_TYPES):
+                                error_message = error_info.get('message') or error_info.get('error', '')
                                 if self._is_error_recoverable(error_message):
                                     is_recoverable_error = True
                         else:
@@ -232,9 +295,17 @@ class TaskOrchestrator:
 
                 incomplete_statuses = ['queued', 'downloading', 'processing']
                 if task_status in incomplete_statuses or is_recoverable_error:
-                    if is_recoverable_error:
+                    prior = dict(metadata)
+                    try:
+                        self._prune_for_resume(task_id, metadata, prior, "Recovery: ")
+                    except Exception as e:
+                        logger.warning(f"Recovery: [{task_id[:8]}] cleanup failed: {e}")
+                    if (is_recoverable_error or task_status != 'queued'
+                            or bool(metadata.get(RESUMED_FLAG)) != bool(prior.get(RESUMED_FLAG))):
+                        # Consumers only pick up tasks whose status is 'queued'
                         metadata['status'] = 'queued'
-                        metadata['retry_count'] = metadata.get('retry_count', 0) + 1
+                        if is_recoverable_error:
+                            metadata['retry_count'] = metadata.get('retry_count', 0) + 1
                         try:
                             with open(metadata_path, 'w') as f:
                                 json.dump(metadata, f, indent=2)
@@ -243,29 +314,12 @@ class TaskOrchestrator:
                                 ttl_seconds,
                                 json.dumps(metadata)
                             )
+                            index_task(self.redis, metadata)
                         except Exception:
                             pass
 
                     try:
-                        task_dir = os.path.join(TASKS_DIR, task_id)
-                        try:
-                            cleaned_items = []
-                            for item in os.listdir(task_dir):
-                                item_path = os.path.join(task_dir, item)
-                                if item != "metadata.json":
-                                    if os.path.isfile(item_path):
-                                        os.remove(item_path)
-                                        cleaned_items.append(f"file:{item}")
-                                    elif os.path.isdir(item_path):
-                                        import shutil
-                                        shutil.rmtree(item_path)
-                                        cleaned_items.append(f"dir:{item}")
-                            if cleaned_items:
-                                logger.info(f"Recovery: [{task_id[:8]}] cleaned: {', '.join(cleaned_items)}")
-                        except Exception as e:
-                            logger.warning(f"Recovery: [{task_id[:8]}] cleanup failed: {e}")
-
-                        self.redis.rpush(REDIS_QUEUED_TASKS_KEY, task_id)
+                        enqueue_task(self.redis, task_id, task=metadata)
                         enqueued += 1
                         logger.info(f"Recovery: [{task_id[:8]}] re-enqueued (was {task_status})")
                     except Exception as e:
@@ -292,10 +346,7 @@ class TaskOrchestrator:
             return 0
 
     def get_queued_count(self) -> int:
-        try:
-            return self.redis.llen(REDIS_QUEUED_TASKS_KEY)
-        except Exception:
-            return 0
+        return queue_length(self.redis)
 
     def check_and_start_workers(self):
         try:
@@ -303,182 +354,71 @@ class TaskOrchestrator:
             active = self.get_active_count()
             queued = self.get_queued_count()
             if queued > 0 and active > 0:
-                logger.debug(f"📊 Queue: {active}/{MAX_CONCURRENT_TASKS} active | {queued} pending")
+                capacity = total_capacity(self.redis)
+                logger.debug(f"📊 Queue: {active}/{capacity if capacity is not None else '?'} active | {queued} pending")
         except Exception as e:
             logger.error(f"Orchestration error: {e}")
 
     def _check_crashed_tasks(self):
         try:
-            active_tasks = self.redis.hgetall(REDIS_ACTIVE_TASKS_KEY)
-            if not active_tasks:
-                return
-
-            now = datetime.now()
-            timeout = timedelta(seconds=TASK_HEARTBEAT_TIMEOUT_SECONDS)
-
-            for task_id, task_info_raw in active_tasks.items():
-                if isinstance(task_id, bytes):
-                    task_id = task_id.decode('utf-8')
-                if isinstance(task_info_raw, bytes):
-                    task_info_raw = task_info_raw.decode('utf-8')
-
-                try:
-                    task_info = json.loads(task_info_raw)
-                except Exception:
+            # Only tasks whose lease actually expired are touched — O(expired)
+            for task_id in expired_leases(self.redis):
+                lease = reclaim_task(self.redis, task_id)
+                if lease is None:
                     continue
+                logger.warning(
+                    f"[{task_id[:8]}] 💀 Task crashed (lease expired, no heartbeat for "
+                    f"{TASK_HEARTBEAT_TIMEOUT_SECONDS}s, worker={lease.get('worker_id', '?')})"
+                )
+                self._requeue_crashed_task(task_id)
 
-                heartbeat_str = task_info.get('heartbeat')
-                if not heartbeat_str:
-                    continue
-
-                try:
-                    heartbeat = datetime.fromisoformat(heartbeat_str)
-                except Exception:
-                    continue
-
-                if now - heartbeat > timeout:
-                    retry_count = task_info.get('retry_count', 0)
-                    logger.warning(f"[{task_id[:8]}] 💀 Task crashed (no heartbeat for {TASK_HEARTBEAT_TIMEOUT_SECONDS}s)")
-
-                    self.redis.hdel(REDIS_ACTIVE_TASKS_KEY, task_id)
-
-                    metadata = load_task_metadata(task_id)
-                    if metadata:
-                        new_retry_count = retry_count + 1
-                        metadata['retry_count'] = new_retry_count
-
-                        if new_retry_count >= MAX_TASK_RETRIES:
-                            metadata['status'] = 'failed'
-                            metadata['error'] = {
-                                'type': 'WORKER_CRASHED',
-                                'message': f'Worker crashed {new_retry_count} times',
-                                'recoverable': False
-                            }
-                            logger.error(f"[{task_id[:8]}] ⛔ Max retries after crash ({new_retry_count}/{MAX_TASK_RETRIES})")
-                        else:
-                            metadata['status'] = 'queued'
-                            self.redis.rpush(REDIS_QUEUED_TASKS_KEY, task_id)
-                            logger.info(f"[{task_id[:8]}] 🔄 Re-enqueued for retry ({new_retry_count}/{MAX_TASK_RETRIES})")
-
-                        save_task_metadata(self.redis, task_id, metadata)
+            for task_id in orphaned_processing_tasks(self.redis):
+                logger.warning(f"[{task_id[:8]}] 💀 Task orphaned by dead worker before lease")
+                self._requeue_crashed_task(task_id)
 
         except Exception as e:
             err_str = str(e).lower()
             if 'timeout' not in err_str and 'timed out' not in err_str:
                 logger.error(f"Crashed tasks check error: {e}")
 
-    def webhook_resender_loop(self):
-        """Background loop: retry failed webhook notifications."""
-        while self.running:
-            try:
-                time.sleep(60)
-
-                if not os.path.exists(TASKS_DIR):
-                    continue
-
-                scanned = 0
-                retried = 0
-
-                for task_id in os.listdir(TASKS_DIR):
-                    task_path = os.path.join(TASKS_DIR, task_id)
-                    if not os.path.isdir(task_path):
-                        continue
-
-                    scanned += 1
-                    metadata_path = os.path.join(task_path, "metadata.json")
-                    if not os.path.exists(metadata_path):
-                        continue
-
-                    try:
-                        with open(metadata_path, 'r') as f:
-                            metadata_raw = json.load(f)
-                        if isinstance(metadata_raw, list) and len(metadata_raw) > 0:
-                            metadata = metadata_raw[0]
-                        elif isinstance(metadata_raw, dict):
-                            metadata = metadata_raw
-                        else:
-                            continue
-                    except Exception:
-                        continue
-
-                    status = metadata.get('status')
-                    terminal_statuses = {'completed', 'failed', 'error', 'cancelled'}
-                    if status not in terminal_statuses:
-                        continue
-
-                    webhook_state = metadata.get('webhook')
-                    if not webhook_state:
-                        continue
-
-                    webhook_status = webhook_state.get('status', 'unknown')
-                    if webhook_status == 'delivered':
-                        continue
-
-                    attempt = int(webhook_state.get('attempts', 0) or 0)
-                    if attempt <= 0:
-                        continue
-
-                    next_retry = webhook_state.get('next_retry')
-                    if next_retry:
-                        try:
-                            next_retry_dt = datetime.fromisoformat(next_retry)
-                            if datetime.now() < next_retry_dt:
-                                continue
-                        except Exception:
-                            pass
-
-                    webhook_url = webhook_state.get('url')
-                    if not webhook_url:
-                        continue
-
-                    logger.info(f"[{task_id[:8]}] Background webhook retry (attempt {attempt + 1}) → {webhook_url}")
-
-                    try:
-                        headers = {"Content-Type": "application/json"}
-                        webhook_headers = webhook_state.get('headers', {})
-                        if webhook_headers:
-                            for k, v in webhook_headers.items():
-                                if k.lower() != 'content-type':
-                                    headers[k] = v
-
-                        response = requests.post(webhook_url, json=metadata, headers=headers, timeout=30)
-
-                        webhook_state['attempts'] = attempt + 1
-                        webhook_state['last_attempt'] = datetime.now().isoformat()
-
-                        if 200 <= response.status_code < 300:
-                            webhook_state['status'] = 'delivered'
-                            webhook_state['last_status'] = response.status_code
-                            webhook_state['next_retry'] = None
-                            logger.info(f"[{task_id[:8]}] ✓ Background webhook delivered ({response.status_code})")
-                        else:
-                            webhook_state['status'] = 'failed'
-                            webhook_state['last_status'] = response.status_code
-                            retry_delay = min(300, 60 * (2 ** attempt))
-                            webhook_state['next_retry'] = (datetime.now() + timedelta(seconds=retry_delay)).isoformat()
-                            logger.warning(f"[{task_id[:8]}] ✗ Background webhook failed ({response.status_code}), next retry in {retry_delay}s")
-
-                        metadata['webhook'] = webhook_state
-                        save_and_sync_metadata(self.redis, task_id, metadata, TASKS_DIR)
-                        retried += 1
-
-                    except Exception as webhook_error:
-                        webhook_state['attempts'] = attempt + 1
-                        webhook_state['last_attempt'] = datetime.now().isoformat()
-                        webhook_state['status'] = 'failed'
-                        webhook_state['last_error'] = str(webhook_error)
-                        retry_delay = min(300, 60 * (2 ** attempt))
-                        webhook_state['next_retry'] = (datetime.now() + timedelta(seconds=retry_delay)).isoformat()
-                        logger.error(f"[{task_id[:8]}] ✗ Background webhook error: {webhook_error}")
-                        metadata['webhook'] = webhook_state
-                        save_and_sync_metadata(self.redis, task_id, metadata, TASKS_DIR)
-                        retried += 1
-
-                if retried > 0:
-                    logger.debug(f"Webhook resender: scanned {scanned}, {retried} retried")
+    def _requeue_crashed_task(self, task_id: str):
+        metadata = load_task_metadata(task_id)
+        if not metadata:
+            return
+        if metadata.get('status') not in ('queued', 'processing', 'downloading'):
+            # Worker finished the task after all; nothing to recover
+            return
 
+        new_retry_count = metadata.get('retry_count', 0) + 1
+        metadata['retry_count'] = new_retry_count
+
+        if new_retry_count >= MAX_TASK_RETRIES:
+            metadata['status'] = 'failed'
+            metadata['error'] = {
+                'type': 'WORKER_CRASHED',
+                'message': f'Worker crashed {new_retry_count} times',
+                'recoverable': False
+            }
+            save_task_metadata(self.redis, task_id, metadata)
+            logger.error(f"[{task_id[:8]}] ⛔ Max retries after crash ({new_retry_count}/{MAX_TASK_RETRIES})")
+            if metadata.get('dedup_key'):
+                # Tasks that joined this download would otherwise wait forever
+                for follower_id in finish_leader(self.redis, metadata['dedup_key'], task_id):
+                    follower = load_task_metadata(follower_id)
+                    if follower and follower.get('status') == 'queued':
+                        follower['status'] = 'failed'
+                        follower['error'] = metadata['error']
+                        save_task_metadata(self.redis, follower_id, follower)
+        else:
+            prior = dict(metadata)
+            metadata['status'] = 'queued'
+            try:
+                self._prune_for_resume(task_id, metadata, prior)
             except Exception as e:
-                logger.error(f"Webhook resender error: {e}")
+                logger.warning(f"[{task_id[:8]}] Partial cleanup failed: {e}")
+            save_task_metadata(self.redis, task_id, metadata)
+            enqueue_task(self.redis, task_id, task=metadata)
+            logger.info(f"[{task_id[:8]}] 🔄 Re-enqueued for retry ({new_retry_count}/{MAX_TASK_RETRIES})")
 
     def recovery_check_failed_tasks(self):
         """Background loop: check failed tasks and mark recoverable ones for retry."""
@@ -486,37 +426,22 @@ class TaskOrchestrator:
             try:
                 time.sleep(120)
 
-                if not os.path.exists(TASKS_DIR):
-                    continue
-
                 checked = 0
                 recovered = 0
                 skipped = 0
 
-                for task_id in os.listdir(TASKS_DIR):
-                    task_path = os.path.join(TASKS_DIR, task_id)
-                    if not os.path.isdir(task_path):
-                        continue
-
+                # Only failed tasks not yet ruled out (see task_index)
+                for task_id in due_task_ids(self.redis, REDIS_DUE_RETRY_KEY):
                     checked += 1
-                    metadata_path = os.path.join(task_path, "metadata.json")
-                    if not os.path.exists(metadata_path):
-                        continue
-
-                    try:
-                        with open(metadata_path, 'r') as f:
-                            metadata_raw = json.load(f)
-                        if isinstance(metadata_raw, list) and len(metadata_raw) > 0:
-                            metadata = metadata_raw[0]
-                        elif isinstance(metadata_raw, dict):
-                            metadata = metadata_raw
-                        else:
-                            continue
-                    except Exception:
+                    metadata_path = os.path.join(TASKS_DIR, task_id, "metadata.json")
+                    metadata = load_task_metadata(task_id)
+                    if metadata is None:
+                        self.redis.zrem(REDIS_DUE_RETRY_KEY, task_id)
                         continue
 
                     status = metadata.get('status')
                     if status not in ['failed', 'error']:
+                        index_task(self.redis, metadata)
                         continue
 
                     retry_count = metadata.get('retry_count', 0)
@@ -524,37 +449,34 @@ class TaskOrchestrator:
 
                     if retry_count >= max_retries:
                         skipped += 1
+                        self.redis.zrem(REDIS_DUE_RETRY_KEY, task_id)
                         continue
 
                     error_info = metadata.get('error', {})
                     if isinstance(error_info, dict):
                         if error_info.get('recoverable') is False:
                             skipped += 1
+                            self.redis.zrem(REDIS_DUE_RETRY_KEY, task_id)
                             continue
-                        if error_info.get('type') in ('file_too_large', 'size_limit_exceeded'):
+                        if self._error_type(error_info) in NON_RECOVERABLE_ERROR_TYPES:
                             skipped += 1
+                            self.redis.zrem(REDIS_DUE_RETRY_KEY, task_id)
                             continue
-                        error_message = error_info.get('message', '')
+                        error_message = error_info.get('message') or error_info.get('error', '')
                     else:
                         error_message = str(error_info)
 
                     if not self._is_error_recoverable(error_message):
                         skipped += 1
+                        self.redis.zrem(REDIS_DUE_RETRY_KEY, task_id)
                         continue
 
+                    prior = dict(metadata)
                     metadata['status'] = 'queued'
                     metadata['retry_count'] = retry_count + 1
 
                     try:
-                        task_dir = os.path.join(TASKS_DIR, task_id)
-                        for item in os.listdir(task_dir):
-                            if item != "metadata.json":
-                                item_path = os.path.join(task_dir, item)
-                                if os.path.isfile(item_path):
-                                    os.remove(item_path)
-                                elif os.path.isdir(item_path):
-                                    import shutil
-                                    shutil.rmtree(item_path)
+                        self._prune_for_resume(task_id, metadata, prior)
 
                         with open(metadata_path, 'w') as f:
                             json.dump(metadata, f, indent=2)
@@ -564,7 +486,8 @@ class TaskOrchestrator:
                             TASK_TTL_MINUTES * 60,
                             json.dumps(metadata)
                         )
-                        self.redis.rpush(REDIS_QUEUED_TASKS_KEY, task_id)
+                        index_task(self.redis, metadata)
+                        enqueue_task(self.redis, task_id, task=metadata)
                         logger.info(f"[{task_id[:8]}] 🔄 Re-enqueued for recovery (attempt {retry_count + 1}/{max_retries})")
                         recovered += 1
                     except Exception as e:
@@ -576,8 +499,14 @@ class TaskOrchestrator:
             except Exception as e:
                 logger.error(f"Recovery checker error: {e}")
 
-    def _do_cleanup(self):
-        """Single cleanup pass: remove expired and orphaned tasks."""
+    def _do_cleanup(self, full: bool = False):
+        """
+        Single cleanup pass: remove expired and orphaned tasks.
+
+        Regular passes only visit tasks whose last metadata write is older
+        than the TTL (tasks:index:updated); a full pass lists TASKS_DIR and
+        also finds directories unknown to the index (orphans, lost index).
+        """
         if not os.path.exists(TASKS_DIR):
             return 0, 0, 0
 
@@ -588,23 +517,42 @@ class TaskOrchestrator:
         total_size_freed = 0
 
         try:
-            for task_id in os.listdir(TASKS_DIR):
+            if full:
+                candidates = os.listdir(TASKS_DIR)
+            else:
+                candidates = due_task_ids(self.redis, REDIS_INDEX_UPDATED_KEY, now - ttl_seconds, limit=1000)
+            for task_id in candidates:
                 task_path = os.path.join(TASKS_DIR, task_id)
-                if not os.path.isdir(task_path):
+                # Dot-directories (.blobs, caches) are service data, not tasks
+                if task_id.startswith('.') or not os.path.isdir(task_path):
+                    if not full:
+                        unindex_task(self.redis, task_id)
                     continue
 
+                metadata_path = os.path.join(task_path, 'metadata.json')
+                is_orphan = not os.path.exists(metadata_path)
                 try:
-                    dir_size = sum(
-                        os.path.getsize(os.path.join(dirpath, filename))
-                        for dirpath, dirnames, filenames in os.walk(task_path)
-                        for filename in filenames
-                    )
+                    age_seconds = now - os.path.getmtime(task_path)
+                except OSError:
+                    continue
+                if not is_orphan and age_seconds <= ttl_seconds:
+                    if not full:
+                        # Touched without a metadata write (e.g. download files)
+                        self.redis.zadd(REDIS_INDEX_UPDATED_KEY, {task_id: now - age_seconds})
+                    continue
+
+                try:
+                    # Hardlinked (deduplicated) files are only freed with their last link
+                    dir_size = 0
+                    for dirpath, dirnames, filenames in os.walk(task_path):
+                        for filename in filenames:
+                            st = os.stat(os.path.join(dirpath, filename))
+                            if st.st_nlink == 1:
+                                dir_size += st.st_size
                 except Exception:
                     dir_size = 0
 
-                metadata_path = os.path.join(task_path, 'metadata.json')
-
-                if not os.path.exists(metadata_path):
+                if is_orphan:
                     try:
                         import shutil
                         shutil.rmtree(task_path, ignore_errors=True)
@@ -617,35 +565,103 @@ class TaskOrchestrator:
                     continue
 
                 try:
-                    task_mtime = os.path.getmtime(task_path)
-                    age_seconds = now - task_mtime
-
-                    if age_seconds > ttl_seconds:
-                        import shutil
-                        shutil.rmtree(task_path)
-                        cleanup_task_from_redis(self.redis, task_id)
-                        cleaned += 1
-                        total_size_freed += dir_size
-                        logger.info(f"[{task_id[:8]}] 🗑️ Removed expired | {dir_size/1024/1024:.1f} MB | age: {age_seconds/3600:.1f}h")
+                    import shutil
+                    shutil.rmtree(task_path)
+                    cleanup_task_from_redis(self.redis, task_id)
+                    cleaned += 1
+                    total_size_freed += dir_size
+                    logger.info(f"[{task_id[:8]}] 🗑️ Removed expired | {dir_size/1024/1024:.1f} MB | age: {age_seconds/3600:.1f}h")
                 except Exception:
                     pass
         except Exception as e:
             logger.error(f"Cleanup error: {e}")
 
+        try:
+            blobs_removed, blobs_freed = sweep_blobs(TASKS_DIR)
+            if blobs_removed:
+                total_size_freed += blobs_freed
+                logger.info(f"🗑️ Removed {blobs_removed} unreferenced blobs | {blobs_freed/1024/1024:.1f} MB")
+        except Exception as e:
+            logger.error(f"Blob sweep error: {e}")
+
         return cleaned, orphaned, total_size_freed
 
     def cleanup_loop(self):
         """Background loop: periodically run cleanup."""
+        last_full = time.time()
         while self.running:
             try:
                 time.sleep(CLEANUP_INTERVAL_SECONDS)
-                cleaned, orphaned, total_size_freed = self._do_cleanup()
+                full = time.time() - last_full >= FULL_CLEANUP_INTERVAL_SECONDS
+                if full:
+                    last_full = time.time()
+                cleaned, orphaned, total_size_freed = self._do_cleanup(full=full)
                 if cleaned > 0 or orphaned > 0:
                     total_size_mb = total_size_freed / 1024 / 1024
                     logger.info(f"🧹 Cleanup: {cleaned} expired, {orphaned} orphaned | {total_size_mb:.1f} MB freed")
             except Exception as e:
                 logger.error(f"Cleanup loop error: {e}")
 
+    def _clean_ytdlp_cache(self):
+        """Remove temp files left in the yt-dlp cache by interrupted writes."""
+        cutoff = time.time() - 3600
+        for root, _dirs, files in os.walk(YTDLP_CACHE_DIR):
+            for name in files:
+                if not name.endswith('.tmp'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                except OSError:
+                    pass
+
+    def prewarm_extractor(self):
+        """
+        Extract one video so the current YouTube player is fetched and its
+        signature/nsig functions solved into the shared yt-dlp cache.
+
+        Bounded by YTDLP_PREWARM_TIMEOUT_SECONDS; a failed or slow prewarm only
+        delays the first task, it never blocks startup.
+        """
+        os.makedirs(YTDLP_CACHE_DIR, exist_ok=True)
+        self._clean_ytdlp_cache()
+        if not YTDLP_PREWARM_URL:
+            return
+
+        def _extract():
+            try:
+                import yt_dlp
+                opts = {
+                    'noplaylist': True,
+                    'quiet': True,
+                    'no_warnings': True,
+                    'cachedir': YTDLP_CACHE_DIR,
+                }
+                try:
+                    from yt_dlp_plugins.extractor.getpot_bgutil import GetPotBgUtilIE  # noqa: F401
+                    opts['extractor_args'] = {'youtube': {'pot_provider': 'bgutil'}}
+                except ImportError:
+                    pass
+                with yt_dlp.YoutubeDL(opts) as ydl:
+                    ydl.extract_info(YTDLP_PREWARM_URL, download=False, process=False)
+                result['ok'] = True
+            except Exception as e:
+                result['error'] = str(e)[:200]
+
+        result = {}
+        started = time.time()
+        worker = threading.Thread(target=_extract, name='ytdlp-prewarm', daemon=True)
+        worker.start()
+        worker.join(YTDLP_PREWARM_TIMEOUT_SECONDS)
+        elapsed = time.time() - started
+        if result.get('ok'):
+            logger.info(f"  🔥 yt-dlp prewarmed in {elapsed:.1f}s (cache: {YTDLP_CACHE_DIR})")
+        elif worker.is_alive():
+            logger.warning(f"  ⚠️  yt-dlp prewarm still running after {YTDLP_PREWARM_TIMEOUT_SECONDS}s, continuing startup")
+        else:
+            logger.warning(f"  ⚠️  yt-dlp prewarm failed: {result.get('error')}")
+
     def run(self):
         """Main orchestrator loop."""
         if not self.wait_for_redis():
@@ -653,12 +669,14 @@ class TaskOrchestrator:
             sys.exit(1)
 
         try:
-            self.redis.delete(REDIS_ACTIVE_TASKS_KEY)
-            logger.debug("  🧹 Cleared active tasks markers (startup reset)")
+            # Unfinished tasks are re-enqueued from disk below, so stale
+            # leases and processing lists would only cause double runs
+            reset_leases(self.redis)
+            logger.debug("  🧹 Cleared active tasks markers and leases (startup reset)")
         except Exception as e:
             logger.warning(f"  ⚠️  Failed to clear active tasks: {e}")
 
-        cleaned, orphaned, total_size = self._do_cleanup()
+        cleaned, orphaned, total_size = self._do_cleanup(full=True)
         if cleaned > 0 or orphaned > 0:
             total_size_mb = total_size / 1024 / 1024
             logger.info(f"  🧹 Startup cleanup: {cleaned} expired, {orphaned} orphaned | {total_size_mb:.1f} MB freed")
@@ -674,9 +692,9 @@ class TaskOrchestrator:
             logger.info(" ")
             logger.info("⚙️  System Configuration:")
             logger.info(f"   🔌 Redis:         {REDIS_HOST}:{REDIS_PORT} (db {REDIS_DB})")
-            logger.info(f"   📦 Tasks:         max_concurrent={MAX_CONCURRENT_TASKS}, max_queued={MAX_QUEUED_TASKS}, ttl={TASK_TTL_MINUTES}m (24h)")
+            logger.info(f"   📦 Tasks:         initial_concurrent={MAX_CONCURRENT_TASKS} (adaptive), max_queued={MAX_QUEUED_TASKS}, ttl={TASK_TTL_MINUTES}m (24h)")
             logger.info(f"   🔄 Recovery:      max_retries={MAX_TASK_RETRIES}, delay={RETRY_DELAY_SECONDS}s")
-            logger.info(f"   📨 Webhook:       max_retries={WEBHOOK_MAX_RETRY_ATTEMPTS}, retry_delay={WEBHOOK_RETRY_DELAY_SECONDS}s")
+            logger.info(f"   📨 Webhook:       workers={WEBHOOK_WORKERS}, max_retries={WEBHOOK_MAX_RETRY_ATTEMPTS}, retry_delay={WEBHOOK_RETRY_DELAY_SECONDS}s")
             logger.info(f"   🧹 Cleanup:       every {CLEANUP_INTERVAL_SECONDS}s")
             logger.info(f"   📥 Video Limits:  max_size={MAX_DOWNLOAD_VIDEO_SIZE_MB}MB")
             logger.info(f"   📝 Metadata:      max_bytes={MAX_CLIENT_META_BYTES}B, max_depth={MAX_CLIENT_META_DEPTH}, max_keys={MAX_CLIENT_META_KEYS}")
@@ -722,8 +740,8 @@ class TaskOrchestrator:
             for h in root_logger.handlers:
                 h.setFormatter(timestamp_formatter)
 
-        webhook_thread = threading.Thread(target=self.webhook_resender_loop, name='webhook-resender', daemon=True)
-        webhook_thread.start()
+        self.webhooks = WebhookDispatcher(self.redis, TASKS_DIR)
+        self.webhooks.start()
 
         recovery_thread = threading.Thread(target=self.recovery_check_failed_tasks, name='recovery-checker', daemon=True)
         recovery_thread.start()
@@ -731,6 +749,10 @@ class TaskOrchestrator:
         cleanup_thread = threading.Thread(target=self.cleanup_loop, name='task-cleanup', daemon=True)
         cleanup_thread.start()
 
+        # Before system-ready: workers wait for it, so their first task
+        # already finds the player solved in the cache
+        self.prewarm_extractor()
+
         try:
             with open(self.system_ready_file, 'w') as f:
                 f.write('ready\n')
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Partial Downloads Module
+
+Decides which files of an interrupted download are kept so the retry resumes
+instead of starting over (yt-dlp continuedl).
+
+Architecture:
+- yt-dlp leaves these in the task directory when a download dies:
+  - <name>.part                    bytes of a single-file download (resumed
+                                   with a Range request from its size)
+  - <name>.ytdl                    fragment state of a DASH/HLS download
+                                   (index of the next fragment; its .part
+                                   holds the fragments before it)
+  - <name>.part-Frag<N>[.part]     one fragment in flight - always dropped,
+                                   the fragment is fetched again
+  - <name>.f<format_id>.<ext>      finished part of a merged format; yt-dlp
+                                   skips parts that already exist
+  - <name>.temp.<ext>              unfinished ffmpeg merge/fixup output -
+                                   always dropped, it is redone from the parts
+- Files are only resumed when yt-dlp wrote them: the download worker records
+  the selected format as metadata["download_format_id"] right before the
+  download starts. A task without it (e.g. a /stream_video tee, whose .part is
+  remuxed ffmpeg output) starts clean, since yt-dlp would append raw source
+  bytes to it
+- A partial is kept only when it passes cheap integrity checks: non-empty,
+  not larger than the exact size the probe announced, fragment state that
+  parses and belongs to an existing .part
+- The whole directory is wiped (except metadata.json) when the previous
+  attempt had already resumed from partials and failed anyway, or failed with
+  an error that points at broken data; the next attempt then starts clean
+- Parts of merged formats carry the format id in their name; a single-file
+  .part does not, so app.py discards partials when a new probe picks another
+  format than the attempt that wrote them
+"""
+
+import os
+import re
+import json
+import shutil
+import logging
+
+logger = logging.getLogger(__name__)
+
+METADATA_FILENAME = "metadata.json"
+# Set on a task re-enqueued with partials kept; a second failure starts clean
+RESUMED_FLAG = "resumed_from_partial"
+# Format the download worker handed to yt-dlp (set before any bytes are written)
+DOWNLOAD_MARKER = "download_format_id"
+_FRAGMENT_RE = re.compile(r"\.part-Frag\d+(\.part)?$")
+_TEMP_RE = re.compile(r"\.temp\.[^.]+$")
+# Error texts meaning the bytes on disk (not the network) were the problem
+_INTEGRITY_ERROR_KEYWORDS = (
+    'corrupt', 'invalid data', 'moov atom', 'malformed', 'truncated',
+    'unexpected eof', 'checksum', 'does not match', 'requested range not satisfiable', '416',
+)
+
+
+def is_partial(filename: str) -> bool:
+    """True for yt-dlp work files that are not a finished download."""
+    return (filename.endswith((".part", ".ytdl"))
+            or bool(_FRAGMENT_RE.search(filename)) or bool(_TEMP_RE.search(filename)))
+
+
+def _integrity_failure(metadata: dict) -> bool:
+    if metadata.get(RESUMED_FLAG) and metadata.get('status') in ('failed', 'error'):
+        return True
+    error = metadata.get('error')
+    if isinstance(error, dict):
+        error = error.get('message') or error.get('error') or ''
+    error = str(error or '').lower()
+    return any(keyword in error for keyword in _INTEGRITY_ERROR_KEYWORDS)
+
+
+def _valid_fragment_state(path: str) -> bool:
+    try:
+        with open(path) as f:
+            state = json.load(f)
+        return isinstance(state["downloader"]["current_fragment"]["index"], int)
+    except (OSError, ValueError, KeyError, TypeError):
+        return False
+
+
+def _remove(path: str) -> None:
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def discard_partials(task_dir: str) -> list:
+    """Remove everything but metadata.json; returns the removed names."""
+    removed = []
+    try:
+        names = os.listdir(task_dir)
+    except OSError:
+        return removed
+    for name in names:
+        if name != METADATA_FILENAME:
+            _remove(os.path.join(task_dir, name))
+            removed.append(name)
+    return removed
+
+
+def prune_for_resume(task_dir: str, metadata: dict) -> tuple:
+    """
+    Prepare a task directory for a retry: keep resumable partials, drop the rest.
+
+    Args:
+        task_dir: Directory of the task
+        metadata: Task metadata as of the failed/interrupted attempt
+
+    Returns:
+        tuple: (kept names, removed names)
+    """
+    if _integrity_failure(metadata) or metadata.get('streamed') or not metadata.get(DOWNLOAD_MARKER):
+        return [], discard_partials(task_dir)
+    try:
+        names = set(os.listdir(task_dir)) - {METADATA_FILENAME}
+    except OSError:
+        return [], []
+
+    # An exact probe size bounds a single-file download
+    limit = None
+    if metadata.get('size_estimate_exact') and '+' not in (metadata.get('protocol') or '+'):
+        limit = metadata.get('estimated_size_bytes')
+
+    kept, removed = [], []
+    for name in sorted(names):
+        path = os.path.join(task_dir, name)
+        keep = os.path.isfile(path) and not _FRAGMENT_RE.search(name) and not _TEMP_RE.search(name)
+        if keep and name.endswith(".ytdl"):
+            keep = _valid_fragment_state(path) and name[:-len(".ytdl")] + ".part" in names
+        elif keep:
+            size = os.path.getsize(path)
+            keep = size > 0 and (limit is None or size <= limit)
+        if keep:
+            kept.append(name)
+        else:
+            _remove(path)
+            removed.append(name)
+
+    # A .part whose fragment state was dropped would be appended to from fragment 0
+    for name in list(kept):
+        if name.endswith(".part") and name[:-len(".part")] + ".ytdl" in removed:
+            _remove(os.path.join(task_dir, name))
+            kept.remove(name)
+            removed.append(name)
+    return kept, removed
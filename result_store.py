@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Result Store Module
+
+Content-addressed store for downloaded files, used to deduplicate identical
+downloads across tasks.
+
+Architecture:
+- Key = sha1(normalized video id | resolved format selector | size cap)
+- Blob = <TASKS_DIR>/.blobs/<key>/<filename> + result.json (title, duration, ...)
+- Task files are hardlinks to the blob, so the filesystem link count is the
+  reference count: a blob is deleted by sweep_blobs() once no task directory
+  links to it any more (st_nlink == 1)
+- dedup:<key>                          = task id of the in-flight download (leader)
+- dedup:<key>:followers:<leader_id>    = tasks waiting for that leader
+
+Directories starting with "." under TASKS_DIR are service directories and are
+skipped by task scans.
+"""
+
+import os
+import re
+import json
+import shutil
+import time
+import hashlib
+import logging
+from urllib.parse import urlparse, parse_qs
+
+logger = logging.getLogger(__name__)
+
+BLOBS_DIRNAME = ".blobs"
+BLOB_META_FILENAME = "result.json"
+REDIS_DEDUP_PREFIX = "dedup:"
+DEDUP_LEADER_TTL_SECONDS = int(os.getenv('DEDUP_LEADER_TTL_SECONDS', str(6 * 3600)))
+
+_VIDEO_ID_RE = re.compile(r"^[A-Za-z0-9_-]{11}$")
+_PATH_ID_PREFIXES = ("shorts", "live", "embed", "v", "e")
+
+# Compare-and-delete: only the current leader may clear the leader key
+_RELEASE_LEADER_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def video_id_from_url(url: str):
+    """
+    Extract the normalized YouTube video id from a URL.
+
+    Example:
+        >>> video_id_from_url("https://youtu.be/dQw4w9WgXcQ?t=10")
+        "dQw4w9WgXcQ"
+
+    Returns:
+        str | None: 11-character video id, or None if the URL has none
+    """
+    try:
+        parsed = urlparse(url)
+    except Exception:
+        return None
+    host = parsed.netloc.lower()
+    parts = [p for p in parsed.path.split("/") if p]
+    candidate = None
+    if host.endswith("youtu.be"):
+        candidate = parts[0] if parts else None
+    elif parts and parts[0] == "watch":
+        candidate = (parse_qs(parsed.query).get("v") or [None])[0]
+    elif len(parts) >= 2 and parts[0] in _PATH_ID_PREFIXES:
+        candidate = parts[1]
+    if candidate and _VIDEO_ID_RE.match(candidate):
+        return candidate
+    return None
+
+
+def dedup_key(video_id: str, format_selector: str, max_size_mb) -> str:
+    """Content address for a (video, format selector, size cap) triple."""
+    raw = f"{video_id}|{format_selector}|{max_size_mb}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _blob_dir(tasks_dir: str, key: str) -> str:
+    return os.path.join(tasks_dir, BLOBS_DIRNAME, key)
+
+
+def find_blob(tasks_dir: str, key: str):
+    """
+    Look up a stored result.
+
+    Returns:
+        tuple | None: (blob file path, result metadata dict) or None
+    """
+    blob_dir = _blob_dir(tasks_dir, key)
+    meta_path = os.path.join(blob_dir, BLOB_META_FILENAME)
+    try:
+        with open(meta_path, 'r') as f:
+            meta = json.load(f)
+        blob_path = os.path.join(blob_dir, meta["filename"])
+        if os.path.isfile(blob_path):
+            return blob_path, meta
+    except Exception:
+        pass
+    return None
+
+
+def store_blob(tasks_dir: str, key: str, filepath: str, result: dict) -> bool:
+    """
+    Register a finished download as the blob for `key`.
+
+    The file is hardlinked (not copied) into the blob directory; result.json
+    is written last so find_blob() never sees a half-registered blob.
+
+    Returns:
+        bool: True if the blob is available after the call
+    """
+    blob_dir = _blob_dir(tasks_dir, key)
+    filename = os.path.basename(filepath)
+    try:
+        os.makedirs(blob_dir, exist_ok=True)
+        blob_path = os.path.join(blob_dir, filename)
+        if not os.path.exists(blob_path):
+            os.link(filepath, blob_path)
+        meta = dict(result)
+        meta["filename"] = filename
+        meta_path = os.path.join(blob_dir, BLOB_META_FILENAME)
+        with open(meta_path + ".tmp", 'w') as f:
+            json.dump(meta, f)
+        os.replace(meta_path + ".tmp", meta_path)
+        return True
+    except Exception as e:
+        logger.warning(f"Result store: failed to register blob {key[:12]}: {e}")
+        return False
+
+
+def link_blob(blob_path: str, task_dir: str) -> str:
+    """
+    Make a blob available inside a task directory.
+
+    Uses a hardlink (a new reference to the same data); falls back to a copy
+    if the filesystem refuses links.
+
+    Returns:
+        str: Path of the file inside task_dir
+    """
+    os.makedirs(task_dir, exist_ok=True)
+    target = os.path.join(task_dir, os.path.basename(blob_path))
+    if os.path.exists(target):
+        return target
+    try:
+        os.link(blob_path, target)
+    except OSError:
+        shutil.copy2(blob_path, target)
+    return target
+
+
+def claim_leader(redis_conn, key: str, task_id: str):
+    """
+    Try to become the task that downloads `key`.
+
+    Returns:
+        str | None: None if task_id is now the leader, otherwise the id of
+        the task already downloading it
+    """
+    leader_key = f"{REDIS_DEDUP_PREFIX}{key}"
+    if redis_conn.set(leader_key, task_id, nx=True, ex=DEDUP_LEADER_TTL_SECONDS):
+        return None
+    leader = redis_conn.get(leader_key)
+    if leader is None:
+        # Leader finished between SET and GET — try once more
+        if redis_conn.set(leader_key, task_id, nx=True, ex=DEDUP_LEADER_TTL_SECONDS):
+            return None
+        leader = redis_conn.get(leader_key)
+    return leader
+
+
+def join_leader(redis_conn, key: str, leader_id: str, task_id: str) -> bool:
+    """
+    Register task_id as waiting for leader_id's download.
+
+    If the leader finished (or gave up) concurrently, the registration is
+    rolled back and False is returned so the caller can handle the task itself.
+
+    Returns:
+        bool: True if the leader will resolve task_id
+    """
+    followers_key = f"{REDIS_DEDUP_PREFIX}{key}:followers:{leader_id}"
+    redis_conn.rpush(followers_key, task_id)
+    redis_conn.expire(followers_key, DEDUP_LEADER_TTL_SECONDS)
+    if redis_conn.get(f"{REDIS_DEDUP_PREFIX}{key}") == leader_id:
+        return True
+    # The leader cleared its key before draining; if we can still remove
+    # ourselves, it has not seen us
+    return not redis_conn.lrem(followers_key, 0, task_id)
+
+
+def finish_leader(redis_conn, key: str, leader_id: str) -> list:
+    """
+    Give up leadership of `key` and collect the tasks that were waiting.
+
+    Must be called after store_blob() on success so that late arrivals find
+    the blob instead of a missing leader.
+
+    Returns:
+        list: Follower task ids to resolve
+    """
+    followers_key = f"{REDIS_DEDUP_PREFIX}{key}:followers:{leader_id}"
+    try:
+        redis_conn.eval(_RELEASE_LEADER_SCRIPT, 1, f"{REDIS_DEDUP_PREFIX}{key}", leader_id)
+        pipe = redis_conn.pipeline(transaction=True)
+        pipe.lrange(followers_key, 0, -1)
+        pipe.delete(followers_key)
+        followers, _ = pipe.execute()
+        return followers
+    except Exception as e:
+        logger.warning(f"[{leader_id[:8]}] Failed to drain dedup followers: {e}")
+        return []
+
+
+def sweep_blobs(tasks_dir: str):
+    """
+    Delete blobs no task links to any more.
+
+    Returns:
+        tuple: (blobs removed, bytes freed)
+    """
+    root = os.path.join(tasks_dir, BLOBS_DIRNAME)
+    if not os.path.isdir(root):
+        return 0, 0
+    removed = 0
+    freed = 0
+    for key in os.listdir(root):
+        blob_dir = os.path.join(root, key)
+        found = find_blob(tasks_dir, key)
+        try:
+            if found is not None:
+                st = os.stat(found[0])
+                if st.st_nlink > 1:
+                    continue
+                freed += st.st_size
+            elif time.time() - os.path.getmtime(blob_dir) < 3600:
+                # Possibly being registered right now (result.json not written yet)
+                continue
+            shutil.rmtree(blob_dir, ignore_errors=True)
+            removed += 1
+        except Exception as e:
+            logger.warning(f"Result store: failed to sweep {key[:12]}: {e}")
+    return removed, freed
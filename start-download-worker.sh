@@ -0,0 +1,18 @@
+#!/bin/bash
+# Wait until orchestrator declares system ready (recovery done), then start download workers
+# Starting earlier would race the orchestrator's startup lease reset
+set -euo pipefail
+
+READY_FILE="/tmp/system-ready"
+TIMEOUT="120"
+ELAPSED=0
+
+while [ $ELAPSED -lt $TIMEOUT ]; do
+  if [ -f "$READY_FILE" ]; then
+    exec python /app/download_worker.py
+  fi
+  sleep 1
+  ELAPSED=$((ELAPSED+1))
+done
+
+exec python /app/download_worker.py
@@ -10,10 +10,11 @@ ELAPSED=0
 while [ $ELAPSED -lt $TIMEOUT ]; do
   if [ -f "$READY_FILE" ]; then
     # --preload loads app once in master, then forks to workers
-    exec gunicorn -c gunicorn_config.py --preload --bind 0.0.0.0:5000 --workers 2 --timeout 600 app:app
+    # gthread: idle SSE / long-poll connections hold a thread, not a whole worker
+    exec gunicorn -c gunicorn_config.py --preload --bind 0.0.0.0:5000 --workers 2 --worker-class gthread --threads "${GUNICORN_THREADS:-16}" --timeout 600 app:app
   fi
   sleep 1
   ELAPSED=$((ELAPSED+1))
 done
 
-exec gunicorn -c gunicorn_config.py --preload --bind 0.0.0.0:5000 --workers 2 --timeout 600 app:app
+exec gunicorn -c gunicorn_config.py --preload --bind 0.0.0.0:5000 --workers 2 --worker-class gthread --threads "${GUNICORN_THREADS:-16}" --timeout 600 app:app
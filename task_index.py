@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Task Index Module
+
+Redis sorted-set index of all tasks on disk, for listing tasks without
+scanning TASKS_DIR.
+
+Architecture:
+- tasks:index:created          = sorted set task_id -> created_at (unix time), every task
+- tasks:index:status:<status>  = sorted set task_id -> created_at, one per status
+- tasks:index:tag:<tag>        = sorted set task_id -> created_at, one per client tag
+- tasks:index:entry            = hash task_id -> "status\\ttag,tag" (what to remove on change)
+- Updated on every metadata write (task_sync.save_and_sync_metadata and
+  app._save_task) by one Lua script, so concurrent writers never leave a task
+  in two status sets; removed when the orchestrator deletes the task
+- The orchestrator re-indexes every task during startup recovery, so the
+  index is rebuilt if Redis lost its data
+
+Due-time indexes for the orchestrator loops (maintained by the same script),
+so a loop touches only tasks that are due instead of every metadata.json:
+- tasks:due:retry     = sorted set task_id -> failed_at; failed tasks the
+                        recovery loop has not ruled out yet
+- tasks:index:updated = sorted set task_id -> last metadata write; tasks
+                        older than the TTL are cleanup candidates
+
+Client tags come from client_meta[TASK_TAG_FIELD] ("tags"): a string or a
+list of strings.
+
+Listing is newest first with keyset pagination: the cursor is the
+(created_at, task_id) of the last returned task, so pages stay stable while
+tasks are added.
+"""
+
+import os
+import time
+import logging
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+REDIS_INDEX_PREFIX = "tasks:index:"
+REDIS_INDEX_CREATED_KEY = "tasks:index:created"
+REDIS_INDEX_ENTRY_KEY = "tasks:index:entry"
+REDIS_INDEX_UPDATED_KEY = "tasks:index:updated"
+REDIS_DUE_RETRY_KEY = "tasks:due:retry"
+FAILED_STATUSES = ("failed", "error")
+TASK_TAG_FIELD = os.getenv('TASK_TAG_FIELD', 'tags')
+MAX_TAGS_PER_TASK = 10
+# Index entries examined per listing request when filters are combined
+MAX_SCAN_PER_PAGE = 5000
+
+# KEYS: entry hash, updated, due retry
+# ARGV: prefix, task_id, score, status, tags ("a,b"), now, retry due or ""
+_INDEX_SCRIPT = """
+local prefix, task = ARGV[1], ARGV[2]
+local prev = redis.call('HGET', KEYS[1], task)
+if prev then
+    local status, tags = string.match(prev, '^([^\\t]*)\\t(.*)$')
+    if status and status ~= ARGV[4] then
+        redis.call('ZREM', prefix .. 'status:' .. status, task)
+    end
+    for tag in string.gmatch(tags or '', '[^,]+') do
+        redis.call('ZREM', prefix .. 'tag:' .. tag, task)
+    end
+end
+redis.call('ZADD', prefix .. 'created', ARGV[3], task)
+redis.call('ZADD', prefix .. 'status:' .. ARGV[4], ARGV[3], task)
+for tag in string.gmatch(ARGV[5], '[^,]+') do
+    redis.call('ZADD', prefix .. 'tag:' .. tag, ARGV[3], task)
+end
+redis.call('HSET', KEYS[1], task, ARGV[4] .. '\\t' .. ARGV[5])
+redis.call('ZADD', KEYS[2], ARGV[6], task)
+if ARGV[7] ~= '' then
+    redis.call('ZADD', KEYS[3], ARGV[7], task)
+else
+    redis.call('ZREM', KEYS[3], task)
+end
+return 1
+"""
+
+# KEYS: entry hash, updated, due retry / ARGV: prefix, task_id
+_UNINDEX_SCRIPT = """
+local prefix, task = ARGV[1], ARGV[2]
+local prev = redis.call('HGET', KEYS[1], task)
+if prev then
+    local status, tags = string.match(prev, '^([^\\t]*)\\t(.*)$')
+    if status then
+        redis.call('ZREM', prefix .. 'status:' .. status, task)
+    end
+    for tag in string.gmatch(tags or '', '[^,]+') do
+        redis.call('ZREM', prefix .. 'tag:' .. tag, task)
+    end
+end
+redis.call('ZREM', prefix .. 'created', task)
+redis.call('HDEL', KEYS[1], task)
+for i = 2, 3 do
+    redis.call('ZREM', KEYS[i], task)
+end
+return 1
+"""
+
+
+def created_score(task: dict) -> float:
+    """Sort score of a task: created_at (naive UTC ISO) as unix time."""
+    try:
+        created = datetime.fromisoformat(task.get("created_at") or "")
+    except (TypeError, ValueError):
+        return 0.0
+    if created.tzinfo is None:
+        created = created.replace(tzinfo=timezone.utc)
+    return created.timestamp()
+
+
+def normalize_tag(tag) -> str | None:
+    """A client tag as stored in key names, or None if it is not usable."""
+    if not isinstance(tag, str):
+        return None
+    tag = tag.strip()[:64]
+    if not tag or any(c in tag for c in ",\t\n"):
+        return None
+    return tag
+
+
+def task_tags(task: dict) -> list:
+    """Client tags of a task (client_meta[TASK_TAG_FIELD])."""
+    meta = task.get("client_meta")
+    if not isinstance(meta, dict):
+        return []
+    raw = meta.get(TASK_TAG_FIELD)
+    values = raw if isinstance(raw, list) else [raw]
+    tags = []
+    for value in values:
+        tag = normalize_tag(value)
+        if tag and tag not in tags:
+            tags.append(tag)
+    return tags[:MAX_TAGS_PER_TASK]
+
+
+def _timestamp(value, default: float) -> float:
+    """Unix time of an ISO timestamp (naive values are UTC), or default."""
+    try:
+        parsed = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return default
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def retry_due_at(task: dict, now: float):
+    """When a failed task becomes a recovery candidate, or None if it is not one."""
+    if task.get("status") not in FAILED_STATUSES:
+        return None
+    error = task.get("error")
+    if isinstance(error, dict) and error.get("recoverable") is False:
+        return None
+    return _timestamp(task.get("failed_at"), now)
+
+
+def index_task(redis_conn, task: dict) -> None:
+    """
+    Add or move a task in the index after its metadata changed.
+
+    redis_conn may be a pipeline. Failures are logged and ignored: the
+    index is rebuilt by the next startup recovery.
+    """
+    task_id = task.get("task_id")
+    if not task_id:
+        return
+    now = time.time()
+    retry_due = retry_due_at(task, now)
+    try:
+        redis_conn.eval(
+            _INDEX_SCRIPT, 3,
+            REDIS_INDEX_ENTRY_KEY, REDIS_INDEX_UPDATED_KEY, REDIS_DUE_RETRY_KEY,
+            REDIS_INDEX_PREFIX, task_id, created_score(task),
+            task.get("status") or "unknown", ",".join(task_tags(task)), now,
+            "" if retry_due is None else retry_due,
+        )
+    except Exception as e:
+        logger.debug(f"[{task_id[:8]}] Task index update failed: {e}")
+
+
+def unindex_task(redis_conn, task_id: str) -> None:
+    """Remove a deleted task from the index."""
+    try:
+        redis_conn.eval(
+            _UNINDEX_SCRIPT, 3,
+            REDIS_INDEX_ENTRY_KEY, REDIS_INDEX_UPDATED_KEY, REDIS_DUE_RETRY_KEY,
+            REDIS_INDEX_PREFIX, task_id,
+        )
+    except Exception as e:
+        logger.debug(f"[{task_id[:8]}] Task index removal failed: {e}")
+
+
+def due_task_ids(redis_conn, key: str, now: float = None, limit: int = 500) -> list:
+    """Ids of tasks in a due-time index whose time has come, oldest first."""
+    return redis_conn.zrangebyscore(key, "-inf", time.time() if now is None else now, start=0, num=limit)
+
+
+def encode_cursor(score: float, task_id: str) -> str:
+    return f"{score!r}:{task_id}"
+
+
+def decode_cursor(cursor: str):
+    """(score, task_id) of a cursor; raises ValueError if malformed."""
+    score, sep, task_id = cursor.partition(":")
+    if not sep or not task_id:
+        raise ValueError("malformed cursor")
+    return float(score), task_id
+
+
+def list_task_ids(redis_conn, status: str = None, tag: str = None, since: float = None,
+                  until: float = None, cursor: str = None, limit: int = 50):
+    """
+    Page of task ids, newest first.
+
+    The most selective single set (tag, else status, else all tasks) is
+    walked by score; a second filter is checked with pipelined ZSCOREs. At
+    most MAX_SCAN_PER_PAGE entries are examined per call, so a page can be
+    short while next_cursor is still set.
+
+    Args:
+        redis_conn: Redis connection object
+        status: Only tasks in this status
+        tag: Only tasks with this client tag
+        since / until: created_at range (unix time, inclusive)
+        cursor: next_cursor of the previous page
+        limit: Page size
+
+    Raises:
+        ValueError: Malformed cursor
+
+    Returns:
+        tuple: (list of (task_id, created_at score), next_cursor or None)
+    """
+    if tag is not None:
+        key = f"{REDIS_INDEX_PREFIX}tag:{tag}"
+        other = f"{REDIS_INDEX_PREFIX}status:{status}" if status else None
+    elif status:
+        key, other = f"{REDIS_INDEX_PREFIX}status:{status}", None
+    else:
+        key, other = REDIS_INDEX_CREATED_KEY, None
+
+    high = "+inf" if until is None else until
+    low = "-inf" if since is None else since
+    after = None
+    if cursor:
+        after = decode_cursor(cursor)
+        high = after[0] if until is None else min(until, after[0])
+
+    # Members with equal score come back in reverse lexical order, so ties
+    # with the cursor are skipped by member
+    batch_size = limit if other is None else max(limit, 200)
+    page, offset = [], 0
+    while True:
+        batch = redis_conn.zrevrangebyscore(key, high, low, start=offset, num=batch_size, withscores=True)
+        offset += len(batch)
+        candidates = [
+            (tid, score) for tid, score in batch
+            if after is None or score < after[0] or (score == after[0] and tid < after[1])
+        ]
+        if other and candidates:
+            pipe = redis_conn.pipeline(transaction=False)
+            for tid, _ in candidates:
+                pipe.zscore(other, tid)
+            candidates = [c for c, hit in zip(candidates, pipe.execute()) if hit is not None]
+        for tid, score in candidates:
+            page.append((tid, score))
+            if len(page) >= limit:
+                return page, encode_cursor(score, tid)
+        if len(batch) < batch_size:
+            return page, None
+        if offset >= MAX_SCAN_PER_PAGE:
+            tid, score = batch[-1]
+            return page, encode_cursor(score, tid)
@@ -0,0 +1,746 @@
+#!/usr/bin/env python3
+"""
+Task Queue Module
+
+Leased work queue shared by app.py (consumers) and orchestrator.py (reclaimer).
+
+Architecture:
+- queue:pending                 = sorted set task_id -> enqueue time (all pending tasks)
+- queue:meta                    = hash task_id -> "lane\ttenant\tweight" (until released)
+- queue:lane:<lane>:<tenant>    = sorted set task_id -> order score, one per tenant and lane
+- queue:tenants:<lane>          = sorted set tenant -> pass (weighted fair queuing)
+- queue:vtime:<lane>            = pass of the last served tenant (start pass of new tenants)
+- queue:signal                  = wake-up list for idle consumers (BLPOP), trimmed
+                                  to one token
+- queue:processing:<worker_id>  = tasks a worker has taken (moved atomically by the dequeue script)
+- tasks:leases                  = sorted set task_id -> lease expiry (unix time)
+- tasks:active                  = hash task_id -> {"worker_id", "heartbeat", "started_at"}
+- stats:finished                = sorted set of recently finished task ids (throughput window)
+
+Scheduling (one Lua script, so any number of consumers stay consistent):
+1. Starvation protection: a task pending for QUEUE_STARVATION_SECONDS or more
+   is taken first, whatever its lane and tenant
+2. Lanes (priority high > normal > low) are served strictly in order
+3. Within a lane, the tenant with the lowest pass is served and its pass grows
+   by 1/weight (stride scheduling), so tenants share the lane by TENANT_WEIGHTS
+   no matter how many tasks each has queued; a tenant becoming active starts at
+   the lane's virtual time and cannot bank credit while idle
+4. Within a tenant, tasks go in order score order (arrival time)
+
+Tenant = the client_meta field QUEUE_TENANT_FIELD ("tenant"), else "default".
+
+Order within a tenant (QUEUE_POLICY):
+- fifo: arrival time
+- sjf:  arrival time + estimated size / SJF_AGING_MB_PER_SECOND, so smaller
+        downloads go first and a large one is only overtaken by tasks that
+        arrive within its size-derived delay (aging)
+- stats:queue_wait:<policy> = hash {"tasks", "wait_seconds"} for comparing policies
+
+A task never lives only in worker memory: it is moved atomically into the
+worker's processing list, and the worker renews its lease while the download
+runs. The orchestrator reclaims tasks whose lease expired with a single
+ZRANGEBYSCORE, so the cost is O(expired) rather than O(active).
+"""
+
+import os
+import json
+import time
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Redis keys
+REDIS_QUEUED_TASKS_KEY = "queue:pending"
+REDIS_QUEUE_META_KEY = "queue:meta"
+REDIS_QUEUE_PREFIX = "queue:"
+REDIS_QUEUE_SIGNAL_KEY = "queue:signal"
+REDIS_PROCESSING_PREFIX = "queue:processing:"
+REDIS_LEASES_KEY = "tasks:leases"
+REDIS_ACTIVE_TASKS_KEY = "tasks:active"
+REDIS_WORKER_HEARTBEAT_PREFIX = "heartbeat:"
+REDIS_WORKER_CAPACITY_KEY = "workers:capacity"  # hash worker_id -> current download slots
+REDIS_FINISHED_KEY = "stats:finished"  # sorted set task_id -> finish time (rolling window)
+REDIS_QUEUE_WAIT_PREFIX = "stats:queue_wait:"  # hash per policy {"tasks", "wait_seconds"}
+
+# Lease timing (shared with orchestrator crash detection)
+TASK_HEARTBEAT_INTERVAL_SECONDS = int(os.getenv('TASK_HEARTBEAT_INTERVAL_SECONDS', '30'))
+TASK_HEARTBEAT_TIMEOUT_SECONDS = int(os.getenv('TASK_HEARTBEAT_TIMEOUT_SECONDS', '90'))
+
+# Fair scheduling
+QUEUE_LANES = ("high", "normal", "low")  # served in this order
+QUEUE_STARVATION_SECONDS = int(os.getenv('QUEUE_STARVATION_SECONDS', '600'))
+QUEUE_TENANT_FIELD = os.getenv('QUEUE_TENANT_FIELD', 'tenant')
+DEFAULT_TENANT = "default"
+QUEUE_POLICIES = ("fifo", "sjf")
+QUEUE_POLICY = os.getenv('QUEUE_POLICY', 'fifo').lower()
+if QUEUE_POLICY not in QUEUE_POLICIES:
+    logger.warning(f"Unknown QUEUE_POLICY {QUEUE_POLICY!r}, using fifo")
+    QUEUE_POLICY = "fifo"
+# sjf: each second of waiting is worth this many MB of estimated size
+SJF_AGING_MB_PER_SECOND = float(os.getenv('SJF_AGING_MB_PER_SECOND', '1'))
+# sjf: size assumed for tasks without an estimate (no cached extraction)
+SJF_DEFAULT_SIZE_MB = float(os.getenv('SJF_DEFAULT_SIZE_MB', '100'))
+
+
+def _parse_weights(raw: str) -> dict:
+    weights = {}
+    for item in raw.split(","):
+        name, _, value = item.partition("=")
+        try:
+            if name.strip() and float(value) > 0:
+                weights[name.strip()] = float(value)
+        except ValueError:
+            logger.warning(f"Ignoring bad TENANT_WEIGHTS entry: {item!r}")
+    return weights
+
+
+# "tenant=weight,..." — tenants not listed have weight 1
+TENANT_WEIGHTS = _parse_weights(os.getenv('TENANT_WEIGHTS', ''))
+
+# KEYS: pending, meta, lane queue, lane tenants, lane vtime, signal
+# ARGV: task_id, pending score, order score, lane, tenant, weight
+_ENQUEUE_SCRIPT = """
+redis.call('ZADD', KEYS[1], ARGV[2], ARGV[1])
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[4] .. '\t' .. ARGV[5] .. '\t' .. ARGV[6])
+redis.call('ZADD', KEYS[3], ARGV[3], ARGV[1])
+if not redis.call('ZSCORE', KEYS[4], ARGV[5]) then
+    local vtime = tonumber(redis.call('GET', KEYS[5]) or '0')
+    redis.call('ZADD', KEYS[4], vtime, ARGV[5])
+end
+redis.call('RPUSH', KEYS[6], '1')
+redis.call('LTRIM', KEYS[6], 0, 0)
+return redis.call('ZCARD', KEYS[1])
+"""
+
+# Shared by dequeue and remove: drop a pending task from every structure;
+# charges the tenant one stride when `charge` is set
+_UNLINK_LUA = """
+local function unlink(prefix, pending, meta, task, charge)
+    local m = redis.call('HGET', meta, task)
+    redis.call('ZREM', pending, task)
+    if not m then return end
+    local lane, tenant, weight = string.match(m, '^([^\t]*)\t([^\t]*)\t([^\t]*)$')
+    if not lane then return end
+    local tq = prefix .. 'lane:' .. lane .. ':' .. tenant
+    local tenants = prefix .. 'tenants:' .. lane
+    redis.call('ZREM', tq, task)
+    if charge then
+        local pass = tonumber(redis.call('ZSCORE', tenants, tenant) or '0')
+        redis.call('SET', prefix .. 'vtime:' .. lane, tostring(pass))
+        redis.call('ZADD', tenants, pass + 1 / tonumber(weight), tenant)
+    end
+    if redis.call('ZCARD', tq) == 0 then
+        redis.call('ZREM', tenants, tenant)
+    end
+end
+"""
+
+# KEYS: pending, meta, processing list, signal
+# ARGV: now, starvation seconds, key prefix, lanes in priority order...
+_DEQUEUE_SCRIPT = _UNLINK_LUA + """
+local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+if #oldest == 0 then
+    redis.call('DEL', KEYS[4])
+    return false
+end
+local prefix = ARGV[3]
+local task = nil
+if tonumber(ARGV[1]) - tonumber(oldest[2]) >= tonumber(ARGV[2]) then
+    task = oldest[1]
+end
+local i = 4
+while not task and i <= #ARGV do
+    local tenants = prefix .. 'tenants:' .. ARGV[i]
+    local picked = false
+    for _ = 1, 16 do
+        local head = redis.call('ZRANGE', tenants, 0, 0)
+        if #head == 0 then break end
+        local candidates = redis.call('ZRANGE', prefix .. 'lane:' .. ARGV[i] .. ':' .. head[1], 0, 0)
+        if #candidates > 0 then
+            task = candidates[1]
+            picked = true
+            break
+        end
+        redis.call('ZREM', tenants, head[1])
+    end
+    if not picked then i = i + 1 end
+end
+if not task then
+    -- Pending tasks without lane data (e.g. written by an older version)
+    task = oldest[1]
+end
+unlink(prefix, KEYS[1], KEYS[2], task, true)
+redis.call('RPUSH', KEYS[3], task)
+if redis.call('ZCARD', KEYS[1]) > 0 then
+    -- Pass the wake-up on: the signal holds one token, not one per task
+    redis.call('RPUSH', KEYS[4], '1')
+    redis.call('LTRIM', KEYS[4], 0, 0)
+end
+return task
+"""
+
+# KEYS: pending, meta / ARGV: task_id, key prefix
+_REMOVE_SCRIPT = _UNLINK_LUA + """
+unlink(ARGV[2], KEYS[1], KEYS[2], ARGV[1], false)
+redis.call('HDEL', KEYS[2], ARGV[1])
+return 1
+"""
+
+
+# KEYS: pending, meta
+# ARGV: now, starvation seconds, key prefix, number of lanes, lanes in priority
+#       order..., task ids to locate...
+# Replays the dequeue script on a copy of the queue (nothing is written) until
+# every requested task is reached; returns their 1-based positions (0 = not pending)
+_POSITION_SCRIPT = """
+local now, starve, prefix = tonumber(ARGV[1]), tonumber(ARGV[2]), ARGV[3]
+local nlanes = tonumber(ARGV[4])
+local wanted, remaining = {}, 0
+for i = 5 + nlanes, #ARGV do
+    if not wanted[ARGV[i]] then
+        wanted[ARGV[i]] = 0
+        remaining = remaining + 1
+    end
+end
+local pending = redis.call('ZRANGE', KEYS[1], 0, -1, 'WITHSCORES')
+local taken = {}
+-- Per lane: tenant -> {pass, weight, queue, next}
+local lanes = {}
+for l = 1, nlanes do
+    local lane = ARGV[4 + l]
+    local tenants = {}
+    local passes = redis.call('ZRANGE', prefix .. 'tenants:' .. lane, 0, -1, 'WITHSCORES')
+    for j = 1, #passes, 2 do
+        local queue = redis.call('ZRANGE', prefix .. 'lane:' .. lane .. ':' .. passes[j], 0, -1)
+        local weight = 1
+        if #queue > 0 then
+            local m = redis.call('HGET', KEYS[2], queue[1]) or ''
+            weight = tonumber(string.match(m, '\t([^\t]*)$') or '1') or 1
+        end
+        tenants[passes[j]] = {pass = tonumber(passes[j + 1]), weight = weight, queue = queue, next = 1}
+    end
+    lanes[l] = tenants
+end
+-- Task -> its tenant entry, for charging tasks taken out of turn
+local owner = {}
+for _, tenants in ipairs(lanes) do
+    for _, t in pairs(tenants) do
+        for _, task in ipairs(t.queue) do owner[task] = t end
+    end
+end
+
+local function head(t)
+    while t.next <= #t.queue and taken[t.queue[t.next]] do t.next = t.next + 1 end
+    return t.queue[t.next]
+end
+local function charge(t)
+    t.pass = t.pass + 1 / t.weight
+end
+
+local oldest, position = 1, 0
+while remaining > 0 do
+    while oldest < #pending and taken[pending[oldest]] do oldest = oldest + 2 end
+    if oldest > #pending then break end
+    local task = nil
+    if now - tonumber(pending[oldest + 1]) >= starve then
+        task = pending[oldest]
+        if owner[task] then charge(owner[task]) end
+    end
+    for l = 1, nlanes do
+        if task then break end
+        local best, best_name = nil, nil
+        for name, t in pairs(lanes[l]) do
+            if head(t) and (not best or t.pass < best.pass or (t.pass == best.pass and name < best_name)) then
+                best, best_name = t, name
+            end
+        end
+        if best then
+            task = head(best)
+            charge(best)
+        end
+    end
+    if not task then
+        -- Pending tasks without lane data go last
+        task = pending[oldest]
+    end
+    taken[task] = true
+    position = position + 1
+    if wanted[task] == 0 then
+        wanted[task] = position
+        remaining = remaining - 1
+    end
+end
+local result = {}
+for i = 5 + nlanes, #ARGV do result[#result + 1] = wanted[ARGV[i]] end
+return result
+"""
+
+# KEYS: leases, active / ARGV: task_id, worker_id
+# 1 if the task's lease exists and belongs to the worker
+_HOLDS_LEASE_SCRIPT = """
+if not redis.call('ZSCORE', KEYS[1], ARGV[1]) then
+    return 0
+end
+local raw = redis.call('HGET', KEYS[2], ARGV[1])
+if raw and cjson.decode(raw)['worker_id'] ~= ARGV[2] then
+    return 0
+end
+return 1
+"""
+
+# KEYS: leases, active / ARGV: task_id, worker_id, new expiry, heartbeat (ISO)
+# Extends the lease only while it exists and belongs to the worker: after a
+# reclaim, the old holder must not refresh the next owner's lease
+_RENEW_SCRIPT = """
+if not redis.call('ZSCORE', KEYS[1], ARGV[1]) then
+    return 0
+end
+local raw = redis.call('HGET', KEYS[2], ARGV[1])
+local info = {worker_id = ARGV[2]}
+if raw then
+    info = cjson.decode(raw)
+    if info['worker_id'] ~= ARGV[2] then
+        return 0
+    end
+end
+redis.call('ZADD', KEYS[1], 'XX', ARGV[3], ARGV[1])
+info['heartbeat'] = ARGV[4]
+redis.call('HSET', KEYS[2], ARGV[1], cjson.encode(info))
+return 1
+"""
+
+# KEYS: processing list, leases, active, meta, pending / ARGV: task_id, worker_id
+# Lease, active entry and queue meta are only dropped while the worker still
+# owns the task: after a reclaim they belong to the next run
+_RELEASE_SCRIPT = """
+redis.call('LREM', KEYS[1], 0, ARGV[1])
+local raw = redis.call('HGET', KEYS[3], ARGV[1])
+if raw and cjson.decode(raw)['worker_id'] ~= ARGV[2] then
+    return 0
+end
+redis.call('ZREM', KEYS[2], ARGV[1])
+redis.call('HDEL', KEYS[3], ARGV[1])
+if not redis.call('ZSCORE', KEYS[5], ARGV[1]) then
+    redis.call('HDEL', KEYS[4], ARGV[1])
+end
+return 1
+"""
+
+
+def processing_key(worker_id: str) -> str:
+    """Redis list holding the tasks currently taken by a worker."""
+    return f"{REDIS_PROCESSING_PREFIX}{worker_id}"
+
+
+def task_lane(task: dict) -> str:
+    """Queue lane of a task (its "priority" field)."""
+    lane = (task or {}).get("priority")
+    return lane if lane in QUEUE_LANES else "normal"
+
+
+def task_tenant(task: dict) -> str:
+    """Fair-share tenant of a task (client_meta[QUEUE_TENANT_FIELD])."""
+    meta = (task or {}).get("client_meta")
+    if isinstance(meta, dict):
+        tenant = meta.get(QUEUE_TENANT_FIELD)
+        if isinstance(tenant, (str, int)) and not isinstance(tenant, bool) and str(tenant).strip():
+            return str(tenant).strip()[:64]
+    return DEFAULT_TENANT
+
+
+def order_score(task: dict, now: float) -> float:
+    """Order of a task within its tenant queue (lower runs first, see QUEUE_POLICY)."""
+    if QUEUE_POLICY != "sjf" or SJF_AGING_MB_PER_SECOND <= 0:
+        return now
+    size = (task or {}).get("estimated_size_bytes")
+    size_mb = size / 1024 / 1024 if size else SJF_DEFAULT_SIZE_MB
+    return now + size_mb / SJF_AGING_MB_PER_SECOND
+
+
+def enqueue_task(redis_conn, task_id: str, front: bool = False, task: dict = None) -> int:
+    """
+    Put a task id on the pending queue.
+
+    Redis errors are not swallowed: a task that was not enqueued must not be
+    reported as queued.
+
+    Args:
+        redis_conn: Redis connection object, or a pipeline when `task` is
+            given (the count is then in the pipeline results)
+        task_id: Task identifier
+        front: Run the task next (e.g. a task handed back on shutdown); it is
+            enqueued as already starving
+        task: Task metadata to take lane and tenant from; when omitted the
+            lane and tenant it was last enqueued with are reused
+
+    Returns:
+        int: Number of pending tasks after the push
+    """
+    now = time.time()
+    if task is not None:
+        lane, tenant = task_lane(task), task_tenant(task)
+        weight = TENANT_WEIGHTS.get(tenant, 1.0)
+    else:
+        previous = redis_conn.hget(REDIS_QUEUE_META_KEY, task_id) or ""
+        parts = previous.split("\t")
+        if len(parts) == 3:
+            lane, tenant, weight = parts[0], parts[1], float(parts[2])
+        else:
+            lane, tenant, weight = "normal", DEFAULT_TENANT, TENANT_WEIGHTS.get(DEFAULT_TENANT, 1.0)
+    pending_score = 0 if front else now
+    score = 0 if front else order_score(task, now)
+    return redis_conn.eval(
+        _ENQUEUE_SCRIPT, 6,
+        REDIS_QUEUED_TASKS_KEY, REDIS_QUEUE_META_KEY,
+        f"{REDIS_QUEUE_PREFIX}lane:{lane}:{tenant}", f"{REDIS_QUEUE_PREFIX}tenants:{lane}",
+        f"{REDIS_QUEUE_PREFIX}vtime:{lane}", REDIS_QUEUE_SIGNAL_KEY,
+        task_id, pending_score, score, lane, tenant, weight,
+    )
+
+
+def queue_length(redis_conn) -> int:
+    """Number of pending tasks (0 if Redis is unavailable)."""
+    try:
+        return redis_conn.zcard(REDIS_QUEUED_TASKS_KEY)
+    except Exception:
+        return 0
+
+
+def queue_positions(redis_conn, task_ids: list) -> dict:
+    """
+    1-based scheduling positions of pending tasks (one Redis round trip).
+
+    The position is where the dequeue script would take the task given the
+    queue as it is now: starving tasks, higher lanes, then the tenants' turns
+    in the task's lane. Tasks enqueued later into a higher lane, shorter jobs
+    (sjf) and tasks that start starving can still move it back.
+
+    Returns:
+        dict: task_id -> position, for the tasks that are pending
+    """
+    if not task_ids:
+        return {}
+    try:
+        positions = redis_conn.eval(
+            _POSITION_SCRIPT, 2, REDIS_QUEUED_TASKS_KEY, REDIS_QUEUE_META_KEY,
+            time.time(), QUEUE_STARVATION_SECONDS, REDIS_QUEUE_PREFIX,
+            len(QUEUE_LANES), *QUEUE_LANES, *task_ids,
+        )
+    except Exception:
+        return {}
+    return {task_id: int(pos) for task_id, pos in zip(task_ids, positions) if pos}
+
+
+def queue_position(redis_conn, task_id: str):
+    """Scheduling position of a pending task (see queue_positions), or None if it is not queued."""
+    return queue_positions(redis_conn, [task_id]).get(task_id)
+
+
+def record_finished(redis_conn, task_id: str, window_seconds: int) -> None:
+    """Count a task that left its download slot, for the throughput window."""
+    now = time.time()
+    try:
+        pipe = redis_conn.pipeline()
+        pipe.zadd(REDIS_FINISHED_KEY, {task_id: now})
+        pipe.zremrangebyscore(REDIS_FINISHED_KEY, "-inf", now - window_seconds)
+        pipe.execute()
+    except Exception as e:
+        logger.debug(f"[{task_id[:8]}] Failed to record finish: {e}")
+
+
+def record_queue_wait(redis_conn, policy: str, wait_seconds: float) -> None:
+    """Add the time a task spent pending to the totals of the policy it was queued under."""
+    try:
+        pipe = redis_conn.pipeline()
+        pipe.hincrby(f"{REDIS_QUEUE_WAIT_PREFIX}{policy}", "tasks", 1)
+        pipe.hincrbyfloat(f"{REDIS_QUEUE_WAIT_PREFIX}{policy}", "wait_seconds", max(0.0, wait_seconds))
+        pipe.execute()
+    except Exception as e:
+        logger.debug(f"Failed to record queue wait: {e}")
+
+
+def queue_wait_stats(redis_conn) -> dict:
+    """Mean queue wait per scheduling policy: policy -> {"tasks", "mean_wait_seconds"}."""
+    stats = {}
+    try:
+        pipe = redis_conn.pipeline()
+        for policy in QUEUE_POLICIES:
+            pipe.hgetall(f"{REDIS_QUEUE_WAIT_PREFIX}{policy}")
+        totals = pipe.execute()
+    except Exception:
+        return stats
+    for policy, raw in zip(QUEUE_POLICIES, totals):
+        tasks = int(raw.get("tasks") or 0)
+        if tasks:
+            stats[policy] = {
+                "tasks": tasks,
+                "mean_wait_seconds": round(float(raw.get("wait_seconds") or 0) / tasks, 1),
+            }
+    return stats
+
+
+def finished_per_second(redis_conn, window_seconds: int):
+    """
+    Rolling task throughput over the last window_seconds.
+
+    Returns:
+        tuple: (tasks/second, number of tasks in the window); (0.0, 0) if
+        Redis is unavailable
+    """
+    now = time.time()
+    try:
+        count = redis_conn.zcount(REDIS_FINISHED_KEY, now - window_seconds, "+inf")
+    except Exception:
+        return 0.0, 0
+    return count / window_seconds, count
+
+
+def _dequeue(redis_conn, worker_id: str):
+    return redis_conn.eval(
+        _DEQUEUE_SCRIPT, 4,
+        REDIS_QUEUED_TASKS_KEY, REDIS_QUEUE_META_KEY, processing_key(worker_id), REDIS_QUEUE_SIGNAL_KEY,
+        time.time(), QUEUE_STARVATION_SECONDS, REDIS_QUEUE_PREFIX, *QUEUE_LANES,
+    )
+
+
+def claim_task(redis_conn, worker_id: str, timeout: float):
+    """
+    Take the next task (see Scheduling above) under a lease, blocking up to
+    `timeout` seconds when the queue is empty.
+
+    The task id is moved atomically from the pending queue into the worker's
+    processing list, then a lease is granted. If the process dies between the
+    two steps the task is still recoverable from the processing list
+    (see orphaned_processing_tasks).
+
+    Wake-up tokens in queue:signal are only hints: a consumer whose token was
+    taken by another still finds the task on its next attempt. The signal
+    holds at most one token; a consumer that takes a task while more are
+    pending leaves a token for the next idle one.
+
+    Args:
+        redis_conn: Redis connection object
+        worker_id: Consumer identity (also used for the processing list name)
+        timeout: Max seconds to block waiting for a task
+
+    Returns:
+        str | None: Task id, or None if nothing arrived within timeout
+    """
+    task_id = _dequeue(redis_conn, worker_id)
+    if not task_id:
+        redis_conn.blpop(REDIS_QUEUE_SIGNAL_KEY, timeout)
+        task_id = _dequeue(redis_conn, worker_id)
+        if not task_id:
+            return None
+    task_id = task_id.strip()
+    renew_lease(redis_conn, task_id, worker_id, initial=True)
+    return task_id
+
+
+def renew_lease(redis_conn, task_id: str, worker_id: str, initial: bool = False) -> bool:
+    """
+    Grant or extend a task lease.
+
+    A renewal only updates a lease that still exists and belongs to
+    worker_id; once the orchestrator has reclaimed a task the old holder
+    cannot silently take it back, nor refresh the lease of the worker that
+    claimed it next.
+
+    Args:
+        redis_conn: Redis connection object
+        task_id: Task identifier
+        worker_id: Lease holder
+        initial: True when granting the lease right after claim_task
+
+    Returns:
+        bool | None: True if the lease is held after the call, False if it
+        was lost, None if Redis could not be reached (state unknown)
+    """
+    now = time.time()
+    expires_at = now + TASK_HEARTBEAT_TIMEOUT_SECONDS
+    try:
+        if initial:
+            info = {
+                "worker_id": worker_id,
+                "heartbeat": datetime.now().isoformat(),
+                "started_at": datetime.now().isoformat(),
+            }
+            pipe = redis_conn.pipeline()
+            pipe.zadd(REDIS_LEASES_KEY, {task_id: expires_at})
+            pipe.hset(REDIS_ACTIVE_TASKS_KEY, task_id, json.dumps(info))
+            pipe.execute()
+            return True
+
+        return bool(redis_conn.eval(
+            _RENEW_SCRIPT, 2, REDIS_LEASES_KEY, REDIS_ACTIVE_TASKS_KEY,
+            task_id, worker_id, expires_at, datetime.now().isoformat(),
+        ))
+    except Exception as e:
+        logger.debug(f"[{task_id[:8]}] Lease renewal failed: {e}")
+        return None
+
+
+def release_task(redis_conn, task_id: str, worker_id: str) -> None:
+    """
+    Drop a task from the worker's processing list and remove its lease.
+
+    Called when the task reached a terminal state (or was skipped). A lease
+    that was reclaimed and granted to another worker is left alone, as is
+    the queue entry of a task that was re-enqueued meanwhile.
+    """
+    try:
+        redis_conn.eval(
+            _RELEASE_SCRIPT, 5,
+            processing_key(worker_id), REDIS_LEASES_KEY, REDIS_ACTIVE_TASKS_KEY,
+            REDIS_QUEUE_META_KEY, REDIS_QUEUED_TASKS_KEY,
+            task_id, worker_id,
+        )
+    except Exception as e:
+        logger.warning(f"[{task_id[:8]}] Failed to release lease: {e}")
+
+
+def holds_lease(redis_conn, task_id: str, worker_id: str) -> bool:
+    """
+    True if the worker still owns the task's lease.
+
+    Used to fence a task's final writes. When Redis cannot be reached the
+    answer is True: the orchestrator cannot reclaim the task either.
+    """
+    try:
+        return bool(redis_conn.eval(_HOLDS_LEASE_SCRIPT, 2, REDIS_LEASES_KEY, REDIS_ACTIVE_TASKS_KEY,
+                                    task_id, worker_id))
+    except Exception as e:
+        logger.debug(f"[{task_id[:8]}] Lease check failed: {e}")
+        return True
+
+
+def expired_leases(redis_conn, now: float = None, limit: int = 100) -> list:
+    """
+    Task ids whose lease expired before `now`.
+
+    Returns:
+        list: Up to `limit` task ids, oldest expiry first
+    """
+    if now is None:
+        now = time.time()
+    return redis_conn.zrangebyscore(REDIS_LEASES_KEY, "-inf", now, start=0, num=limit)
+
+
+def reclaim_task(redis_conn, task_id: str):
+    """
+    Take an expired lease away from its holder.
+
+    ZREM acts as the arbiter: when several reclaimers race for the same task
+    only the one that actually removed the lease gets it back.
+
+    Returns:
+        dict | None: Lease info of the previous holder, or None if the lease
+        was already released or reclaimed elsewhere
+    """
+    if not redis_conn.zrem(REDIS_LEASES_KEY, task_id):
+        return None
+    raw = redis_conn.hget(REDIS_ACTIVE_TASKS_KEY, task_id)
+    try:
+        info = json.loads(raw) if raw else {}
+    except Exception:
+        info = {}
+    pipe = redis_conn.pipeline()
+    pipe.hdel(REDIS_ACTIVE_TASKS_KEY, task_id)
+    if info.get("worker_id"):
+        pipe.lrem(processing_key(info["worker_id"]), 0, task_id)
+    pipe.execute()
+    return info
+
+
+def orphaned_processing_tasks(redis_conn) -> list:
+    """
+    Collect tasks left in processing lists of dead workers without a lease.
+
+    Covers the window between the dequeue and the first lease write. A worker is
+    dead once its heartbeat key has expired. Leased tasks are skipped; lease
+    expiry handles those.
+
+    Returns:
+        list: Task ids removed from dead workers' processing lists
+    """
+    orphaned = []
+    for key in redis_conn.scan_iter(match=f"{REDIS_PROCESSING_PREFIX}*"):
+        worker_id = key[len(REDIS_PROCESSING_PREFIX):]
+        if redis_conn.exists(f"{REDIS_WORKER_HEARTBEAT_PREFIX}{worker_id}"):
+            continue
+        for task_id in redis_conn.lrange(key, 0, -1):
+            if redis_conn.zscore(REDIS_LEASES_KEY, task_id) is not None:
+                continue
+            if redis_conn.lrem(key, 0, task_id):
+                orphaned.append(task_id)
+        if not redis_conn.llen(key):
+            redis_conn.delete(key)
+    return orphaned
+
+
+def touch_worker(redis_conn, worker_id: str, ttl_seconds: int = 120) -> None:
+    """Refresh the worker liveness key used by orphaned_processing_tasks."""
+    redis_conn.setex(f"{REDIS_WORKER_HEARTBEAT_PREFIX}{worker_id}", ttl_seconds, int(time.time()))
+
+
+def set_worker_capacity(redis_conn, worker_id: str, slots: int = None) -> None:
+    """Publish (or with slots=None withdraw) a consumer's current download slots."""
+    try:
+        if slots is None:
+            redis_conn.hdel(REDIS_WORKER_CAPACITY_KEY, worker_id)
+        else:
+            redis_conn.hset(REDIS_WORKER_CAPACITY_KEY, worker_id, slots)
+    except Exception as e:
+        logger.debug(f"Failed to publish capacity of {worker_id}: {e}")
+
+
+def total_capacity(redis_conn):
+    """
+    Download slots across all live consumers.
+
+    Entries of workers without a heartbeat (crashed processes) are ignored
+    and removed.
+
+    Returns:
+        int | None: Sum of slots, or None if Redis is unavailable
+    """
+    try:
+        capacity = redis_conn.hgetall(REDIS_WORKER_CAPACITY_KEY)
+        if not capacity:
+            return 0
+        worker_ids = list(capacity)
+        pipe = redis_conn.pipeline()
+        for worker_id in worker_ids:
+            pipe.exists(f"{REDIS_WORKER_HEARTBEAT_PREFIX}{worker_id}")
+        alive = pipe.execute()
+        dead = [w for w, ok in zip(worker_ids, alive) if not ok]
+        if dead:
+            redis_conn.hdel(REDIS_WORKER_CAPACITY_KEY, *dead)
+        return sum(int(capacity[w]) for w, ok in zip(worker_ids, alive) if ok)
+    except Exception:
+        return None
+
+
+def reset_leases(redis_conn) -> None:
+    """
+    Drop all leases, active markers and processing lists.
+
+    Used by the orchestrator on startup, right before it re-enqueues
+    unfinished tasks from disk.
+    """
+    keys = list(redis_conn.scan_iter(match=f"{REDIS_PROCESSING_PREFIX}*"))
+    redis_conn.delete(REDIS_LEASES_KEY, REDIS_ACTIVE_TASKS_KEY, *keys)
+
+
+def forget_task(redis_conn, task_id: str) -> None:
+    """Remove a task from the pending queue and lease bookkeeping."""
+    try:
+        redis_conn.eval(_REMOVE_SCRIPT, 2, REDIS_QUEUED_TASKS_KEY, REDIS_QUEUE_META_KEY,
+                        task_id, REDIS_QUEUE_PREFIX)
+        pipe = redis_conn.pipeline()
+        pipe.zrem(REDIS_LEASES_KEY, task_id)
+        pipe.hdel(REDIS_ACTIVE_TASKS_KEY, task_id)
+        pipe.execute()
+    except Exception:
+        pass
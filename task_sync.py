@@ -7,17 +7,20 @@ Used by both app.py and orchestrator.py to avoid code duplication.
 
 Architecture:
 - Disk (metadata.json) = source of truth
-- Redis = fast cache with TTL
+- Redis = fast cache with TTL, plus the listing index (task_index.py)
 """
 
 import os
 import json
 import logging
 
+from task_index import index_task
+
 logger = logging.getLogger(__name__)
 
 # Redis configuration
 REDIS_TASK_PREFIX = "task:"
+REDIS_TASK_EVENTS_PREFIX = "task_events:"
 TASK_TTL_MINUTES = int(os.getenv('TASK_TTL_MINUTES', 1440))  # 24 hours default
 
 
@@ -50,6 +53,28 @@ def sync_task_to_redis(redis_conn, task_id: str, metadata: dict, ttl_seconds: in
         return False
 
 
+def publish_task_event(redis_conn, task_id: str, event: str, data: dict) -> None:
+    """
+    Publish a task change on the task_events:<task_id> channel.
+
+    Consumed by the streaming status endpoints (SSE / long-poll) in app.py.
+    Delivery is best-effort: subscribers re-read the task on every event.
+
+    Args:
+        redis_conn: Redis connection object
+        task_id: Task identifier
+        event: Event type ("status" or "progress")
+        data: Event payload (JSON-serializable)
+    """
+    try:
+        redis_conn.publish(
+            f"{REDIS_TASK_EVENTS_PREFIX}{task_id}",
+            json.dumps({"event": event, **data})
+        )
+    except Exception as e:
+        logger.debug(f"[{task_id[:8]}] Event publish failed (non-critical): {e}")
+
+
 def save_metadata_to_disk(task_id: str, metadata: dict, tasks_dir: str = "/app/tasks") -> bool:
     """
     Save metadata.json to disk using atomic write.
@@ -108,6 +133,9 @@ def save_and_sync_metadata(
     Returns:
         bool: True if disk save successful (Redis sync is non-critical)
     """
+    # Monotonic change counter used by long-poll clients (?since=<version>)
+    metadata["version"] = metadata.get("version", 0) + 1
+
     # 1. Save to disk first (source of truth)
     disk_ok = save_metadata_to_disk(task_id, metadata, tasks_dir)
 
@@ -117,6 +145,11 @@ def save_and_sync_metadata(
     # 2. Sync to Redis (optional, non-critical)
     if sync_redis and redis_conn:
         sync_task_to_redis(redis_conn, task_id, metadata, ttl_seconds)
+        index_task(redis_conn, metadata)
+        publish_task_event(redis_conn, task_id, "status", {
+            "status": metadata.get("status"),
+            "version": metadata.get("version", 0),
+        })
 
     return True
 
@@ -126,12 +159,17 @@ def update_webhook_state(
     task_id: str,
     webhook_updates: dict,
     tasks_dir: str = "/app/tasks",
-    ttl_seconds: int = None
+    ttl_seconds: int = None,
+    expected_version: int = None
 ) -> bool:
     """
     Update webhook state in metadata.json and sync to Redis.
 
-    This is a specialized function for webhook updates to avoid reading/writing full metadata.
+    Only the webhook sub-object is merged into a fresh read of metadata.json,
+    so the write never restores an older status. Callers that read the task
+    earlier (the webhook dispatcher, before a POST) pass its version: if the
+    task was saved since, the write is skipped rather than mixing the outcome
+    of an old event into the new state.
 
     Args:
         redis_conn: Redis connection object
@@ -139,9 +177,10 @@ def update_webhook_state(
         webhook_updates: Dictionary with webhook fields to update
         tasks_dir: Base directory for tasks
         ttl_seconds: Redis TTL in seconds
+        expected_version: Task version the updates were computed from
 
     Returns:
-        bool: True if updated successfully
+        bool: True if updated successfully, False if skipped or failed
     """
     try:
         # Read current metadata
@@ -151,14 +190,18 @@ def update_webhook_state(
             logger.warning(f"[{task_id[:8]}] Metadata not found, cannot update webhook state")
             return False
 
+        # Re-read right before the write: merge into the latest metadata
         with open(metadata_path, 'r') as f:
             metadata = json.load(f)
 
-        # Update webhook state
-        if 'webhook' not in metadata:
-            metadata['webhook'] = {}
+        if expected_version is not None and metadata.get('version', 0) != expected_version:
+            logger.debug(
+                f"[{task_id[:8]}] Task changed since version {expected_version}, "
+                f"webhook state not written"
+            )
+            return False
 
-        metadata['webhook'].update(webhook_updates)
+        metadata['webhook'] = {**(metadata.get('webhook') or {}), **webhook_updates}
 
         # Save and sync
         return save_and_sync_metadata(
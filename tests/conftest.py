@@ -0,0 +1,8 @@
+import fakeredis
+import pytest
+
+
+@pytest.fixture
+def redis_conn():
+    """In-memory Redis with Lua scripting (fakeredis + lupa)."""
+    return fakeredis.FakeRedis(decode_responses=True)
@@ -0,0 +1,64 @@
+import os
+import tempfile
+from unittest import mock
+
+import fakeredis
+import pytest
+
+from result_store import REDIS_DEDUP_PREFIX
+
+URL = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+
+
+@pytest.fixture(scope="module")
+def app_module():
+    """The API module in external worker mode, imported against fakeredis."""
+    env = {"DOWNLOAD_WORKER_MODE": "external", "TASKS_DIR": tempfile.mkdtemp(), "API_KEY": ""}
+    with mock.patch.dict(os.environ, env), \
+            mock.patch("redis.from_url", return_value=fakeredis.FakeRedis(decode_responses=True)):
+        import app
+    return app
+
+
+@pytest.fixture
+def api(app_module, redis_conn, tmp_path, monkeypatch):
+    monkeypatch.setattr(app_module, "redis_client", redis_conn)
+    monkeypatch.setattr(app_module, "TASKS_DIR", str(tmp_path))
+    return app_module
+
+
+def _leader(redis_conn):
+    keys = [k for k in redis_conn.keys(f"{REDIS_DEDUP_PREFIX}*") if ":followers:" not in k]
+    return redis_conn.get(keys[0]) if keys else None
+
+
+def _fail_enqueue(*args, **kwargs):
+    raise ConnectionError("redis down")
+
+
+def test_failed_enqueue_releases_dedup_leadership(api, redis_conn, monkeypatch):
+    client = api.app.test_client()
+    with monkeypatch.context() as m:
+        m.setattr(api, "enqueue_task", _fail_enqueue)
+        assert client.post("/download_video", json={"url": URL}).status_code == 500
+    assert _leader(redis_conn) is None
+
+    resp = client.post("/download_video", json={"url": URL})
+    assert resp.status_code == 202
+    assert _leader(redis_conn) == resp.get_json()["task_id"]
+
+
+def test_failed_batch_enqueue_releases_dedup_leadership(api, redis_conn, monkeypatch):
+    client = api.app.test_client()
+    with monkeypatch.context() as m:
+        m.setattr(api, "_enqueue_batch", _fail_enqueue)
+        resp = client.post("/download_videos", json={"items": [{"url": URL}, {"url": URL}]})
+        assert resp.status_code == 500
+    assert _leader(redis_conn) is None
+    # The duplicate item had joined the first one; it must not wait forever
+    followers = [t for t in map(api._load_task, os.listdir(api.TASKS_DIR)) if t and t.get("dedup_of")]
+    assert [t["status"] for t in followers] == ["failed"]
+
+    resp = client.post("/download_video", json={"url": URL})
+    assert resp.status_code == 202
+    assert _leader(redis_conn) == resp.get_json()["task_id"]
@@ -0,0 +1,117 @@
+import json
+
+import pytest
+
+from partial_downloads import (
+    DOWNLOAD_MARKER,
+    METADATA_FILENAME,
+    RESUMED_FLAG,
+    discard_partials,
+    is_partial,
+    prune_for_resume,
+)
+
+
+@pytest.fixture
+def task_dir(tmp_path):
+    (tmp_path / METADATA_FILENAME).write_text("{}")
+    return tmp_path
+
+
+def _write(task_dir, name, content=b"x" * 100):
+    (task_dir / name).write_bytes(content)
+
+
+def _fragment_state(index=3):
+    return json.dumps({"downloader": {"current_fragment": {"index": index}}}).encode()
+
+
+def _files(task_dir):
+    return sorted(p.name for p in task_dir.iterdir())
+
+
+def _metadata(**extra):
+    return {"status": "processing", DOWNLOAD_MARKER: "137+140", **extra}
+
+
+def test_resumable_partials_are_kept(task_dir):
+    _write(task_dir, "Video.f137.mp4.part")
+    _write(task_dir, "Video.f137.mp4.ytdl", _fragment_state())
+    _write(task_dir, "Video.f140.m4a")
+
+    kept, removed = prune_for_resume(str(task_dir), _metadata())
+
+    assert sorted(kept) == ["Video.f137.mp4.part", "Video.f137.mp4.ytdl", "Video.f140.m4a"]
+    assert removed == []
+
+
+def test_in_flight_fragments_and_merge_output_are_dropped(task_dir):
+    _write(task_dir, "Video.f137.mp4.part")
+    _write(task_dir, "Video.f137.mp4.part-Frag4.part")
+    _write(task_dir, "Video.temp.mp4")
+
+    kept, removed = prune_for_resume(str(task_dir), _metadata())
+
+    assert kept == ["Video.f137.mp4.part"]
+    assert sorted(removed) == ["Video.f137.mp4.part-Frag4.part", "Video.temp.mp4"]
+    assert _files(task_dir) == sorted([METADATA_FILENAME, "Video.f137.mp4.part"])
+
+
+def test_part_without_valid_fragment_state_is_dropped(task_dir):
+    _write(task_dir, "Video.f137.mp4.part")
+    _write(task_dir, "Video.f137.mp4.ytdl", b"not json")
+
+    kept, removed = prune_for_resume(str(task_dir), _metadata())
+
+    assert kept == []
+    assert sorted(removed) == ["Video.f137.mp4.part", "Video.f137.mp4.ytdl"]
+
+
+def test_empty_or_oversized_partials_are_dropped(task_dir):
+    _write(task_dir, "Empty.mp4.part", b"")
+    _write(task_dir, "Big.mp4.part", b"x" * 200)
+
+    kept, removed = prune_for_resume(
+        str(task_dir),
+        _metadata(size_estimate_exact=True, protocol="https", estimated_size_bytes=150),
+    )
+
+    assert kept == []
+    assert sorted(removed) == ["Big.mp4.part", "Empty.mp4.part"]
+
+
+@pytest.mark.parametrize("metadata", [
+    _metadata(error="ERROR: moov atom not found"),
+    _metadata(status="failed", **{RESUMED_FLAG: True}),
+    _metadata(streamed=True),
+    {"status": "processing"},  # no download marker: yt-dlp did not write these
+], ids=["integrity-error", "failed-after-resume", "streamed", "no-marker"])
+def test_directory_is_wiped_when_partials_cannot_be_trusted(task_dir, metadata):
+    _write(task_dir, "Video.mp4.part")
+    _write(task_dir, "Video.f140.m4a")
+
+    kept, removed = prune_for_resume(str(task_dir), metadata)
+
+    assert kept == []
+    assert sorted(removed) == ["Video.f140.m4a", "Video.mp4.part"]
+    assert _files(task_dir) == [METADATA_FILENAME]
+
+
+def test_discard_partials_keeps_only_metadata(task_dir):
+    _write(task_dir, "Video.mp4")
+    (task_dir / "sub").mkdir()
+
+    assert sorted(discard_partials(str(task_dir))) == ["Video.mp4", "sub"]
+    assert _files(task_dir) == [METADATA_FILENAME]
+
+
+@pytest.mark.parametrize("name,partial", [
+    ("Video.mp4.part", True),
+    ("Video.mp4.ytdl", True),
+    ("Video.f137.mp4.part-Frag12", True),
+    ("Video.temp.mp4", True),
+    ("Video.mp4", False),
+    ("Video.f137.mp4", False),
+])
+def test_is_partial(name, partial):
+    assert is_partial(name) is partial
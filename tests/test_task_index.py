@@ -0,0 +1,127 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import task_index
+from task_index import (
+    REDIS_DUE_RETRY_KEY,
+    REDIS_INDEX_UPDATED_KEY,
+    index_task,
+    list_task_ids,
+    retry_due_at,
+    unindex_task,
+)
+
+BASE = datetime(2026, 1, 1, 12, 0, 0)
+
+
+def _task(n, status="completed", tags=None, second=None):
+    created = BASE + timedelta(seconds=n if second is None else second)
+    task = {"task_id": f"t{n:02d}", "status": status, "created_at": created.isoformat()}
+    if tags is not None:
+        task["client_meta"] = {"tags": tags}
+    return task
+
+
+def _pages(redis_conn, limit, **filters):
+    pages, cursor = [], None
+    while True:
+        page, cursor = list_task_ids(redis_conn, cursor=cursor, limit=limit, **filters)
+        pages.append([tid for tid, _ in page])
+        if cursor is None:
+            return pages
+
+
+def test_pages_are_newest_first_without_gaps_or_repeats(redis_conn):
+    for n in range(7):
+        index_task(redis_conn, _task(n))
+
+    pages = _pages(redis_conn, limit=3)
+
+    assert pages == [["t06", "t05", "t04"], ["t03", "t02", "t01"], ["t00"]]
+
+
+def test_tasks_created_in_the_same_second_are_paged_by_id(redis_conn):
+    for n in range(5):
+        index_task(redis_conn, _task(n, second=0))
+
+    pages = _pages(redis_conn, limit=2)
+
+    assert [tid for page in pages for tid in page] == ["t04", "t03", "t02", "t01", "t00"]
+
+
+def test_pages_stay_stable_while_tasks_are_added(redis_conn):
+    for n in range(4):
+        index_task(redis_conn, _task(n))
+    first, cursor = list_task_ids(redis_conn, limit=2)
+    index_task(redis_conn, _task(10))
+
+    second, _ = list_task_ids(redis_conn, cursor=cursor, limit=2)
+
+    assert [tid for tid, _ in first] == ["t03", "t02"]
+    assert [tid for tid, _ in second] == ["t01", "t00"]
+
+
+def test_status_and_tag_filters(redis_conn):
+    index_task(redis_conn, _task(0, "failed", tags=["batch-1"]))
+    index_task(redis_conn, _task(1, "completed", tags=["batch-1", "vip"]))
+    index_task(redis_conn, _task(2, "failed"))
+    index_task(redis_conn, _task(3, "failed", tags="batch-1"))
+
+    assert _pages(redis_conn, limit=10, status="failed") == [["t03", "t02", "t00"]]
+    assert _pages(redis_conn, limit=10, tag="batch-1") == [["t03", "t01", "t00"]]
+    assert _pages(redis_conn, limit=1, tag="batch-1", status="failed") == [["t03"], ["t00"], []]
+
+
+def test_created_range(redis_conn):
+    for n in range(5):
+        index_task(redis_conn, _task(n))
+    since = task_index.created_score(_task(1))
+    until = task_index.created_score(_task(3))
+
+    assert _pages(redis_conn, limit=10, since=since, until=until) == [["t03", "t02", "t01"]]
+
+
+def test_status_change_moves_the_task(redis_conn):
+    task = _task(0, "processing", tags=["a"])
+    index_task(redis_conn, task)
+    index_task(redis_conn, {**task, "status": "completed", "client_meta": {"tags": ["b"]}})
+
+    assert _pages(redis_conn, limit=10, status="processing") == [[]]
+    assert _pages(redis_conn, limit=10, status="completed") == [["t00"]]
+    assert _pages(redis_conn, limit=10, tag="a") == [[]]
+    assert _pages(redis_conn, limit=10, tag="b") == [["t00"]]
+
+
+def test_unindex_removes_every_entry(redis_conn):
+    index_task(redis_conn, _task(0, "failed", tags=["a"]))
+
+    unindex_task(redis_conn, "t00")
+
+    assert _pages(redis_conn, limit=10) == [[]]
+    assert _pages(redis_conn, limit=10, tag="a") == [[]]
+    assert redis_conn.zcard(REDIS_INDEX_UPDATED_KEY) == 0
+    assert redis_conn.zcard(REDIS_DUE_RETRY_KEY) == 0
+
+
+def test_malformed_cursor_is_rejected(redis_conn):
+    with pytest.raises(ValueError):
+        list_task_ids(redis_conn, cursor="garbage")
+
+
+def test_failed_tasks_are_due_for_retry_at_their_failure_time():
+    task = {"status": "failed", "failed_at": "2026-01-01T00:00:00"}
+
+    assert retry_due_at(task, now=0) == 1767225600.0
+    assert retry_due_at({**task, "error": {"recoverable": False}}, now=0) is None
+    assert retry_due_at({"status": "completed"}, now=0) is None
+
+
+def test_due_retry_index_follows_the_status(redis_conn):
+    task = _task(0, "failed")
+    task["failed_at"] = "2026-01-01T00:00:00"
+    index_task(redis_conn, task)
+    assert redis_conn.zscore(REDIS_DUE_RETRY_KEY, "t00") == 1767225600.0
+
+    index_task(redis_conn, {**task, "status": "completed"})
+    assert redis_conn.zscore(REDIS_DUE_RETRY_KEY, "t00") is None
@@ -0,0 +1,226 @@
+import json
+import time
+
+import task_queue
+from task_queue import (
+    REDIS_ACTIVE_TASKS_KEY,
+    REDIS_LEASES_KEY,
+    REDIS_QUEUE_META_KEY,
+    claim_task,
+    enqueue_task,
+    expired_leases,
+    holds_lease,
+    orphaned_processing_tasks,
+    processing_key,
+    queue_length,
+    reclaim_task,
+    release_task,
+    renew_lease,
+    touch_worker,
+)
+
+
+def _claim(redis_conn, worker_id):
+    return claim_task(redis_conn, worker_id, timeout=0.01)
+
+
+# -- leases -----------------------------------------------------------------
+
+def test_claim_moves_task_to_processing_list_under_lease(redis_conn):
+    enqueue_task(redis_conn, "t1", task={})
+
+    assert _claim(redis_conn, "w1") == "t1"
+    assert queue_length(redis_conn) == 0
+    assert redis_conn.lrange(processing_key("w1"), 0, -1) == ["t1"]
+    assert redis_conn.zscore(REDIS_LEASES_KEY, "t1") > time.time()
+    assert json.loads(redis_conn.hget(REDIS_ACTIVE_TASKS_KEY, "t1"))["worker_id"] == "w1"
+    assert holds_lease(redis_conn, "t1", "w1")
+    assert not holds_lease(redis_conn, "t1", "w2")
+
+
+def test_claim_on_empty_queue_returns_none(redis_conn, monkeypatch):
+    monkeypatch.setattr(redis_conn, "blpop", lambda *args, **kwargs: None)
+    assert _claim(redis_conn, "w1") is None
+
+
+def test_release_clears_lease_and_queue_meta(redis_conn):
+    enqueue_task(redis_conn, "t1", task={})
+    _claim(redis_conn, "w1")
+
+    release_task(redis_conn, "t1", "w1")
+
+    assert redis_conn.llen(processing_key("w1")) == 0
+    assert redis_conn.zscore(REDIS_LEASES_KEY, "t1") is None
+    assert not redis_conn.hexists(REDIS_ACTIVE_TASKS_KEY, "t1")
+    assert not redis_conn.hexists(REDIS_QUEUE_META_KEY, "t1")
+
+
+def test_expired_lease_is_reclaimed_once(redis_conn):
+    enqueue_task(redis_conn, "t1", task={})
+    _claim(redis_conn, "w1")
+    redis_conn.zadd(REDIS_LEASES_KEY, {"t1": time.time() - 1})
+
+    assert expired_leases(redis_conn) == ["t1"]
+    assert reclaim_task(redis_conn, "t1")["worker_id"] == "w1"
+    assert reclaim_task(redis_conn, "t1") is None
+    assert redis_conn.llen(processing_key("w1")) == 0
+    assert not holds_lease(redis_conn, "t1", "w1")
+
+
+def test_old_holder_cannot_renew_a_reclaimed_lease(redis_conn):
+    enqueue_task(redis_conn, "t1", task={})
+    _claim(redis_conn, "w1")
+    reclaim_task(redis_conn, "t1")
+
+    assert renew_lease(redis_conn, "t1", "w1") is False
+
+
+def test_old_holder_cannot_renew_the_next_owners_lease(redis_conn):
+    enqueue_task(redis_conn, "t1", task={})
+    _claim(redis_conn, "w1")
+    reclaim_task(redis_conn, "t1")
+    enqueue_task(redis_conn, "t1", front=True)
+    assert _claim(redis_conn, "w2") == "t1"
+    expiry = redis_conn.zscore(REDIS_LEASES_KEY, "t1")
+    active = redis_conn.hget(REDIS_ACTIVE_TASKS_KEY, "t1")
+
+    assert renew_lease(redis_conn, "t1", "w1") is False
+    assert redis_conn.zscore(REDIS_LEASES_KEY, "t1") == expiry
+    assert redis_conn.hget(REDIS_ACTIVE_TASKS_KEY, "t1") == active
+    assert renew_lease(redis_conn, "t1", "w2") is True
+    assert holds_lease(redis_conn, "t1", "w2")
+
+
+def test_stale_release_leaves_new_owner_alone(redis_conn):
+    enqueue_task(redis_conn, "t1", task={})
+    _claim(redis_conn, "w1")
+    reclaim_task(redis_conn, "t1")
+    enqueue_task(redis_conn, "t1", front=True)
+    assert _claim(redis_conn, "w2") == "t1"
+
+    release_task(redis_conn, "t1", "w1")
+
+    assert holds_lease(redis_conn, "t1", "w2")
+    assert redis_conn.hexists(REDIS_QUEUE_META_KEY, "t1")
+
+
+def test_stale_release_keeps_requeued_task_pending(redis_conn):
+    enqueue_task(redis_conn, "t1", task={"priority": "high"})
+    _claim(redis_conn, "w1")
+    reclaim_task(redis_conn, "t1")
+    enqueue_task(redis_conn, "t1", front=True)
+
+    release_task(redis_conn, "t1", "w1")
+
+    assert queue_length(redis_conn) == 1
+    assert redis_conn.hget(REDIS_QUEUE_META_KEY, "t1").startswith("high\t")
+
+
+def test_orphaned_tasks_of_dead_workers_are_collected(redis_conn):
+    redis_conn.rpush(processing_key("dead"), "t1", "t2")
+    redis_conn.zadd(REDIS_LEASES_KEY, {"t2": time.time() + 60})
+    redis_conn.rpush(processing_key("alive"), "t3")
+    touch_worker(redis_conn, "alive")
+
+    assert orphaned_processing_tasks(redis_conn) == ["t1"]
+    assert redis_conn.lrange(processing_key("dead"), 0, -1) == ["t2"]
+    assert redis_conn.lrange(processing_key("alive"), 0, -1) == ["t3"]
+
+
+def test_requeue_without_task_reuses_lane_and_tenant(redis_conn):
+    enqueue_task(redis_conn, "t1", task={"priority": "low", "client_meta": {"tenant": "acme"}})
+    _claim(redis_conn, "w1")
+    reclaim_task(redis_conn, "t1")
+
+    enqueue_task(redis_conn, "t1")
+
+    lane, tenant, _ = redis_conn.hget(REDIS_QUEUE_META_KEY, "t1").split("\t")
+    assert (lane, tenant) == ("low", "acme")
+    assert task_queue.queue_position(redis_conn, "t1") == 1
+
+
+# -- scheduling -------------------------------------------------------------
+
+def _task(tenant="default", priority="normal", **extra):
+    return {"priority": priority, "client_meta": {"tenant": tenant}, **extra}
+
+
+def _drain(redis_conn):
+    order = []
+    while True:
+        task_id = task_queue._dequeue(redis_conn, "w")
+        if not task_id:
+            return order
+        order.append(task_id)
+
+
+def test_lanes_are_served_in_priority_order(redis_conn):
+    enqueue_task(redis_conn, "low", task=_task(priority="low"))
+    enqueue_task(redis_conn, "normal", task=_task())
+    enqueue_task(redis_conn, "high", task=_task(priority="high"))
+
+    assert _drain(redis_conn) == ["high", "normal", "low"]
+
+
+def test_tenants_share_a_lane_by_weight(redis_conn, monkeypatch):
+    monkeypatch.setitem(task_queue.TENANT_WEIGHTS, "big", 2.0)
+    for i in range(4):
+        enqueue_task(redis_conn, f"a{i}", task=_task("a"))
+    for i in range(4):
+        enqueue_task(redis_conn, f"big{i}", task=_task("big"))
+
+    assert _drain(redis_conn) == ["a0", "big0", "big1", "a1", "big2", "big3", "a2", "a3"]
+
+
+def test_burst_from_one_tenant_does_not_delay_another(redis_conn):
+    for i in range(10):
+        enqueue_task(redis_conn, f"burst{i}", task=_task("burst"))
+    enqueue_task(redis_conn, "late", task=_task("other"))
+
+    assert _drain(redis_conn).index("late") == 1
+
+
+def test_starving_task_is_taken_first(redis_conn):
+    enqueue_task(redis_conn, "high", task=_task(priority="high"))
+    enqueue_task(redis_conn, "old", task=_task(priority="low"))
+    redis_conn.zadd(task_queue.REDIS_QUEUED_TASKS_KEY,
+                    {"old": time.time() - task_queue.QUEUE_STARVATION_SECONDS - 1})
+
+    assert _drain(redis_conn) == ["old", "high"]
+
+
+def test_sjf_orders_a_tenant_by_estimated_size(redis_conn, monkeypatch):
+    monkeypatch.setattr(task_queue, "QUEUE_POLICY", "sjf")
+    enqueue_task(redis_conn, "large", task=_task(estimated_size_bytes=2000 * 1024 * 1024))
+    enqueue_task(redis_conn, "small", task=_task(estimated_size_bytes=5 * 1024 * 1024))
+
+    assert _drain(redis_conn) == ["small", "large"]
+
+
+def test_queue_positions_follow_the_dequeue_order(redis_conn, monkeypatch):
+    monkeypatch.setitem(task_queue.TENANT_WEIGHTS, "b", 3.0)
+    ids = []
+    for i, (tenant, priority) in enumerate([
+        ("a", "normal"), ("b", "normal"), ("a", "low"), ("c", "high"), ("b", "normal"),
+        ("a", "normal"), ("c", "normal"), ("b", "low"), ("a", "high"), ("b", "normal"),
+    ]):
+        enqueue_task(redis_conn, f"t{i}", task=_task(tenant, priority))
+        ids.append(f"t{i}")
+    ids.remove(task_queue._dequeue(redis_conn, "w"))
+    redis_conn.zadd(task_queue.REDIS_QUEUED_TASKS_KEY, {"t7": 0})  # starving
+
+    positions = task_queue.queue_positions(redis_conn, ids)
+
+    assert sorted(positions.values()) == list(range(1, len(ids) + 1))
+    assert sorted(positions, key=positions.get) == _drain(redis_conn)
+
+
+def test_queue_position_of_unknown_task_is_none(redis_conn):
+    assert task_queue.queue_position(redis_conn, "missing") is None
+
+
+def test_wakeup_signal_stays_bounded(redis_conn):
+    for i in range(20):
+        enqueue_task(redis_conn, f"t{i}", task={})
+
+    assert redis_conn.llen(task_queue.REDIS_QUEUE_SIGNAL_KEY) == 1
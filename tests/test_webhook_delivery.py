@@ -0,0 +1,279 @@
+import json
+import threading
+import time
+
+import pytest
+
+import webhook_delivery
+from task_sync import update_webhook_state
+from webhook_delivery import (
+    BATCH_DELIVERY_PREFIX,
+    REDIS_WEBHOOK_CIRCUIT_KEY,
+    REDIS_WEBHOOK_OUTBOX_KEY,
+    WebhookDispatcher,
+    enqueue_webhook,
+    needs_redelivery,
+    webhook_stats,
+)
+
+URL = "http://hooks.example:8080/done"
+HOST = "hooks.example:8080"
+
+
+@pytest.fixture
+def tasks_dir(tmp_path):
+    return tmp_path
+
+
+@pytest.fixture
+def dispatcher(redis_conn, tasks_dir):
+    """Dispatcher whose POSTs return the queued responses (default: 200)."""
+    d = WebhookDispatcher(redis_conn, str(tasks_dir))
+    d.responses = []
+    d.posted = []
+
+    def post(url, headers, body):
+        d.posted.append(body)
+        status = d.responses.pop(0) if d.responses else 200
+        return status < 400, status, None, 5
+
+    d._post = post
+    return d
+
+
+def _add_task(redis_conn, tasks_dir, task_id, **extra):
+    task = {"task_id": task_id, "status": "completed", "webhook_url": URL, **extra}
+    (tasks_dir / task_id).mkdir()
+    (tasks_dir / task_id / "metadata.json").write_text(json.dumps(task))
+    enqueue_webhook(redis_conn, task)
+    return task
+
+
+def _webhook_state(tasks_dir, task_id):
+    return json.loads((tasks_dir / task_id / "metadata.json").read_text()).get("webhook") or {}
+
+
+def _run_due(dispatcher):
+    """Deliver everything that is due now; returns the number of deliveries run."""
+    runs = 0
+    while True:
+        delivery = dispatcher._claim()
+        if not delivery:
+            return runs
+        if delivery.startswith(BATCH_DELIVERY_PREFIX):
+            dispatcher._deliver_batch(delivery)
+        else:
+            dispatcher._deliver(delivery)
+        runs += 1
+
+
+def _make_due(redis_conn):
+    for delivery in redis_conn.zrange(REDIS_WEBHOOK_OUTBOX_KEY, 0, -1):
+        redis_conn.zadd(REDIS_WEBHOOK_OUTBOX_KEY, {delivery: 0})
+
+
+def _open_circuit_until(redis_conn, until):
+    redis_conn.hset(REDIS_WEBHOOK_CIRCUIT_KEY, f"{HOST}\topen_until", until)
+
+
+# -- outbox -----------------------------------------------------------------
+
+def test_delivered_on_first_attempt(redis_conn, tasks_dir, dispatcher):
+    _add_task(redis_conn, tasks_dir, "t1")
+
+    assert _run_due(dispatcher) == 1
+
+    assert _webhook_state(tasks_dir, "t1")["status"] == "delivered"
+    assert redis_conn.zcard(REDIS_WEBHOOK_OUTBOX_KEY) == 0
+    assert dispatcher.posted == [{"task_id": "t1", "status": "completed", "client_meta": None, "result": None}]
+    assert webhook_stats(redis_conn)["delivered"] == 1
+
+
+def test_enqueue_keeps_the_scheduled_place(redis_conn, tasks_dir):
+    task = _add_task(redis_conn, tasks_dir, "t1")
+    scheduled = redis_conn.zscore(REDIS_WEBHOOK_OUTBOX_KEY, "t1")
+
+    enqueue_webhook(redis_conn, task, delay_seconds=600)
+
+    assert redis_conn.zscore(REDIS_WEBHOOK_OUTBOX_KEY, "t1") == scheduled
+
+
+def test_failure_is_retried_later(redis_conn, tasks_dir, dispatcher):
+    _add_task(redis_conn, tasks_dir, "t1")
+    dispatcher.responses = [503]
+
+    _run_due(dispatcher)
+
+    state = _webhook_state(tasks_dir, "t1")
+    assert (state["status"], state["attempts"], state["last_status"]) == ("retrying", 1, 503)
+    assert redis_conn.zscore(REDIS_WEBHOOK_OUTBOX_KEY, "t1") > time.time()
+    assert _run_due(dispatcher) == 0
+
+    _make_due(redis_conn)
+    _run_due(dispatcher)
+
+    state = _webhook_state(tasks_dir, "t1")
+    assert (state["status"], state["attempts"]) == ("delivered", 2)
+    assert redis_conn.zcard(REDIS_WEBHOOK_OUTBOX_KEY) == 0
+
+
+def test_gives_up_after_max_attempts(redis_conn, tasks_dir, dispatcher, monkeypatch):
+    monkeypatch.setattr(webhook_delivery, "WEBHOOK_MAX_RETRY_ATTEMPTS", 3)
+    monkeypatch.setattr(webhook_delivery, "WEBHOOK_CIRCUIT_FAILURES", 100)
+    _add_task(redis_conn, tasks_dir, "t1")
+    dispatcher.responses = [500, 500, 500]
+
+    for _ in range(3):
+        _run_due(dispatcher)
+        _make_due(redis_conn)
+
+    state = _webhook_state(tasks_dir, "t1")
+    assert (state["status"], state["attempts"]) == ("gave_up", 3)
+    assert redis_conn.zcard(REDIS_WEBHOOK_OUTBOX_KEY) == 0
+    assert webhook_stats(redis_conn)["gave_up"] == 1
+
+
+def test_new_status_starts_with_fresh_attempts(redis_conn, tasks_dir, dispatcher, monkeypatch):
+    monkeypatch.setattr(webhook_delivery, "WEBHOOK_MAX_RETRY_ATTEMPTS", 2)
+    monkeypatch.setattr(webhook_delivery, "WEBHOOK_CIRCUIT_FAILURES", 100)
+    _add_task(redis_conn, tasks_dir, "t1", status="failed")
+    dispatcher.responses = [500, 500]
+    _run_due(dispatcher)
+    _make_due(redis_conn)
+    _run_due(dispatcher)
+    assert _webhook_state(tasks_dir, "t1")["status"] == "gave_up"
+
+    # Retried and completed: the "completed" webhook gets its own attempts
+    task = json.loads((tasks_dir / "t1" / "metadata.json").read_text())
+    task["status"] = "completed"
+    (tasks_dir / "t1" / "metadata.json").write_text(json.dumps(task))
+    assert needs_redelivery(task)
+    enqueue_webhook(redis_conn, task, tasks_dir=str(tasks_dir))
+    state = _webhook_state(tasks_dir, "t1")
+    assert (state["event"], state["status"], state["attempts"]) == ("completed", "pending", 0)
+
+    dispatcher.responses = [500]
+    _run_due(dispatcher)
+    state = _webhook_state(tasks_dir, "t1")
+    assert (state["status"], state["attempts"]) == ("retrying", 1)
+    assert redis_conn.zcard(REDIS_WEBHOOK_OUTBOX_KEY) == 1
+
+
+def test_state_write_is_skipped_once_the_task_moved_on(redis_conn, tasks_dir):
+    _add_task(redis_conn, tasks_dir, "t1", version=2, webhook={"attempts": 1})
+
+    assert not update_webhook_state(redis_conn, "t1", {"attempts": 2}, str(tasks_dir), expected_version=1)
+    assert _webhook_state(tasks_dir, "t1") == {"attempts": 1}
+
+    assert update_webhook_state(redis_conn, "t1", {"status": "retrying"}, str(tasks_dir), expected_version=2)
+    task = json.loads((tasks_dir / "t1" / "metadata.json").read_text())
+    assert (task["status"], task["version"]) == ("completed", 3)
+    assert task["webhook"] == {"attempts": 1, "status": "retrying"}
+
+
+def test_status_change_during_post_is_delivered_next(redis_conn, tasks_dir, dispatcher):
+    _add_task(redis_conn, tasks_dir, "t1", status="failed", version=1)
+    post = dispatcher._post
+
+    def post_while_retried(url, headers, body):
+        # The task is retried and completes while the "failed" POST is in flight
+        task = json.loads((tasks_dir / "t1" / "metadata.json").read_text())
+        task.update(status="completed", version=2)
+        (tasks_dir / "t1" / "metadata.json").write_text(json.dumps(task))
+        dispatcher._post = post
+        return post(url, headers, body)
+
+    dispatcher._post = post_while_retried
+    _run_due(dispatcher)
+
+    assert [b["status"] for b in dispatcher.posted] == ["failed", "completed"]
+    assert _webhook_state(tasks_dir, "t1")["event"] == "completed"
+    assert redis_conn.zcard(REDIS_WEBHOOK_OUTBOX_KEY) == 0
+
+
+def test_batched_events_share_one_post(redis_conn, tasks_dir, dispatcher):
+    _add_task(redis_conn, tasks_dir, "t1", webhook_batch=True)
+    _add_task(redis_conn, tasks_dir, "t2", webhook_batch=True)
+    assert _run_due(dispatcher) == 0  # batch window still open
+
+    _make_due(redis_conn)
+    _run_due(dispatcher)
+
+    assert len(dispatcher.posted) == 1
+    assert [e["task_id"] for e in dispatcher.posted[0]["events"]] == ["t1", "t2"]
+    assert _webhook_state(tasks_dir, "t2")["batch_size"] == 2
+    assert redis_conn.zcard(REDIS_WEBHOOK_OUTBOX_KEY) == 0
+
+
+# -- circuit breaker ----------------------------------------------------------
+
+@pytest.fixture
+def circuit(monkeypatch):
+    monkeypatch.setattr(webhook_delivery, "WEBHOOK_CIRCUIT_FAILURES", 2)
+    monkeypatch.setattr(webhook_delivery, "WEBHOOK_CIRCUIT_OPEN_SECONDS", 60)
+    monkeypatch.setattr(webhook_delivery, "WEBHOOK_CIRCUIT_MAX_OPEN_SECONDS", 100)
+
+
+def test_open_circuit_defers_without_spending_attempts(redis_conn, tasks_dir, dispatcher, circuit):
+    _add_task(redis_conn, tasks_dir, "t1")
+    _add_task(redis_conn, tasks_dir, "t2")
+    dispatcher.responses = [503, 503]
+    _run_due(dispatcher)
+    assert webhook_stats(redis_conn)["open_circuits"] == [HOST]
+
+    _add_task(redis_conn, tasks_dir, "t3")
+    _run_due(dispatcher)
+
+    assert len(dispatcher.posted) == 2
+    assert _webhook_state(tasks_dir, "t3") == {}
+    assert redis_conn.zscore(REDIS_WEBHOOK_OUTBOX_KEY, "t3") >= time.time() + 59
+    assert webhook_stats(redis_conn)["deferred_by_circuit"] == 1
+
+
+def test_half_open_admits_a_single_probe(redis_conn, dispatcher, circuit):
+    for _ in range(2):
+        dispatcher._record(HOST, False, False)
+    _open_circuit_until(redis_conn, time.time() - 1)
+
+    allowed, is_probe, _ = dispatcher._admit(HOST)
+    assert (allowed, is_probe) == (True, True)
+    allowed, _, defer_until = dispatcher._admit(HOST)
+    assert not allowed and defer_until > time.time()
+
+
+def test_failed_probe_reopens_for_longer(redis_conn, dispatcher, circuit, monkeypatch):
+    monkeypatch.setattr(webhook_delivery, "WEBHOOK_CIRCUIT_MAX_OPEN_SECONDS", 200)
+    for _ in range(2):
+        dispatcher._record(HOST, False, False)
+    for expected in (120, 200):  # doubled, then capped
+        _open_circuit_until(redis_conn, time.time() - 1)
+        assert dispatcher._admit(HOST)[1]
+        dispatcher._record(HOST, False, True)
+        open_until = float(redis_conn.hget(REDIS_WEBHOOK_CIRCUIT_KEY, f"{HOST}\topen_until"))
+        assert int(float(redis_conn.hget(REDIS_WEBHOOK_CIRCUIT_KEY, f"{HOST}\topen_seconds"))) == expected
+        assert open_until > time.time() + expected - 5
+
+
+def test_successful_probe_closes_the_circuit(redis_conn, dispatcher, circuit):
+    for _ in range(2):
+        dispatcher._record(HOST, False, False)
+    _open_circuit_until(redis_conn, time.time() - 1)
+    assert dispatcher._admit(HOST)[1]
+
+    dispatcher._record(HOST, True, True)
+
+    assert redis_conn.hgetall(REDIS_WEBHOOK_CIRCUIT_KEY) == {}
+    assert dispatcher._admit(HOST) == (True, False, None)
+
+
+def test_concurrent_failures_are_all_counted(redis_conn, dispatcher, circuit, monkeypatch):
+    opened = []
+    monkeypatch.setattr(webhook_delivery.logger, "warning", opened.append)
+    threads = [threading.Thread(target=dispatcher._record, args=(HOST, False, False)) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert redis_conn.hget(REDIS_WEBHOOK_CIRCUIT_KEY, f"{HOST}\tfailures") == "20"
+    assert len(opened) == 1
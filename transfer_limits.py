@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Transfer Limits Module
+
+Node-wide limits on what running downloads may use, shared by every download
+process on the host through Redis.
+
+Architecture:
+- connections:<node>  = hash task_id -> parallel connections granted to the task
+- A task asks for N connections (concurrent fragment downloads) and gets
+  min(N, budget - connections held by other tasks), but always at least one:
+  the budget bounds extra parallelism, the number of running tasks is bounded
+  by the download slots
+- Grants of tasks that no longer hold a lease (tasks:leases) are dropped while
+  granting, so a crashed worker cannot leak its share of the budget
+
+Bandwidth (DOWNLOAD_BANDWIDTH_LIMIT_MBIT, 0 = unlimited):
+- bandwidth:<node>    = hash task_id -> {"weight", "demand", "rate", "updated_at"}
+- Every running download refreshes its entry every few seconds and computes
+  its own rate from the same data (weighted max-min fair share): tasks that
+  cannot use their share (slow source) keep what they use, the rest is
+  split among the others by priority weight
+- The rate is handed to yt-dlp as "ratelimit", which throttles each transfer
+  with its own token bucket; no central coordinator is needed
+"""
+
+import os
+import json
+import time
+import socket
+import logging
+
+from task_queue import REDIS_LEASES_KEY
+
+logger = logging.getLogger(__name__)
+
+REDIS_CONNECTIONS_PREFIX = "connections:"
+DOWNLOAD_CONNECTION_BUDGET = int(os.getenv('DOWNLOAD_CONNECTION_BUDGET', '32'))
+NODE_ID = os.getenv('NODE_ID') or socket.gethostname()
+
+REDIS_BANDWIDTH_PREFIX = "bandwidth:"
+DOWNLOAD_BANDWIDTH_LIMIT_MBIT = float(os.getenv('DOWNLOAD_BANDWIDTH_LIMIT_MBIT', '0'))
+BANDWIDTH_PRIORITY_WEIGHTS = {"high": 4, "normal": 2, "low": 1}
+# A task using at least this fraction of its rate is considered rate-bound
+_SATURATION_RATIO = 0.9
+# Demand headroom for tasks below their rate, so they can speed up again
+_DEMAND_HEADROOM = 1.25
+
+# Sum live grants, drop stale ones, then grant what is left (min 1)
+_ACQUIRE_CONNECTIONS_SCRIPT = """
+local used = 0
+local entries = redis.call('HGETALL', KEYS[1])
+for i = 1, #entries, 2 do
+    local tid = entries[i]
+    if tid ~= ARGV[1] then
+        if redis.call('ZSCORE', KEYS[2], tid) then
+            used = used + tonumber(entries[i + 1])
+        else
+            redis.call('HDEL', KEYS[1], tid)
+        end
+    end
+end
+local grant = math.min(tonumber(ARGV[2]), math.max(1, tonumber(ARGV[3]) - used))
+redis.call('HSET', KEYS[1], ARGV[1], grant)
+return grant
+"""
+
+
+def connections_key(node_id: str = NODE_ID) -> str:
+    """Redis hash of connection grants on a node."""
+    return f"{REDIS_CONNECTIONS_PREFIX}{node_id}"
+
+
+def acquire_connections(redis_conn, task_id: str, wanted: int) -> int:
+    """
+    Reserve parallel connections for a download.
+
+    Args:
+        redis_conn: Redis connection object
+        task_id: Task identifier (must hold a lease)
+        wanted: Connections the task would like to use
+
+    Returns:
+        int: Connections granted (1 if Redis is unavailable)
+    """
+    wanted = max(1, int(wanted))
+    try:
+        return int(redis_conn.eval(
+            _ACQUIRE_CONNECTIONS_SCRIPT, 2, connections_key(), REDIS_LEASES_KEY,
+            task_id, wanted, DOWNLOAD_CONNECTION_BUDGET,
+        ))
+    except Exception as e:
+        logger.warning(f"[{task_id[:8]}] Connection budget unavailable, using 1: {e}")
+        return 1
+
+
+def release_connections(redis_conn, task_id: str) -> None:
+    """Return a task's connections to the budget."""
+    try:
+        redis_conn.hdel(connections_key(), task_id)
+    except Exception:
+        pass
+
+
+def connections_in_use(redis_conn) -> int:
+    """Connections currently granted on this node (0 if Redis is unavailable)."""
+    try:
+        return sum(int(v) for v in redis_conn.hvals(connections_key()))
+    except Exception:
+        return 0
+
+
+def bandwidth_key(node_id: str = NODE_ID) -> str:
+    """Redis hash of bandwidth shares on a node."""
+    return f"{REDIS_BANDWIDTH_PREFIX}{node_id}"
+
+
+def bandwidth_limit() -> int:
+    """Node download bandwidth in bytes/s (0 = unlimited)."""
+    return int(DOWNLOAD_BANDWIDTH_LIMIT_MBIT * 1_000_000 / 8)
+
+
+def max_min_shares(entries: dict, capacity: float) -> dict:
+    """
+    Weighted max-min fair split of `capacity`.
+
+    Args:
+        entries: task_id -> {"weight": float, "demand": float | None}
+            (None = takes whatever it gets)
+        capacity: Bytes/s to distribute
+
+    Returns:
+        dict: task_id -> bytes/s
+    """
+    shares = {}
+    pending = dict(entries)
+    remaining = float(capacity)
+    while pending:
+        total_weight = sum(max(e.get("weight") or 1, 1e-6) for e in pending.values())
+        capped = {
+            tid: e for tid, e in pending.items()
+            if e.get("demand") is not None
+            and e["demand"] <= remaining * max(e.get("weight") or 1, 1e-6) / total_weight
+        }
+        if not capped:
+            for tid, e in pending.items():
+                shares[tid] = remaining * max(e.get("weight") or 1, 1e-6) / total_weight
+            break
+        for tid, e in capped.items():
+            shares[tid] = e["demand"]
+            remaining -= e["demand"]
+            del pending[tid]
+    return shares
+
+
+def _live_bandwidth_entries(redis_conn) -> dict:
+    """Entries of tasks that still hold a lease; stale ones are removed."""
+    raw = redis_conn.hgetall(bandwidth_key())
+    if not raw:
+        return {}
+    task_ids = list(raw)
+    pipe = redis_conn.pipeline()
+    for tid in task_ids:
+        pipe.zscore(REDIS_LEASES_KEY, tid)
+    leased = pipe.execute()
+    entries = {}
+    stale = []
+    for tid, score in zip(task_ids, leased):
+        if score is None:
+            stale.append(tid)
+            continue
+        try:
+            entries[tid] = json.loads(raw[tid])
+        except ValueError:
+            stale.append(tid)
+    if stale:
+        redis_conn.hdel(bandwidth_key(), *stale)
+    return entries
+
+
+def update_bandwidth_share(redis_conn, task_id: str, weight: float,
+                           speed: float | None, current_rate: float | None):
+    """
+    Publish a download's demand and compute its current bandwidth share.
+
+    Args:
+        redis_conn: Redis connection object
+        task_id: Task identifier (must hold a lease)
+        weight: Priority weight (BANDWIDTH_PRIORITY_WEIGHTS)
+        speed: Measured download speed in bytes/s (None if unknown yet)
+        current_rate: Rate the task is limited to right now (None if unlimited)
+
+    Returns:
+        int | None: Rate limit in bytes/s, or None for unlimited
+    """
+    capacity = bandwidth_limit()
+    if capacity <= 0:
+        return None
+    demand = None
+    if speed and current_rate and speed < current_rate * _SATURATION_RATIO:
+        demand = speed * _DEMAND_HEADROOM
+    entry = {"weight": weight, "demand": demand, "rate": current_rate, "updated_at": time.time()}
+    try:
+        redis_conn.hset(bandwidth_key(), task_id, json.dumps(entry))
+        entries = _live_bandwidth_entries(redis_conn)
+    except Exception as e:
+        logger.debug(f"[{task_id[:8]}] Bandwidth share update failed: {e}")
+        return int(current_rate) if current_rate else capacity
+    entries[task_id] = entry
+    rate = int(max_min_shares(entries, capacity)[task_id])
+    entry["rate"] = rate
+    try:
+        redis_conn.hset(bandwidth_key(), task_id, json.dumps(entry))
+    except Exception:
+        pass
+    return max(rate, 1)
+
+
+def release_bandwidth(redis_conn, task_id: str) -> None:
+    """Drop a finished download from the bandwidth split."""
+    try:
+        redis_conn.hdel(bandwidth_key(), task_id)
+    except Exception:
+        pass
+
+
+def bandwidth_usage(redis_conn) -> dict:
+    """Bandwidth limit and current allocation on this node (for /health)."""
+    usage = {"limit_bytes_per_sec": bandwidth_limit() or None, "allocated_bytes_per_sec": 0, "tasks": 0}
+    try:
+        entries = _live_bandwidth_entries(redis_conn)
+    except Exception:
+        return usage
+    usage["tasks"] = len(entries)
+    usage["allocated_bytes_per_sec"] = int(sum(e.get("rate") or 0 for e in entries.values()))
+    return usage
@@ -0,0 +1,533 @@
+#!/usr/bin/env python3
+"""
+Webhook Delivery Module
+
+Single delivery path for task webhooks: API workers and the orchestrator only
+enqueue, a bounded pool of dispatcher threads delivers.
+
+Architecture:
+- webhooks:outbox  = sorted set delivery -> time the next attempt is due;
+                     entries due now are the outbox, later ones the retry
+                     (delay) schedule. A delivery is a task_id, or
+                     "batch:<destination>" for batched webhooks
+- webhooks:signal  = wake-up list for idle dispatcher threads (trimmed)
+- webhooks:stats   = hash of counters (delivered, failed_attempts, gave_up,
+                     deferred, latency_ms_total)
+- The payload is built from metadata.json at delivery time, so a retry sends
+  the task's current state and nothing but the task id lives in Redis; the
+  attempt count and outcome are written back to metadata["webhook"], tagged
+  with the status ("event") they belong to: a new terminal status (a retried
+  task completing after its failure was reported) starts over at attempt 1
+- A thread claims a due entry with a Lua script that pushes its due time
+  WEBHOOK_LEASE_SECONDS ahead, so several dispatchers (orchestrator, embedded
+  API workers) can run at once and a crashed one only delays the delivery
+- One pooled requests.Session per receiving host (keep-alive, no TLS
+  handshake per webhook)
+- Retries back off exponentially from WEBHOOK_RETRY_DELAY_SECONDS up to
+  WEBHOOK_RETRY_MAX_DELAY_SECONDS; after WEBHOOK_MAX_RETRY_ATTEMPTS attempts
+  the delivery is given up
+
+Circuit breaker (per receiving host, shared by all dispatchers):
+- webhooks:circuit = hash "<host>\t<field>" -> value, fields failures,
+  open_until and open_seconds (failures counted with HINCRBY, the open
+  transition made in one Lua script, so concurrent dispatchers never lose
+  an update)
+- WEBHOOK_CIRCUIT_FAILURES consecutive failures open the circuit for
+  WEBHOOK_CIRCUIT_OPEN_SECONDS; deliveries to the host are pushed back to
+  the reopening time without spending an attempt
+- Once that time has passed the circuit is half-open: a single probe
+  delivery (webhooks:probe:<host> lock) decides; success closes it, failure
+  reopens it for twice as long (up to WEBHOOK_CIRCUIT_MAX_OPEN_SECONDS)
+
+Batched delivery (opt-in per task with webhook_batch):
+- webhooks:batch:<destination> = sorted set task_id -> event time, where the
+  destination is a hash of webhook_url + webhook_headers
+- The first event schedules "batch:<destination>" WEBHOOK_BATCH_WINDOW_SECONDS
+  ahead; events arriving meanwhile join the same POST (up to
+  WEBHOOK_BATCH_MAX_SIZE events: {"batch_size": n, "events": [payload, ...]})
+
+Delivery is at least once: receivers should treat task_id + status as the
+idempotency key.
+"""
+
+import os
+import json
+import time
+import random
+import hashlib
+import logging
+import threading
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from task_sync import update_webhook_state
+
+logger = logging.getLogger(__name__)
+
+REDIS_WEBHOOK_OUTBOX_KEY = "webhooks:outbox"
+REDIS_WEBHOOK_SIGNAL_KEY = "webhooks:signal"
+REDIS_WEBHOOK_STATS_KEY = "webhooks:stats"
+REDIS_WEBHOOK_CIRCUIT_KEY = "webhooks:circuit"
+REDIS_WEBHOOK_PROBE_PREFIX = "webhooks:probe:"
+REDIS_WEBHOOK_BATCH_PREFIX = "webhooks:batch:"
+REDIS_WEBHOOK_BATCH_ATTEMPTS_KEY = "webhooks:batch_attempts"  # hash destination -> failed attempts
+BATCH_DELIVERY_PREFIX = "batch:"
+
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', '8'))
+WEBHOOK_TIMEOUT_SECONDS = float(os.getenv('WEBHOOK_TIMEOUT_SECONDS', '10'))
+WEBHOOK_MAX_RETRY_ATTEMPTS = int(os.getenv('WEBHOOK_MAX_RETRY_ATTEMPTS', '5'))
+WEBHOOK_RETRY_DELAY_SECONDS = int(os.getenv('WEBHOOK_RETRY_DELAY_SECONDS', '60'))
+WEBHOOK_RETRY_MAX_DELAY_SECONDS = int(os.getenv('WEBHOOK_RETRY_MAX_DELAY_SECONDS', '3600'))
+WEBHOOK_LEASE_SECONDS = WEBHOOK_TIMEOUT_SECONDS + 30
+WEBHOOK_CIRCUIT_FAILURES = int(os.getenv('WEBHOOK_CIRCUIT_FAILURES', '5'))
+WEBHOOK_CIRCUIT_OPEN_SECONDS = int(os.getenv('WEBHOOK_CIRCUIT_OPEN_SECONDS', '60'))
+WEBHOOK_CIRCUIT_MAX_OPEN_SECONDS = int(os.getenv('WEBHOOK_CIRCUIT_MAX_OPEN_SECONDS', '900'))
+WEBHOOK_BATCH_WINDOW_SECONDS = float(os.getenv('WEBHOOK_BATCH_WINDOW_SECONDS', '2'))
+WEBHOOK_BATCH_MAX_SIZE = int(os.getenv('WEBHOOK_BATCH_MAX_SIZE', '100'))
+# Idle threads re-check the retry schedule at least this often
+_IDLE_WAIT_SECONDS = 1
+# Deliveries waiting for a half-open probe are retried after this long
+_PROBE_WAIT_SECONDS = 5
+
+# KEYS: outbox / ARGV: now, lease seconds
+_CLAIM_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, 1)
+if #due == 0 then
+    return false
+end
+redis.call('ZADD', KEYS[1], tonumber(ARGV[1]) + tonumber(ARGV[2]), due[1])
+return due[1]
+"""
+
+# KEYS: circuit / ARGV: host, now, failure threshold, open seconds, max open seconds, is probe (0/1)
+# Counts a failure; opens the circuit when the threshold is reached, or
+# reopens it for twice as long after a failed probe. Returns the open seconds
+# when it (re)opened, else 0
+_FAILURE_SCRIPT = """
+local prefix = ARGV[1] .. '\t'
+local failures = redis.call('HINCRBY', KEYS[1], prefix .. 'failures', 1)
+local threshold = tonumber(ARGV[3])
+if failures < threshold or (ARGV[6] ~= '1' and failures > threshold) then
+    return 0
+end
+local open_seconds = tonumber(redis.call('HGET', KEYS[1], prefix .. 'open_seconds') or ARGV[4])
+if ARGV[6] == '1' then
+    open_seconds = math.min(tonumber(ARGV[5]), open_seconds * 2)
+end
+redis.call('HSET', KEYS[1], prefix .. 'open_seconds', open_seconds,
+           prefix .. 'open_until', tonumber(ARGV[2]) + open_seconds)
+return open_seconds
+"""
+
+
+def webhook_payload(task: dict) -> dict:
+    """Body POSTed to a task's webhook_url (one event of a batch)."""
+    payload = {
+        "task_id": task["task_id"],
+        "status": task["status"],
+        "client_meta": task.get("client_meta"),
+    }
+    if task["status"] == "completed":
+        payload["result"] = task.get("result")
+    elif task["status"] == "failed":
+        payload["error"] = task.get("error")
+    return payload
+
+
+def destination_key(task: dict) -> str:
+    """Batch destination of a task: hash of its webhook URL and headers."""
+    raw = json.dumps([task["webhook_url"], task.get("webhook_headers") or {}], sort_keys=True)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def _event_state(task: dict) -> dict:
+    """The task's webhook state if it belongs to the current status, else {}."""
+    state = task.get("webhook") or {}
+    # State written before events were tagged counts as the current one
+    if state.get("event", task.get("status")) != task.get("status"):
+        return {}
+    return state
+
+
+def enqueue_webhook(redis_conn, task: dict, delay_seconds: float = 0, tasks_dir: str = None) -> bool:
+    """
+    Schedule delivery of a task's webhook (no-op without webhook_url).
+
+    A task already in the outbox keeps its place; the payload is read when
+    the delivery runs, so it reflects the latest status anyway.
+
+    Args:
+        redis_conn: Redis connection object
+        task: Task metadata
+        delay_seconds: Earliest delivery, relative to now
+        tasks_dir: Base directory for tasks; when given, webhook state left
+            over from a previous status is reset in metadata.json
+
+    Returns:
+        bool: True if the task is (now) in the outbox
+    """
+    if not task.get("webhook_url"):
+        return False
+    if tasks_dir and task.get("webhook") and not _event_state(task):
+        reset = {"event": task.get("status"), "status": "pending", "attempts": 0, "next_retry": None}
+        task["webhook"].update(reset)
+        update_webhook_state(redis_conn, task["task_id"], reset, tasks_dir,
+                             expected_version=task.get("version"))
+    now = time.time()
+    try:
+        pipe = redis_conn.pipeline(transaction=False)
+        if task.get("webhook_batch"):
+            dest = destination_key(task)
+            pipe.zadd(f"{REDIS_WEBHOOK_BATCH_PREFIX}{dest}", {task["task_id"]: now}, nx=True)
+            pipe.zadd(REDIS_WEBHOOK_OUTBOX_KEY,
+                      {f"{BATCH_DELIVERY_PREFIX}{dest}": now + max(delay_seconds, WEBHOOK_BATCH_WINDOW_SECONDS)},
+                      nx=True)
+        else:
+            pipe.zadd(REDIS_WEBHOOK_OUTBOX_KEY, {task["task_id"]: now + delay_seconds}, nx=True)
+        pipe.rpush(REDIS_WEBHOOK_SIGNAL_KEY, 1)
+        pipe.ltrim(REDIS_WEBHOOK_SIGNAL_KEY, -WEBHOOK_WORKERS, -1)
+        pipe.execute()
+        return True
+    except Exception as e:
+        logger.error(f"[{task['task_id'][:8]}] Failed to enqueue webhook: {e}")
+        return False
+
+
+def needs_redelivery(task: dict) -> bool:
+    """A finished task whose webhook was neither delivered nor given up (e.g. lost with Redis)."""
+    if not task.get("webhook_url") or task.get("status") not in ("completed", "failed"):
+        return False
+    return _event_state(task).get("status") not in ("delivered", "gave_up")
+
+
+def retry_delay(attempts: int) -> float:
+    """Delay before the next attempt after `attempts` failed ones (with jitter)."""
+    delay = min(WEBHOOK_RETRY_MAX_DELAY_SECONDS, WEBHOOK_RETRY_DELAY_SECONDS * 2 ** max(0, attempts - 1))
+    return delay * random.uniform(0.8, 1.2)
+
+
+_CIRCUIT_FIELDS = ("failures", "open_until", "open_seconds")
+
+
+def _circuit_fields(host: str) -> list:
+    return [f"{host}\t{field}" for field in _CIRCUIT_FIELDS]
+
+
+def _load_circuits(redis_conn) -> dict:
+    circuits: dict = {}
+    for name, value in redis_conn.hgetall(REDIS_WEBHOOK_CIRCUIT_KEY).items():
+        host, _, field = name.rpartition("\t")
+        if host and field in _CIRCUIT_FIELDS:
+            try:
+                circuits.setdefault(host, {})[field] = float(value)
+            except ValueError:
+                continue
+    return circuits
+
+
+def webhook_stats(redis_conn) -> dict:
+    """Delivery counters, outbox size and open circuits (for /health)."""
+    try:
+        pipe = redis_conn.pipeline(transaction=False)
+        pipe.hgetall(REDIS_WEBHOOK_STATS_KEY)
+        pipe.zcount(REDIS_WEBHOOK_OUTBOX_KEY, "-inf", time.time())
+        pipe.zcard(REDIS_WEBHOOK_OUTBOX_KEY)
+        raw, due, total = pipe.execute()
+        circuits = _load_circuits(redis_conn)
+    except Exception:
+        return {}
+    now = time.time()
+    delivered = int(raw.get("delivered") or 0)
+    return {
+        "delivered": delivered,
+        "failed_attempts": int(raw.get("failed_attempts") or 0),
+        "gave_up": int(raw.get("gave_up") or 0),
+        "deferred_by_circuit": int(raw.get("deferred") or 0),
+        "pending": due,
+        "scheduled_retries": total - due,
+        "mean_latency_ms": round(int(raw.get("latency_ms_total") or 0) / delivered) if delivered else None,
+        "open_circuits": sorted(
+            host for host, c in circuits.items()
+            if c.get("failures", 0) >= WEBHOOK_CIRCUIT_FAILURES and c.get("open_until", 0) > now
+        ),
+    }
+
+
+class WebhookDispatcher:
+    """
+    Bounded pool of threads delivering webhooks from the outbox.
+
+    Args:
+        redis_conn: Redis connection object
+        tasks_dir: Directory holding <task_id>/metadata.json
+        workers: Number of delivery threads
+    """
+
+    def __init__(self, redis_conn, tasks_dir: str, workers: int = WEBHOOK_WORKERS):
+        self.redis = redis_conn
+        self.tasks_dir = tasks_dir
+        self.workers = max(1, workers)
+        self._stop = threading.Event()
+        self._threads: list = []
+        self._sessions: dict = {}
+        self._sessions_lock = threading.Lock()
+
+    def start(self) -> None:
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"webhook-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 5) -> None:
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    # -- internals ----------------------------------------------------------
+
+    def _session(self, host: str) -> requests.Session:
+        with self._sessions_lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.workers)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._sessions[host] = session
+            return session
+
+    def _claim(self):
+        return self.redis.eval(_CLAIM_SCRIPT, 1, REDIS_WEBHOOK_OUTBOX_KEY, time.time(), WEBHOOK_LEASE_SECONDS)
+
+    def _load_task(self, task_id: str):
+        try:
+            with open(os.path.join(self.tasks_dir, task_id, "metadata.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_state(self, task: dict, updates: dict) -> bool:
+        """
+        Record a delivery outcome on the task version it was built from.
+
+        Returns:
+            bool: False if the task reached a new status during the POST; the
+            outcome is dropped and the new status still has to be delivered
+        """
+        if update_webhook_state(self.redis, task["task_id"], {**updates, "event": task.get("status")},
+                                self.tasks_dir, expected_version=task.get("version")):
+            return True
+        current = self._load_task(task["task_id"])
+        return current is None or current.get("status") == task.get("status")
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                delivery = self._claim()
+                if not delivery:
+                    self.redis.blpop(REDIS_WEBHOOK_SIGNAL_KEY, _IDLE_WAIT_SECONDS)
+                    continue
+                if delivery.startswith(BATCH_DELIVERY_PREFIX):
+                    self._deliver_batch(delivery)
+                else:
+                    self._deliver(delivery)
+            except Exception as e:
+                logger.error(f"Webhook dispatcher error: {e}")
+                self._stop.wait(_IDLE_WAIT_SECONDS)
+
+    # -- circuit breaker ----------------------------------------------------
+
+    def _admit(self, host: str):
+        """
+        Check the host's circuit before a delivery.
+
+        Returns:
+            tuple: (allowed, is_probe, time to defer to when not allowed)
+        """
+        failures, open_until = self.redis.hmget(REDIS_WEBHOOK_CIRCUIT_KEY, _circuit_fields(host)[:2])
+        if int(failures or 0) < WEBHOOK_CIRCUIT_FAILURES:
+            return True, False, None
+        now = time.time()
+        open_until = float(open_until or 0)
+        if open_until > now:
+            return False, False, open_until + random.uniform(0, 2)
+        # Half-open: one probe at a time across all dispatchers
+        if self.redis.set(f"{REDIS_WEBHOOK_PROBE_PREFIX}{host}", 1, nx=True, ex=int(WEBHOOK_LEASE_SECONDS)):
+            return True, True, None
+        return False, False, now + _PROBE_WAIT_SECONDS
+
+    def _record(self, host: str, ok: bool, is_probe: bool) -> None:
+        if ok:
+            if self.redis.hdel(REDIS_WEBHOOK_CIRCUIT_KEY, *_circuit_fields(host)) and is_probe:
+                logger.info(f"Webhook circuit for {host} closed")
+        else:
+            open_seconds = self.redis.eval(
+                _FAILURE_SCRIPT, 1, REDIS_WEBHOOK_CIRCUIT_KEY,
+                host, time.time(), WEBHOOK_CIRCUIT_FAILURES, WEBHOOK_CIRCUIT_OPEN_SECONDS,
+                WEBHOOK_CIRCUIT_MAX_OPEN_SECONDS, 1 if is_probe else 0,
+            )
+            if open_seconds:
+                logger.warning(f"Webhook circuit for {host} open for {open_seconds}s")
+        if is_probe:
+            self.redis.delete(f"{REDIS_WEBHOOK_PROBE_PREFIX}{host}")
+
+    def _defer(self, delivery: str, until: float) -> None:
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.zadd(REDIS_WEBHOOK_OUTBOX_KEY, {delivery: until}, xx=True)
+        pipe.hincrby(REDIS_WEBHOOK_STATS_KEY, "deferred", 1)
+        pipe.execute()
+
+    # -- delivery -----------------------------------------------------------
+
+    def _post(self, url: str, headers: dict, body) -> tuple:
+        """POST through the host's pooled session; returns (ok, status code, error, latency ms)."""
+        all_headers = {"Content-Type": "application/json"}
+        for k, v in (headers or {}).items():
+            if k.lower() != "content-type":
+                all_headers[k] = v
+        started = time.monotonic()
+        status_code, error = None, None
+        try:
+            resp = self._session(urlparse(url).netloc).post(
+                url, json=body, headers=all_headers, timeout=WEBHOOK_TIMEOUT_SECONDS,
+            )
+            status_code = resp.status_code
+            resp.close()
+        except requests.RequestException as e:
+            error = str(e)
+        latency_ms = int((time.monotonic() - started) * 1000)
+        return status_code is not None and status_code < 400, status_code, error, latency_ms
+
+    def _deliver(self, task_id: str) -> None:
+        task = self._load_task(task_id)
+        if task is None or not task.get("webhook_url"):
+            self.redis.zrem(REDIS_WEBHOOK_OUTBOX_KEY, task_id)
+            return
+        url = task["webhook_url"]
+        host = urlparse(url).netloc
+        allowed, is_probe, defer_until = self._admit(host)
+        if not allowed:
+            self._defer(task_id, defer_until)
+            return
+
+        attempt = int(_event_state(task).get("attempts") or 0) + 1
+        ok, status_code, error, latency_ms = self._post(url, task.get("webhook_headers"), webhook_payload(task))
+        self._record(host, ok, is_probe)
+
+        updates = {
+            "attempts": attempt,
+            "last_attempt": datetime.now().isoformat(),
+            "last_status": status_code,
+            "last_error": error,
+        }
+        pipe = self.redis.pipeline(transaction=False)
+        if ok:
+            updates.update({"status": "delivered", "next_retry": None})
+            pipe.zrem(REDIS_WEBHOOK_OUTBOX_KEY, task_id)
+            pipe.hincrby(REDIS_WEBHOOK_STATS_KEY, "delivered", 1)
+            pipe.hincrby(REDIS_WEBHOOK_STATS_KEY, "latency_ms_total", latency_ms)
+            logger.info(f"[{task_id[:8]}] Webhook delivered (attempt {attempt}, {latency_ms} ms)")
+        elif attempt >= WEBHOOK_MAX_RETRY_ATTEMPTS:
+            updates.update({"status": "gave_up", "next_retry": None})
+            pipe.zrem(REDIS_WEBHOOK_OUTBOX_KEY, task_id)
+            pipe.hincrby(REDIS_WEBHOOK_STATS_KEY, "failed_attempts", 1)
+            pipe.hincrby(REDIS_WEBHOOK_STATS_KEY, "gave_up", 1)
+            logger.error(f"[{task_id[:8]}] Webhook failed after {attempt} attempts: {error or f'HTTP {status_code}'}")
+        else:
+            delay = retry_delay(attempt)
+            updates.update({
+                "status": "retrying",
+                "next_retry": (datetime.now() + timedelta(seconds=delay)).isoformat(),
+            })
+            pipe.zadd(REDIS_WEBHOOK_OUTBOX_KEY, {task_id: time.time() + delay}, xx=True)
+            pipe.hincrby(REDIS_WEBHOOK_STATS_KEY, "failed_attempts", 1)
+            logger.warning(
+                f"[{task_id[:8]}] Webhook {error or f'HTTP {status_code}'} "
+                f"(attempt {attempt}), next retry in {delay:.0f}s"
+            )
+        # State first: a crash in between re-sends rather than losing the attempt count
+        if not self._write_state(task, updates):
+            pipe.zadd(REDIS_WEBHOOK_OUTBOX_KEY, {task_id: time.time()})
+        pipe.execute()
+
+    def _deliver_batch(self, delivery: str) -> None:
+        dest = delivery[len(BATCH_DELIVERY_PREFIX):]
+        batch_key = f"{REDIS_WEBHOOK_BATCH_PREFIX}{dest}"
+        tasks = []
+        for task_id in self.redis.zrange(batch_key, 0, WEBHOOK_BATCH_MAX_SIZE - 1):
+            task = self._load_task(task_id)
+            if task is None or not task.get("webhook_url"):
+                self.redis.zrem(batch_key, task_id)
+            else:
+                tasks.append(task)
+        if not tasks:
+            self._finish_batch(delivery, batch_key)
+            return
+        url = tasks[0]["webhook_url"]
+        host = urlparse(url).netloc
+        allowed, is_probe, defer_until = self._admit(host)
+        if not allowed:
+            self._defer(delivery, defer_until)
+            return
+
+        attempt = int(self.redis.hget(REDIS_WEBHOOK_BATCH_ATTEMPTS_KEY, dest) or 0) + 1
+        body = {"batch_size": len(tasks), "events": [webhook_payload(t) for t in tasks]}
+        ok, status_code, error, latency_ms = self._post(url, tasks[0].get("webhook_headers"), body)
+        self._record(host, ok, is_probe)
+
+        updates = {
+            "attempts": attempt,
+            "last_attempt": datetime.now().isoformat(),
+            "last_status": status_code,
+            "last_error": error,
+            "batch_size": len(tasks),
+        }
+        ids = [t["task_id"] for t in tasks]
+        if ok or attempt >= WEBHOOK_MAX_RETRY_ATTEMPTS:
+            updates.update({"status": "delivered" if ok else "gave_up", "next_retry": None})
+            changed = [t["task_id"] for t in tasks if not self._write_state(t, updates)]
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.zrem(batch_key, *ids)
+            if changed:
+                pipe.zadd(batch_key, {task_id: time.time() for task_id in changed})
+            pipe.hdel(REDIS_WEBHOOK_BATCH_ATTEMPTS_KEY, dest)
+            if ok:
+                pipe.hincrby(REDIS_WEBHOOK_STATS_KEY, "delivered", len(ids))
+                pipe.hincrby(REDIS_WEBHOOK_STATS_KEY, "latency_ms_total", latency_ms * len(ids))
+            else:
+                pipe.hincrby(REDIS_WEBHOOK_STATS_KEY, "failed_attempts", 1)
+                pipe.hincrby(REDIS_WEBHOOK_STATS_KEY, "gave_up", len(ids))
+            pipe.execute()
+            if ok:
+                logger.info(f"Webhook batch of {len(ids)} delivered to {host} (attempt {attempt}, {latency_ms} ms)")
+            else:
+                logger.error(f"Webhook batch of {len(ids)} to {host} failed after {attempt} attempts")
+            self._finish_batch(delivery, batch_key)
+            return
+
+        delay = retry_delay(attempt)
+        updates.update({
+            "status": "retrying",
+            "next_retry": (datetime.now() + timedelta(seconds=delay)).isoformat(),
+        })
+        for t in tasks:
+            self._write_state(t, updates)
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hset(REDIS_WEBHOOK_BATCH_ATTEMPTS_KEY, dest, attempt)
+        pipe.zadd(REDIS_WEBHOOK_OUTBOX_KEY, {delivery: time.time() + delay}, xx=True)
+        pipe.hincrby(REDIS_WEBHOOK_STATS_KEY, "failed_attempts", 1)
+        pipe.execute()
+        logger.warning(
+            f"Webhook batch of {len(ids)} to {host}: {error or f'HTTP {status_code}'} "
+            f"(attempt {attempt}), next retry in {delay:.0f}s"
+        )
+
+    def _finish_batch(self, delivery: str, batch_key: str) -> None:
+        """Drop a batch delivery, or schedule the next one if events are left."""
+        self.redis.zrem(REDIS_WEBHOOK_OUTBOX_KEY, delivery)
+        # An event added after the ZREM scheduled its own delivery (ZADD NX)
+        if self.redis.zcard(batch_key):
+            self.redis.zadd(REDIS_WEBHOOK_OUTBOX_KEY, {delivery: time.time()}, nx=True)